@@ -0,0 +1,372 @@
+# Description: Batch analysis of many Xiangqi positions at once with NumPy, for pipelines that score far more
+#              positions than can be set up one XiangqiGame at a time. Positions are given as an (N, 10, 9) array of
+#              the signed piece codes used by XiangqiGame (row 0 is rank 1, column 0 is file a), and every result is
+#              computed with array operations over all of them together: legal move masks, check flags, whether the
+#              team to move has lost, material balance and mobility. The results are the same as XiangqiGame gives
+#              for each position on its own; Chariot and Cannon moves follow the rules of the Piece classes,
+#              including the Cannon treating an adjacent opponent as a jump already taken, and the moves of the
+#              other pieces are read from their Piece classes when first needed.
+#
+#              NumPy is only needed by this module: import it as usual, and the functions raise ImportError if
+#              NumPy is not installed.
+
+from XiangqiGame import (GENERAL, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER, PIECE_VALUES, RED, BLACK,
+                         _PIECE_CLASSES)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# number of boards whose moves are checked for legality together, bounding memory to about 8 KB per board
+DEFAULT_CHUNK_SIZE = 1024
+# piece types whose moves only depend on their source square, their team and at most one blocking square
+_LEAPERS = (GENERAL, ADVISOR, ELEPHANT, HORSE, SOLDIER)
+# (row, column) steps of the Chariot and Cannon directions: up, down, left, right
+_DIRECTIONS = ((1, 0), (-1, 0), (0, -1), (0, 1))
+# index of the opposite of each direction
+_OPPOSITE = (1, 0, 3, 2)
+
+# lookup tables, built by _tables when first needed
+_TABLES = None
+
+
+def require_numpy(module='XiangqiBatch'):
+    """
+    Description:
+    Raises ImportError if NumPy is not installed
+    Parameters:
+    module - name of the module needing NumPy, for the error message
+    """
+    if np is None:
+        raise ImportError(module + ' requires NumPy')
+
+
+def _tables():
+    """
+    Description:
+    Builds the index arrays used to generate moves for many boards at once, the first time they are needed
+    Returns:
+    dict of tables, where square 90 stands for an off-board or missing square that is always empty:
+    leapers - list of (piece code, source squares, destination squares, blocking squares) arrays for each piece type
+    and team of _LEAPERS, where a blocking square of 90 means none
+    attackers - (source squares, blocking squares, piece codes) arrays of shape (2, 90, width), the moves of the
+    pieces of _LEAPERS of red (first index 0) and black (first index 1) onto each square
+    rays - for each direction, list for each distance of (source squares, destination squares) arrays
+    lines - (90, 4, 9) array of the squares in each direction from each square, nearest first
+    adjacent - (91, 4) array of the square next to each square in each direction
+    """
+    global _TABLES
+    if _TABLES is not None:
+        return _TABLES
+    leapers = []
+    for piece_type in _LEAPERS:
+        for side in (RED, BLACK):
+            sources = []
+            dests = []
+            blockers = []
+            for src_sq in range(90):
+                board = [0] * 90
+                board[src_sq] = piece_type * side
+                for dest_sq in _PIECE_CLASSES[piece_type].moves_from(src_sq, board):
+                    # a team member on the blocking square takes the move away, anywhere else it does not. Blocking
+                    # squares (elephant eyes and horse legs) are always next to the piece
+                    blocker = 90
+                    row, col = divmod(src_sq, 9)
+                    for sq in [r * 9 + c for r in range(row - 1, row + 2) for c in range(col - 1, col + 2)
+                               if 0 <= r <= 9 and 0 <= c <= 8]:
+                        if sq != src_sq and sq != dest_sq:
+                            board[sq] = side
+                            if dest_sq not in _PIECE_CLASSES[piece_type].moves_from(src_sq, board):
+                                blocker = sq
+                            board[sq] = 0
+                            if blocker != 90:
+                                break
+                    sources.append(src_sq)
+                    dests.append(dest_sq)
+                    blockers.append(blocker)
+            leapers.append((piece_type * side, np.array(sources), np.array(dests), np.array(blockers)))
+    onto = [[[] for sq in range(90)] for side in (RED, BLACK)]
+    for code, sources, dests, blockers in leapers:
+        for src_sq, dest_sq, blocker in zip(sources, dests, blockers):
+            onto[0 if code > 0 else 1][dest_sq].append((src_sq, blocker, code))
+    width = max(len(el) for side_onto in onto for el in side_onto)
+    # unused slots look for a piece on the always empty square, so never match
+    attackers = np.full((2, 90, width, 3), 90)
+    for i in range(2):
+        for sq in range(90):
+            if onto[i][sq]:
+                attackers[i, sq, :len(onto[i][sq])] = onto[i][sq]
+    attackers = (attackers[:, :, :, 0], attackers[:, :, :, 1], attackers[:, :, :, 2])
+    rays = []
+    for dy, dx in _DIRECTIONS:
+        steps = []
+        for distance in range(1, 10):
+            sources = []
+            dests = []
+            for src_sq in range(90):
+                row = src_sq // 9 + dy * distance
+                col = src_sq % 9 + dx * distance
+                if 0 <= row <= 9 and 0 <= col <= 8:
+                    sources.append(src_sq)
+                    dests.append(row * 9 + col)
+            if sources:
+                steps.append((np.array(sources), np.array(dests)))
+        rays.append(steps)
+    lines = np.full((90, 4, 9), 90)
+    adjacent = np.full((91, 4), 90)
+    for src_sq in range(90):
+        for i in range(4):
+            dy, dx = _DIRECTIONS[i]
+            row, col = divmod(src_sq, 9)
+            distance = 0
+            while 0 <= row + dy <= 9 and 0 <= col + dx <= 8:
+                row += dy
+                col += dx
+                lines[src_sq, i, distance] = row * 9 + col
+                distance += 1
+            adjacent[src_sq, i] = lines[src_sq, i, 0]
+    _TABLES = {'leapers': leapers, 'attackers': attackers, 'rays': rays, 'lines': lines, 'adjacent': adjacent}
+    return _TABLES
+
+
+def _pseudo_moves(flat):
+    """
+    Description:
+    Generates the moves of every piece of many boards, as the Piece classes do, without testing for check
+    Parameters:
+    flat - (K, 90) integer array of signed piece codes
+    Returns:
+    (K, 90, 90) boolean array, True where the piece on the source square (second index) can move to the destination
+    square (third index)
+    """
+    tables = _tables()
+    rays = tables['rays']
+    count = flat.shape[0]
+    moves = np.zeros((count, 90 * 90), dtype=bool)
+    # extra always empty column for moves without a blocking square
+    padded = np.concatenate((flat, np.zeros((count, 1), dtype=flat.dtype)), axis=1)
+    for code, sources, dests, blockers in tables['leapers']:
+        side = 1 if code > 0 else -1
+        found = ((padded[:, sources] == code) & (padded[:, blockers] == 0) & (padded[:, dests] * side <= 0))
+        moves[:, sources * 90 + dests] |= found
+
+    signs = np.sign(flat)
+    chariots = np.abs(flat) == CHARIOT
+    cannons = np.abs(flat) == CANNON
+    # for each direction, whether the square next to each piece holds an opponent, a team member or nothing
+    adjacent_opponent = []
+    adjacent_member = []
+    adjacent_empty = []
+    for steps in rays:
+        sources, dests = steps[0]
+        contents = flat[:, dests] * signs[:, sources]
+        for result, found in ((adjacent_opponent, contents < 0), (adjacent_member, contents > 0),
+                              (adjacent_empty, contents == 0)):
+            el = np.zeros((count, 90), dtype=bool)
+            el[:, sources] = found
+            result.append(el)
+    # an adjacent opponent counts as a Cannon jump already taken in its own direction and every one before it
+    jumped = [None] * 4
+    taken = np.zeros((count, 90), dtype=bool)
+    for i in range(3, -1, -1):
+        taken = taken | adjacent_opponent[i]
+        jumped[i] = taken
+
+    for i in range(4):
+        # pieces passed so far along the direction, starting a Cannon at one if it has already jumped
+        passed = np.zeros((count, 90), dtype=np.int8)
+        cannon_passed = (jumped[i] & adjacent_empty[i]).astype(np.int8)
+        # a team member directly next to a Cannon blocks that direction entirely
+        cannon_open = cannons & ~adjacent_member[i]
+        for sources, dests in rays[i]:
+            contents = flat[:, dests]
+            occupied = contents != 0
+            opponent = contents * signs[:, sources] < 0
+            before = passed[:, sources]
+            cannon_before = before + cannon_passed[:, sources]
+            chariot_move = chariots[:, sources] & (before == 0) & (~occupied | opponent)
+            cannon_move = cannon_open[:, sources] & ((~occupied & (cannon_before <= 1)) |
+                                                     (opponent & (cannon_before == 1)))
+            moves[:, sources * 90 + dests] |= chariot_move | cannon_move
+            passed[:, sources] = before + occupied
+    return moves.reshape(count, 90, 90)
+
+
+def _general_squares(flat, side):
+    """
+    Description:
+    Finds the general of a team on many boards
+    Parameters:
+    flat - (K, 90) integer array of signed piece codes
+    side - RED or BLACK, or (K,) array of them
+    Returns:
+    tuple of ((K,) array of general square indices, (K,) boolean array that is False where there is no general)
+    """
+    generals = flat == GENERAL * np.reshape(side, (-1, 1))
+    return generals.argmax(axis=1), generals.any(axis=1)
+
+
+def _attacked(flat, squares, present, side):
+    """
+    Description:
+    Tests whether an opposing piece can move onto a square of each board, looking outward from the square instead of
+    generating the moves of every piece. Chariots attack along a line up to the first piece. Cannons attack from the
+    second piece, unless a team member next to the Cannon blocks it or, with nothing next to it, it has already
+    jumped; and a Cannon that has already jumped attacks from the first piece like a Chariot
+    Parameters:
+    flat - (K, 90) integer array of signed piece codes
+    squares - (K,) array of square indices
+    present - (K,) boolean array, False where the square is not tested
+    side - RED or BLACK, or (K,) array of them, the team the square belongs to
+    Returns:
+    (K,) boolean array
+    """
+    tables = _tables()
+    count = flat.shape[0]
+    padded = np.concatenate((flat, np.zeros((count, 1), dtype=flat.dtype)), axis=1)
+    rows = np.arange(count)[:, None]
+    opponent = -np.broadcast_to(np.asarray(side), (count,))
+    sources, blockers, codes = tables['attackers']
+    index = (np.where(opponent == RED, 0, 1), squares)
+    attacked = ((padded[rows, sources[index]] == codes[index]) & (padded[rows, blockers[index]] == 0)).any(axis=1)
+
+    # first and second pieces in each direction from the square
+    lines = tables['lines'][squares]
+    contents = padded[rows[:, :, None], lines]
+    occupied = contents != 0
+    passed = occupied.cumsum(axis=2)
+    first = (occupied & (passed == 1)).argmax(axis=2)[:, :, None]
+    second = (occupied & (passed == 2)).argmax(axis=2)[:, :, None]
+    has_first = passed[:, :, -1] >= 1
+    has_second = passed[:, :, -1] >= 2
+    first_code = np.take_along_axis(contents, first, 2)[:, :, 0]
+    second_code = np.take_along_axis(contents, second, 2)[:, :, 0]
+    first = first[:, :, 0]
+    second = second[:, :, 0]
+    opponent = opponent[:, None]
+
+    # whether a Cannon on the first or second piece has already jumped towards the square: an opponent of the
+    # Cannon is next to it in that direction or one checked after it
+    after = np.array([[j >= _OPPOSITE[i] for j in range(4)] for i in range(4)])
+    jumped = []
+    for index in (first, second):
+        cannon_sq = np.take_along_axis(lines, index[:, :, None], 2)[:, :, 0]
+        next_to = padded[rows[:, :, None], tables['adjacent'][cannon_sq]]
+        jumped.append(((next_to * opponent[:, :, None] < 0) & after).any(axis=2))
+
+    chariot = has_first & (first_code == CHARIOT * opponent)
+    cannon_first = has_first & (first_code == CANNON * opponent) & (first >= 1) & jumped[0]
+    screen_next_to = first == second - 1
+    cannon_second = (has_second & (second_code == CANNON * opponent) &
+                     ((screen_next_to & (first_code * opponent < 0)) | (~screen_next_to & ~jumped[1])))
+    attacked |= (chariot | cannon_first | cannon_second).any(axis=1)
+    return present & attacked
+
+
+def boards_from_games(games):
+    """
+    Description:
+    Converts the current positions of XiangqiGame objects to the arrays taken by analyze_boards
+    Parameters:
+    games - sequence of XiangqiGame objects
+    Returns:
+    tuple of ((N, 10, 9) int8 array of signed piece codes, (N,) int8 array of the team to move, RED or BLACK)
+    """
+    require_numpy()
+    boards = np.array([[game.get_piece_code(sq) for sq in range(90)] for game in games], dtype=np.int8)
+    sides = np.array([game.get_side() for game in games], dtype=np.int8)
+    return boards.reshape(-1, 10, 9), sides
+
+
+def analyze_boards(boards, sides=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Description:
+    Analyzes many positions at once, giving for each the same results as a XiangqiGame in that position
+    Parameters:
+    boards - (N, 10, 9) integer array of signed piece codes, row 0 being rank 1 and column 0 file a
+    sides - (N,) array of the team to move in each position, RED (1) or BLACK (-1), defaults to red in all of them
+    chunk_size - number of positions whose moves are checked for legality together
+    Returns:
+    dict of arrays:
+    legal - (N, 90, 90) boolean, True where the team to move can legally move from the square of the second index to
+    the square of the third index (square index row * 9 + col), as XiangqiGame.legal_moves_sq
+    legal_count - (N,) int32, number of legal moves
+    in_check - (N, 2) boolean, whether the red and black generals are in check, as XiangqiGame.is_in_check
+    lost - (N,) boolean, whether the team to move has lost, as XiangqiGame.is_lost
+    material - (N,) int32, material balance from red's point of view, as the material term of
+    XiangqiGame.evaluate_terms
+    mobility - (N, 2) int32, number of moves of the red and black pieces by the rules of their Piece classes,
+    without testing for check
+    """
+    require_numpy()
+    boards = np.asarray(boards)
+    if boards.ndim != 3 or boards.shape[1:] != (10, 9):
+        raise ValueError('boards must have shape (N, 10, 9)')
+    count = boards.shape[0]
+    flat = boards.reshape(count, 90).astype(np.int16)
+    if sides is None:
+        sides = np.full(count, RED, dtype=np.int16)
+    else:
+        sides = np.asarray(sides, dtype=np.int16).reshape(count)
+    values = np.array([PIECE_VALUES[abs(code)] * (1 if code > 0 else -1) for code in range(-7, 8)], dtype=np.int32)
+
+    result = {'legal': np.zeros((count, 90, 90), dtype=bool), 'legal_count': np.zeros(count, dtype=np.int32),
+              'in_check': np.zeros((count, 2), dtype=bool), 'lost': np.zeros(count, dtype=bool),
+              'material': values[flat + 7].sum(axis=1).astype(np.int32),
+              'mobility': np.zeros((count, 2), dtype=np.int32)}
+    for start in range(0, count, chunk_size):
+        stop = min(start + chunk_size, count)
+        chunk = flat[start:stop]
+        chunk_sides = sides[start:stop]
+        moves = _pseudo_moves(chunk)
+        moves_per_square = moves.sum(axis=2)
+        for column, side in ((0, RED), (1, BLACK)):
+            result['mobility'][start:stop, column] = (moves_per_square * (chunk * side > 0)).sum(axis=1)
+            squares, present = _general_squares(chunk, side)
+            result['in_check'][start:stop, column] = _attacked(chunk, squares, present, side)
+        result['legal'][start:stop] = _legal_moves(chunk, chunk_sides, moves, chunk_size)
+
+    legal = result['legal']
+    result['legal_count'] = legal.sum(axis=(1, 2)).astype(np.int32)
+    # the team to move has lost with no legal moves, or in check without a legal move of its general
+    squares, present = _general_squares(flat, sides)
+    in_check = np.where(sides == RED, result['in_check'][:, 0], result['in_check'][:, 1])
+    general_moves = present & legal[np.arange(count), squares, :].any(axis=1)
+    result['lost'] = (result['legal_count'] == 0) | (in_check & ~general_moves)
+    return result
+
+
+def _legal_moves(flat, sides, moves, chunk_size):
+    """
+    Description:
+    Keeps the moves of the team to move that do not leave its general attacked, by making each move on a copy of
+    its board and testing the general's square of all the copies together
+    Parameters:
+    flat - (K, 90) integer array of signed piece codes
+    sides - (K,) array of the team to move
+    moves - (K, 90, 90) boolean array from _pseudo_moves
+    chunk_size - number of copies tested together
+    Returns:
+    (K, 90, 90) boolean array of legal moves
+    """
+    own = flat * sides.reshape(-1, 1) > 0
+    boards, srcs, dests = np.nonzero(moves & own[:, :, None])
+    legal = np.zeros(moves.shape, dtype=bool)
+    general_sqs, present = _general_squares(flat, sides)
+    for start in range(0, len(boards), chunk_size):
+        index = slice(start, start + chunk_size)
+        board = boards[index]
+        src = srcs[index]
+        dest = dests[index]
+        rows = np.arange(len(board))
+        after = flat[board]
+        codes = after[rows, src]
+        after[rows, dest] = codes
+        after[rows, src] = 0
+        # a general that moves is tested on its destination
+        general_moved = np.abs(codes) == GENERAL
+        squares = np.where(general_moved, dest, general_sqs[board])
+        safe = ~_attacked(after, squares, present[board] | general_moved, sides[board])
+        legal[board[safe], src[safe], dest[safe]] = True
+    return legal
@@ -0,0 +1,220 @@
+# Description: Throughput benchmark of the public XiangqiGame API. Each scenario times XiangqiGame.make_move on a
+#              fixed set of moves and reports moves per second, per-move latency percentiles and peak memory:
+#
+#              corpus - replays every game of the bundled corpus from the starting position
+#              check - makes every legal move, one at a time, from each corpus position where the team to move is in
+#              check, where make_move tests the most moves for check
+#              late_game - makes every legal move, one at a time, from each corpus position with at most
+#              LATE_GAME_PIECES pieces, where make_move's test for a lost opponent looks at every reply
+#
+#              The corpus, BENCHMARK_CORPUS, is a file of game records in the format read by XiangqiBook.read_games,
+#              played by generate_corpus with a fixed seed so every run replays the same games. Latencies are timed
+#              in one pass and peak memory, measured with tracemalloc, in another, so the tracing does not slow the
+#              timed pass. Results can be written as JSON to compare runs over time.
+#
+#              Run as a script: python XiangqiBenchmark.py [--scenario NAME] [--output FILE] [--generate-corpus]
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+
+from XiangqiBook import read_games
+from XiangqiGame import XiangqiGame, TranspositionTable, PIECE_VALUES, SQUARE_NAMES
+from XiangqiProfile import percentile
+
+BENCHMARK_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_games.txt')
+# games generate_corpus plays by default, and most moves of each
+CORPUS_GAMES = 40
+CORPUS_MAX_MOVES = 300
+# most pieces on the board in a late_game position
+LATE_GAME_PIECES = 10
+SCENARIOS = ('corpus', 'check', 'late_game')
+
+
+def generate_corpus(path=BENCHMARK_CORPUS, games=CORPUS_GAMES, seed=20200303):
+    """
+    Description:
+    Plays games with a fixed seed and writes them as game records. Each team captures the most valuable piece it
+    can most of the time and otherwise plays a random legal move, which gives full-length games with exchanges,
+    checks and endgames
+    Parameters:
+    path - path of the file to write
+    games - number of games
+    seed - seed of the move choices
+    """
+    rng = random.Random(seed)
+    results = {'RED_WON': '1-0', 'BLACK_WON': '0-1', 'DRAW': '1/2-1/2', 'UNFINISHED': '*'}
+    with open(path, 'w') as corpus_file:
+        corpus_file.write('# XiangqiBenchmark corpus, written by generate_corpus with seed %d\n' % seed)
+        for i in range(games):
+            game = XiangqiGame()
+            game.set_max_moves(CORPUS_MAX_MOVES)
+            moves = []
+            while game.get_game_state() == 'UNFINISHED':
+                legal = game.legal_moves_sq()
+                captures = [el for el in legal if game.get_piece_code(el[1]) != 0]
+                if captures and rng.random() < 0.8:
+                    move = max(captures, key=lambda el: PIECE_VALUES[abs(game.get_piece_code(el[1]))])
+                else:
+                    move = rng.choice(legal)
+                game.make_move_sq(move[0], move[1])
+                moves.append(SQUARE_NAMES[move[0]] + SQUARE_NAMES[move[1]])
+            corpus_file.write(' '.join(moves) + ' ' + results[game.get_game_state()] + '\n')
+
+
+def load_corpus(path=BENCHMARK_CORPUS):
+    """
+    Description:
+    Reads the games of a corpus file
+    Returns:
+    list of lists of (src, dest) tuples of algebraic notation strings
+    """
+    with open(path) as corpus_file:
+        return [moves for moves, winner in read_games(corpus_file)]
+
+
+def scenario_tasks(name, corpus):
+    """
+    Description:
+    Builds the moves a scenario times
+    Parameters:
+    name - scenario name from SCENARIOS
+    corpus - list of games from load_corpus
+    Returns:
+    list of (FEN string of the position to start from, list of (src, dest) moves, True if the moves are played one
+    after another or False if each is made from the starting position and taken back)
+    Raises:
+    ValueError if name is not a scenario
+    """
+    if name not in SCENARIOS:
+        raise ValueError('unknown scenario: ' + repr(name))
+    tasks = []
+    for moves in corpus:
+        game = XiangqiGame()
+        game.set_rejected_move_hook(None)
+        if name == 'corpus':
+            tasks.append((game.to_fen(), moves, True))
+            continue
+        for src, dest in moves:
+            if name == 'check':
+                selected = game.is_in_check(game.get_current_team())
+            else:
+                selected = sum(1 for sq in range(90) if game.get_piece_code(sq) != 0) <= LATE_GAME_PIECES
+            if selected:
+                tasks.append((game.to_fen(), game.legal_moves(), False))
+            if game.make_move(src, dest) is False:
+                break
+    return tasks
+
+
+def _replay(tasks, latencies=None):
+    """
+    Description:
+    Makes the moves of a scenario's tasks with make_move, memoizing results in a new TranspositionTable so nothing
+    is reused from building the tasks or from another pass
+    Parameters:
+    tasks - list from scenario_tasks
+    latencies - list to append the seconds taken by each make_move call to, or None
+    Returns:
+    number of make_move calls
+    """
+    clock = time.perf_counter
+    count = 0
+    table = TranspositionTable()
+    for fen, moves, in_sequence in tasks:
+        game = XiangqiGame.from_fen(fen, table)
+        game.set_rejected_move_hook(None)
+        for src, dest in moves:
+            start = clock()
+            game.make_move(src, dest)
+            if latencies is not None:
+                latencies.append(clock() - start)
+            count += 1
+            if not in_sequence:
+                game.undo_move()
+    return count
+
+
+def run_scenario(name, corpus=None):
+    """
+    Description:
+    Runs one scenario
+    Parameters:
+    name - scenario name from SCENARIOS
+    corpus - list of games from load_corpus, defaults to the bundled corpus
+    Returns:
+    dict with scenario, positions, moves, seconds (in make_move), moves_per_second, p50_us, p90_us, p99_us, max_us
+    and peak_memory_bytes
+    """
+    if corpus is None:
+        corpus = load_corpus()
+    tasks = scenario_tasks(name, corpus)
+    latencies = []
+    _replay(tasks, latencies)
+    tracemalloc.start()
+    try:
+        _replay(tasks)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    seconds = sum(latencies)
+    latencies.sort()
+    return {'scenario': name, 'positions': len(tasks), 'moves': len(latencies), 'seconds': seconds,
+            'moves_per_second': len(latencies) / seconds if seconds > 0 else 0.0,
+            'p50_us': percentile(latencies, 0.5) * 1e6, 'p90_us': percentile(latencies, 0.9) * 1e6,
+            'p99_us': percentile(latencies, 0.99) * 1e6, 'max_us': latencies[-1] * 1e6 if latencies else 0.0,
+            'peak_memory_bytes': peak}
+
+
+def run_benchmark(scenarios=SCENARIOS, corpus_path=BENCHMARK_CORPUS, report=print):
+    """
+    Description:
+    Runs scenarios on a corpus
+    Parameters:
+    scenarios - names of the scenarios to run
+    corpus_path - path of the corpus file
+    report - function called with one line of text per scenario, or None for no output
+    Returns:
+    dict with python, platform, date, corpus (path) and results (list of run_scenario results)
+    """
+    corpus = load_corpus(corpus_path)
+    results = []
+    for name in scenarios:
+        result = run_scenario(name, corpus)
+        results.append(result)
+        if report is not None:
+            report('%-10s moves %7d moves/sec %9.0f p50 %7.1f us p90 %7.1f us p99 %8.1f us peak memory %8d bytes' % (
+                name, result['moves'], result['moves_per_second'], result['p50_us'], result['p90_us'],
+                result['p99_us'], result['peak_memory_bytes']))
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'), 'corpus': corpus_path, 'results': results}
+
+
+def main():
+    """
+    Description:
+    Command line entry point, runs the benchmark and optionally writes its results as JSON
+    """
+    parser = argparse.ArgumentParser(description='Benchmark XiangqiGame.make_move on a corpus of games')
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append',
+                        help='scenario to run, may be repeated (default: all)')
+    parser.add_argument('--corpus', default=BENCHMARK_CORPUS, help='corpus file (default: bundled corpus)')
+    parser.add_argument('--output', default=None, help='file to write the results to as JSON')
+    parser.add_argument('--generate-corpus', action='store_true', help='write the corpus file again and exit')
+    args = parser.parse_args()
+    if args.generate_corpus:
+        generate_corpus(args.corpus)
+        return
+    results = run_benchmark(args.scenario or SCENARIOS, args.corpus)
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
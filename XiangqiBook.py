@@ -0,0 +1,338 @@
+# Description: Opening book for XiangqiGame. build_book replays a corpus of game records and writes every (position,
+#              move) pair seen in their opening moves to a binary file, sorted by the Zobrist key of the position, with
+#              a weight from how often the move was played and how the games that played it ended. OpeningBook
+#              memory-maps such a file and finds the moves of a position by binary search over it, so opening a book
+#              reads nothing but its header and each probe reads a few pages, however large the file is. build_book
+#              adds up weights in memory for a bounded number of pairs at a time, writes each batch sorted to a
+#              temporary file and merges the files into the book, so memory stays bounded however large the corpus is.
+#
+#              File format: a 16-byte header of the magic bytes BOOK_MAGIC and the number of entries as a
+#              little-endian unsigned 64-bit integer, followed by 12-byte entries of key (unsigned 64-bit), move
+#              (unsigned 16-bit, src_sq * 90 + dest_sq) and weight (unsigned 16-bit), sorted by key and then move.
+#
+#              Game records are read one game per line, as moves in algebraic notation such as h3e3 or h3-e3,
+#              optionally ending in a result of 1-0 (red won), 0-1 (black won), 1/2-1/2 or *. Each line is read with
+#              XiangqiRecords.read_records, so moves may be numbered and comments are ignored as it describes.
+#
+#              Run as a script: python XiangqiBook.py build GAMES BOOK [--plies N], or
+#              python XiangqiBook.py probe BOOK [--fen FEN]
+
+import argparse
+import heapq
+import mmap
+import struct
+import tempfile
+import time
+
+from XiangqiGame import XiangqiGame, SQUARE_NAMES, square_index, RED, BLACK
+from XiangqiRecords import read_records, parse_move
+
+BOOK_MAGIC = b'XQBOOK\x00\x01'
+_HEADER = struct.Struct('<8sQ')
+_ENTRY = struct.Struct('<QHH')
+_KEY = struct.Struct('<Q')
+# entry of a sorted run written while building a book, with room for weights added up over many games
+_RUN_ENTRY = struct.Struct('<QHI')
+# entries read from a run at a time while merging
+_RUN_READ_ENTRIES = 1 << 14
+# number of moves from the start of each game added to a book by default
+DEFAULT_PLIES = 30
+# distinct (position, move) pairs build_book adds up in memory before writing them to a temporary file, about 120 MB
+# with the sorted copy written out
+DEFAULT_RUN_SIZE = 1 << 19
+# weight a move gets from a game its team won, drew, lost or whose result is unknown
+_RESULT_WEIGHTS = {'win': 2, 'draw': 1, 'loss': 0, None: 1}
+# team that won for each result token, 0 for a draw
+_RESULTS = {'1-0': RED, '0-1': BLACK, '1/2-1/2': 0, '*': None, None: None}
+
+
+def read_games(lines):
+    """
+    Description:
+    Reads game records in the format described at the top of this module, each line as a record of its own read by
+    XiangqiRecords.read_records
+    Parameters:
+    lines - iterable of lines of text, such as an open file
+    Returns:
+    generator of (list of (src, dest) tuples of algebraic notation strings, winning team RED or BLACK, 0 for a draw,
+    or None if unknown) for each line with moves
+    Raises:
+    ValueError if a line holds something that is not a move or a result
+    """
+    for number, line in enumerate(lines, 1):
+        for record in read_records((line,)):
+            if not record['moves']:
+                continue
+            moves = []
+            for token in record['moves']:
+                move = parse_move(None, token, 'algebraic')
+                if move is None:
+                    raise ValueError('line ' + str(number) + ': not a move: ' + repr(token))
+                moves.append((SQUARE_NAMES[move[0]], SQUARE_NAMES[move[1]]))
+            yield moves, _RESULTS[record['result']]
+
+
+def _read_run(run_file):
+    """
+    Description:
+    Reads back a sorted run written by build_book
+    Parameters:
+    run_file - file object of the run, positioned at its start
+    Returns:
+    generator of ((key, move), weight) tuples, in the order they were written
+    """
+    while True:
+        data = run_file.read(_RUN_ENTRY.size * _RUN_READ_ENTRIES)
+        if not data:
+            return
+        for key, move, weight in _RUN_ENTRY.iter_unpack(data):
+            yield (key, move), weight
+
+
+def build_book(games, path, plies=DEFAULT_PLIES, run_size=DEFAULT_RUN_SIZE):
+    """
+    Description:
+    Replays games from the starting position and writes the moves played in their first plies moves to a book file.
+    A game is replayed up to its first illegal move. Weights are added up in memory for at most run_size distinct
+    (position, move) pairs at a time; each full batch is sorted and written to a temporary file, and the files are
+    merged into the book, so memory stays bounded however many games are read
+    Parameters:
+    games - iterable of (moves, winner) tuples in the format returned by read_games
+    path - path of the book file to write
+    plies - number of moves from the start of each game to add
+    run_size - number of distinct (position, move) pairs held in memory before they are written to a temporary file
+    Returns:
+    dict with games, positions (distinct positions in the book), entries, runs (temporary files written), seconds
+    and games_per_second
+    """
+    start = time.perf_counter()
+    weights = {}
+    runs = []
+    game = XiangqiGame()
+    count = 0
+    try:
+        for moves, winner in games:
+            count += 1
+            game.reset()
+            for src, dest in moves[:plies]:
+                if game.get_game_state() != 'UNFINISHED' or dest not in game.legal_moves_from(src):
+                    break
+                side = game.get_side()
+                if winner is None:
+                    weight = _RESULT_WEIGHTS[None]
+                elif winner == 0:
+                    weight = _RESULT_WEIGHTS['draw']
+                else:
+                    weight = _RESULT_WEIGHTS['win' if winner == side else 'loss']
+                entry = (game.get_position_key(), square_index(src) * 90 + square_index(dest))
+                weights[entry] = weights.get(entry, 0) + weight
+                game.make_move(src, dest)
+            if len(weights) >= run_size:
+                run_file = tempfile.TemporaryFile()
+                runs.append(run_file)
+                _write_entries(run_file, sorted(weights.items()), _RUN_ENTRY, 0xFFFFFFFF)
+                run_file.seek(0)
+                weights = {}
+        # the last batch is merged from memory
+        merged = heapq.merge(*[_read_run(el) for el in runs], sorted(weights.items()))
+        with open(path, 'wb') as book_file:
+            # the number of entries is only known once the runs are merged
+            book_file.write(_HEADER.pack(BOOK_MAGIC, 0))
+            entries, positions = _write_entries(book_file, _combine(merged), _ENTRY, 0xFFFF)
+            book_file.seek(0)
+            book_file.write(_HEADER.pack(BOOK_MAGIC, entries))
+    finally:
+        for el in runs:
+            el.close()
+    seconds = time.perf_counter() - start
+    return {'games': count, 'positions': positions, 'entries': entries, 'runs': len(runs), 'seconds': seconds,
+            'games_per_second': count / seconds if seconds > 0 else 0.0}
+
+
+def _combine(entries):
+    """
+    Description:
+    Adds up the weights of equal (key, move) pairs that follow each other, as they do in merged runs
+    Parameters:
+    entries - iterable of ((key, move), weight) tuples sorted by key and move
+    Returns:
+    generator of ((key, move), weight) tuples with distinct (key, move) pairs and positive weights
+    """
+    last = None
+    total = 0
+    for pair, weight in entries:
+        if pair != last:
+            if total > 0:
+                yield last, total
+            last = pair
+            total = 0
+        total += weight
+    if total > 0:
+        yield last, total
+
+
+def _write_entries(output, entries, entry_struct, max_weight):
+    """
+    Description:
+    Writes entries to a file in large buffers
+    Parameters:
+    output - binary file object to write to
+    entries - iterable of ((key, move), weight) tuples
+    entry_struct - struct.Struct of key, move and weight to pack each entry with
+    max_weight - largest weight entry_struct can hold, larger weights are written as it
+    Returns:
+    tuple of (number of entries, number of distinct keys) written
+    """
+    count = 0
+    positions = 0
+    last_key = None
+    buffer = bytearray()
+    for (key, move), weight in entries:
+        buffer += entry_struct.pack(key, move, min(weight, max_weight))
+        count += 1
+        if key != last_key:
+            positions += 1
+            last_key = key
+        if len(buffer) >= 1 << 20:
+            output.write(buffer)
+            buffer = bytearray()
+    output.write(buffer)
+    return count, positions
+
+
+class OpeningBook:
+    """Represents an opening book file, memory-mapped and probed by position Zobrist key"""
+    def __init__(self, path):
+        """
+        Initializes OpeningBook object by memory-mapping the book file at path. Raises ValueError if the file is not
+        a book
+        """
+        with open(path, 'rb') as book_file:
+            header = book_file.read(_HEADER.size)
+            if len(header) < _HEADER.size or header[:8] != BOOK_MAGIC:
+                raise ValueError('not an opening book: ' + repr(path))
+            self._count = _HEADER.unpack(header)[1]
+            if self._count == 0:
+                self._map = b''
+                return
+            self._map = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size + self._count * _ENTRY.size:
+            self._map.close()
+            raise ValueError('opening book is truncated: ' + repr(path))
+
+    def __len__(self):
+        """
+        Description:
+        Method returns number of entries in the book
+        """
+        return self._count
+
+    def __enter__(self):
+        """
+        Description:
+        Method returns the book, to be closed at the end of a with statement
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        Description:
+        Method closes the book at the end of a with statement
+        """
+        self.close()
+
+    def close(self):
+        """
+        Description:
+        Method unmaps the book file, after which it can no longer be probed
+        """
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+    def probe(self, key):
+        """
+        Description:
+        Method finds the book moves of a position
+        Parameters:
+        key - Zobrist key of position, as returned by XiangqiGame.get_position_key
+        Returns:
+        list of ((src_sq, dest_sq), weight) tuples, empty if the position is not in the book
+        """
+        book_map = self._map
+        unpack_key = _KEY.unpack_from
+        # first entry whose key is not less than key
+        low = 0
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            if unpack_key(book_map, _HEADER.size + middle * _ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        result = []
+        for i in range(low, self._count):
+            entry_key, move, weight = _ENTRY.unpack_from(book_map, _HEADER.size + i * _ENTRY.size)
+            if entry_key != key:
+                break
+            result.append((divmod(move, 90), weight))
+        return result
+
+    def choose(self, game, rng=None):
+        """
+        Description:
+        Method picks a book move for the current position of a game. Moves that are not legal in the game, as can
+        happen when two positions share a key, are left out
+        Parameters:
+        game - XiangqiGame object
+        rng - random.Random object to pick a move at random in proportion to its weight, or None to pick the move
+        with the largest weight
+        Returns:
+        (src, dest) tuple of algebraic notation strings, or None if the position has no legal book move
+        """
+        legal = set(game.legal_moves_sq())
+        entries = [el for el in self.probe(game.get_position_key()) if el[0] in legal]
+        if not entries:
+            return None
+        if rng is None:
+            move = max(entries, key=lambda el: el[1])[0]
+        else:
+            move = rng.choices([el[0] for el in entries], [el[1] for el in entries])[0]
+        return SQUARE_NAMES[move[0]], SQUARE_NAMES[move[1]]
+
+
+def main():
+    """
+    Description:
+    Command line entry point, builds a book from a file of game records or lists the book moves of a position
+    """
+    parser = argparse.ArgumentParser(description='Build or probe a XiangqiGame opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build a book from a file of game records')
+    build.add_argument('games', help='file of game records, one game per line')
+    build.add_argument('book', help='book file to write')
+    build.add_argument('--plies', type=int, default=DEFAULT_PLIES,
+                       help='moves from the start of each game to add (default %d)' % DEFAULT_PLIES)
+    probe = commands.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('book', help='book file to read')
+    probe.add_argument('--fen', default=None, help='FEN string of position (default: starting position)')
+    args = parser.parse_args()
+    if args.command == 'build':
+        with open(args.games) as games_file:
+            result = build_book(read_games(games_file), args.book, args.plies)
+        print('games %d positions %d entries %d seconds %.3f games/sec %.0f' % (
+            result['games'], result['positions'], result['entries'], result['seconds'], result['games_per_second']))
+        return
+    game = XiangqiGame(fen=args.fen)
+    with OpeningBook(args.book) as book:
+        key = game.get_position_key()
+        start = time.perf_counter()
+        for i in range(10000):
+            entries = book.probe(key)
+        seconds = time.perf_counter() - start
+        for (src_sq, dest_sq), weight in sorted(entries, key=lambda el: -el[1]):
+            print('%s%s %d' % (SQUARE_NAMES[src_sq], SQUARE_NAMES[dest_sq], weight))
+        print('entries %d probe %.2f us' % (len(book), seconds / 10000 * 1e6))
+
+
+if __name__ == '__main__':
+    main()
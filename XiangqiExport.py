@@ -0,0 +1,318 @@
+# Description: Exports training data for move prediction models from archives of game records. Each game is replayed
+#              with XiangqiGame and every position reached is written as one fixed-width record of RECORD_DTYPE: the
+#              board as signed piece codes (row 0 is rank 1, column 0 is file a), the team to move, the legal moves
+#              as a bit mask over src_sq * 90 + dest_sq, the move played in the same encoding, and the game and ply it
+#              comes from. The legal moves are the ones make_move already generates to validate the move, so the
+#              mask costs little beyond the replay.
+#
+#              Records are written to shards, .npy files of a structured array that np.load(path, mmap_mode='r')
+#              maps without copying. Shard i holds the games i * games_per_shard up to the next shard's first game,
+#              so shards are written by worker processes in parallel, each streaming records into a memory-mapped
+#              file of its own. A manifest, manifest.json, lists the finished shards and is rewritten as each one
+#              completes, so an interrupted export resumes from the shards it is missing. When every shard is
+#              written, shuffle.npy is written with a seeded permutation of all record indices, and TrainingData
+#              reads records in that order straight from the memory-mapped shards.
+#
+#              The module imports without NumPy, using XiangqiBatch.require_numpy to check for it, so only calling its
+#              functions raises ImportError when NumPy is missing.
+#
+#              Run as a script: python XiangqiExport.py ARCHIVE DIRECTORY [--notation NAME] [--workers N]
+#              [--games-per-shard N] [--seed N]
+
+import argparse
+import json
+import os
+import time
+
+from XiangqiBatch import np, require_numpy
+from XiangqiRecords import NOTATIONS, read_records, parse_move, map_ordered, worker_game
+
+# bytes of the legal move bit mask, one bit for each src_sq * 90 + dest_sq, most significant bit first
+MASK_BYTES = (90 * 90 + 7) // 8
+if np is not None:
+    RECORD_DTYPE = np.dtype([('board', 'i1', (90,)), ('side', 'i1'), ('mask', 'u1', (MASK_BYTES,)), ('move', '<i2'),
+                             ('game', '<i8'), ('ply', '<i2')])
+else:
+    RECORD_DTYPE = None
+MANIFEST = 'manifest.json'
+SHUFFLE_INDEX = 'shuffle.npy'
+# games written to each shard by default
+DEFAULT_GAMES_PER_SHARD = 1024
+
+
+def shard_name(index):
+    """
+    Description:
+    Returns the file name of a shard
+    """
+    return 'shard-%05d.npy' % index
+
+
+def _write_shard(task):
+    """
+    Description:
+    Replays the games of one shard in a worker process and writes their positions to the shard file. Records go to a
+    temporary file sized for every move of the games, which is renamed when complete, so a shard file is never seen
+    half written. A game is replayed up to its first move that cannot be read or is not legal
+    Parameters:
+    task - tuple of (shard index, index of its first game, list of records from XiangqiRecords.read_records,
+    notation, output directory)
+    Returns:
+    dict with the shard's entry in the manifest: index, file, first_game, games and records
+    """
+    index, first_game, records, notation, directory = task
+    game = worker_game()
+    game.set_rejected_move_hook(None)
+    path = os.path.join(directory, shard_name(index))
+    capacity = max(sum(len(record['moves']) for record in records), 1)
+    shard = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=RECORD_DTYPE, shape=(capacity,))
+    boards = shard['board']
+    sides = shard['side']
+    masks = shard['mask']
+    played = shard['move']
+    game_numbers = shard['game']
+    plies = shard['ply']
+    mask = bytearray(MASK_BYTES)
+    count = 0
+    for number, record in enumerate(records, first_game):
+        try:
+            game.reset(record['tags'].get('FEN'))
+        except ValueError:
+            continue
+        for ply, token in enumerate(record['moves']):
+            if game.get_game_state() != 'UNFINISHED':
+                break
+            move = parse_move(game, token, notation)
+            legal = game.legal_moves_sq()
+            if move is None or move not in legal:
+                break
+            for src_sq, dest_sq in legal:
+                el = src_sq * 90 + dest_sq
+                mask[el >> 3] |= 0x80 >> (el & 7)
+            boards[count] = game.get_squares()
+            sides[count] = game.get_side()
+            masks[count] = np.frombuffer(mask, dtype=np.uint8)
+            played[count] = move[0] * 90 + move[1]
+            game_numbers[count] = number
+            plies[count] = ply
+            count += 1
+            mask[:] = bytes(MASK_BYTES)
+            game.make_move_sq(move[0], move[1])
+    if count < capacity:
+        # games ended early, so copy the records to a file of the right size
+        trimmed = np.lib.format.open_memmap(path + '.part', mode='w+', dtype=RECORD_DTYPE, shape=(count,))
+        trimmed[:] = shard[:count]
+        trimmed.flush()
+        del trimmed, shard, boards, sides, masks, played, game_numbers, plies
+        os.replace(path + '.part', path + '.tmp')
+    else:
+        shard.flush()
+        del shard, boards, sides, masks, played, game_numbers, plies
+    os.replace(path + '.tmp', path)
+    return {'index': index, 'file': shard_name(index), 'first_game': first_game, 'games': len(records),
+            'records': count}
+
+
+def _read_manifest(directory):
+    """
+    Description:
+    Returns the manifest of an export directory, or None if there is none
+    """
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _write_manifest(directory, manifest):
+    """
+    Description:
+    Writes the manifest of an export directory, replacing the old one only once the new one is complete
+    """
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def _shard_tasks(records, games_per_shard, notation, directory, done):
+    """
+    Description:
+    Groups records into the tasks of the shards not yet written, reading past the games of the shards in done
+    """
+    chunk = []
+    index = 0
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= games_per_shard:
+            if index not in done:
+                yield index, index * games_per_shard, chunk, notation, directory
+            chunk = []
+            index += 1
+    if chunk and index not in done:
+        yield index, index * games_per_shard, chunk, notation, directory
+
+
+def write_shuffle_index(directory, seed=0):
+    """
+    Description:
+    Writes the shuffle index of an export directory, a permutation of the indices of all records in shard order
+    Parameters:
+    directory - export directory
+    seed - seed of the permutation
+    Returns:
+    number of records
+    """
+    require_numpy('XiangqiExport')
+    manifest = _read_manifest(directory)
+    total = sum(el['records'] for el in manifest['shards'])
+    order = np.random.default_rng(seed).permutation(total).astype(np.int64)
+    path = os.path.join(directory, SHUFFLE_INDEX)
+    np.save(path + '.tmp.npy', order)
+    os.replace(path + '.tmp.npy', path)
+    manifest['records'] = total
+    manifest['seed'] = seed
+    _write_manifest(directory, manifest)
+    return total
+
+
+def export_training_data(records, directory, notation='iccs', workers=None, executor=None,
+                         games_per_shard=DEFAULT_GAMES_PER_SHARD, seed=0, report=print):
+    """
+    Description:
+    Exports the positions of game records to shards in a directory, resuming an earlier export to the same directory
+    by writing only the shards missing from its manifest, then writes the shuffle index
+    Parameters:
+    records - iterable of records from XiangqiRecords.read_records, the same games in the same order when resuming
+    directory - export directory, created if it does not exist
+    notation - notation of the records' moves, from XiangqiRecords.NOTATIONS
+    workers - number of worker processes, defaults to the number of CPUs, or 0 to write shards in this process
+    executor - optional ProcessPoolExecutor to reuse instead of starting one
+    games_per_shard - games written to each shard
+    seed - seed of the shuffle index
+    report - function called with one line of text per shard written, or None for no output
+    Returns:
+    dict with shards, records, written (shards written by this call), seconds and records_per_second (of the
+    records written by this call)
+    Raises:
+    ValueError if notation is not one of NOTATIONS, or the directory holds an export with a different notation or
+    number of games per shard
+    """
+    require_numpy('XiangqiExport')
+    if notation not in NOTATIONS:
+        raise ValueError('unknown notation: ' + repr(notation))
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    manifest = _read_manifest(directory)
+    if manifest is None:
+        manifest = {'notation': notation, 'games_per_shard': games_per_shard, 'shards': []}
+    elif manifest['notation'] != notation or manifest['games_per_shard'] != games_per_shard:
+        raise ValueError('directory holds an export with notation %s and %d games per shard' % (
+            manifest['notation'], manifest['games_per_shard']))
+    # shards listed in the manifest whose files are missing are written again
+    manifest['shards'] = [el for el in manifest['shards'] if os.path.exists(os.path.join(directory, el['file']))]
+    done = {el['index'] for el in manifest['shards']}
+    written = 0
+    written_records = 0
+
+    def finish(entry):
+        nonlocal written, written_records
+        manifest['shards'].append(entry)
+        manifest['shards'].sort(key=lambda el: el['index'])
+        _write_manifest(directory, manifest)
+        written += 1
+        written_records += entry['records']
+        if report is not None:
+            report('shard %d games %d records %d' % (entry['index'], entry['games'], entry['records']))
+
+    tasks = _shard_tasks(records, games_per_shard, notation, directory, done)
+    for entry in map_ordered(_write_shard, tasks, workers, executor):
+        finish(entry)
+    total = write_shuffle_index(directory, seed)
+    seconds = time.perf_counter() - start
+    return {'shards': len(manifest['shards']), 'records': total, 'written': written, 'seconds': seconds,
+            'records_per_second': written_records / seconds if seconds > 0 else 0.0}
+
+
+class TrainingData:
+    """
+    Represents the records of an export directory, read in shuffle index order from memory-mapped shards without
+    copying them into memory
+    """
+    def __init__(self, directory):
+        """
+        Initializes TrainingData object by memory-mapping the shards and shuffle index of an export directory.
+        Raises ValueError if the export has no shuffle index, as when it was interrupted
+        """
+        require_numpy('XiangqiExport')
+        manifest = _read_manifest(directory)
+        if manifest is None or 'records' not in manifest:
+            raise ValueError('not a finished export: ' + repr(directory))
+        self._shards = [np.load(os.path.join(directory, el['file']), mmap_mode='r') for el in manifest['shards']]
+        # index of the first record of each shard, and one past the last record
+        self._offsets = np.cumsum([0] + [len(el) for el in self._shards])
+        self._order = np.load(os.path.join(directory, SHUFFLE_INDEX), mmap_mode='r')
+
+    def __len__(self):
+        """
+        Description:
+        Method returns number of records
+        """
+        return len(self._order)
+
+    def __getitem__(self, i):
+        """
+        Description:
+        Method returns the record at position i of the shuffle index, a view into its memory-mapped shard
+        """
+        record = int(self._order[i])
+        shard = int(np.searchsorted(self._offsets, record, side='right')) - 1
+        return self._shards[shard][record - self._offsets[shard]]
+
+    def get_shards(self):
+        """
+        Description:
+        Method returns the memory-mapped shards, structured arrays of RECORD_DTYPE in game order
+        """
+        return list(self._shards)
+
+    def batch(self, start, size):
+        """
+        Description:
+        Method gathers the records at positions start to start + size of the shuffle index into one array
+        Returns:
+        structured array of RECORD_DTYPE
+        """
+        order = np.asarray(self._order[start:start + size])
+        shards = np.searchsorted(self._offsets, order, side='right') - 1
+        result = np.empty(len(order), dtype=RECORD_DTYPE)
+        for shard in np.unique(shards):
+            selected = shards == shard
+            result[selected] = self._shards[shard][order[selected] - self._offsets[shard]]
+        return result
+
+
+def main():
+    """
+    Description:
+    Command line entry point, exports the games of an archive to an export directory
+    """
+    parser = argparse.ArgumentParser(description='Export training data from an archive of Xiangqi game records')
+    parser.add_argument('archive', help='file of game records')
+    parser.add_argument('directory', help='export directory, resumed if it holds an unfinished export')
+    parser.add_argument('--notation', choices=NOTATIONS, default='iccs', help='notation of moves (default iccs)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes, 0 for none (default: number of CPUs)')
+    parser.add_argument('--games-per-shard', type=int, default=DEFAULT_GAMES_PER_SHARD,
+                        help='games written to each shard (default %d)' % DEFAULT_GAMES_PER_SHARD)
+    parser.add_argument('--seed', type=int, default=0, help='seed of the shuffle index (default 0)')
+    args = parser.parse_args()
+    result = export_training_data(read_records(args.archive), args.directory, args.notation, args.workers,
+                                  games_per_shard=args.games_per_shard, seed=args.seed)
+    print('shards %d records %d written %d seconds %.3f records/sec %.0f' % (
+        result['shards'], result['records'], result['written'], result['seconds'], result['records_per_second']))
+
+
+if __name__ == '__main__':
+    main()
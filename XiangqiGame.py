@@ -6,94 +6,585 @@
 #              specific piece types: General, Advisor, Horse, Elephant, Chariot, Soldier, Cannon. Each Piece child
 #              class have methods accessed by the XiangqiGame class that define all possible moves that can be made
 #              for that particular piece type, and performs validation with the context of the current board layout.
+#
+#              The board is stored as a flat list of 90 integers, one per square, indexed as row * 9 + col where row 0
+#              is rank 1 (red side) and col 0 is file a. Each square holds 0 when empty, or the piece type code signed
+#              by team: positive for red and negative for black. This makes empty/friend/enemy tests a single
+#              multiplication against the moving team's sign. Positions can be read from and written to FEN strings.
+
+import random
+import threading
+
+# piece type codes stored on the board
+GENERAL = 1
+ADVISOR = 2
+ELEPHANT = 3
+HORSE = 4
+CHARIOT = 5
+CANNON = 6
+SOLDIER = 7
+
+# material value of each piece type code, in hundredths of a soldier
+PIECE_VALUES = (0, 0, 200, 200, 400, 900, 450, 100)
+
+# number of entries of the TranspositionTable shared by games created without one of their own
+SHARED_TABLE_SIZE = 1 << 12
+
+# sign of board codes for each team
+RED = 1
+BLACK = -1
+_SIDES = {'red': RED, 'black': BLACK}
+_TEAMS = {RED: 'red', BLACK: 'black'}
+_SLIDERS = {CHARIOT, -CHARIOT, CANNON, -CANNON}
+
+# Squares whose contents a piece's moves can depend on. Every piece only looks at squares within two rows and columns
+# of itself, except Chariots and Cannons which look along their whole row and column. For each square, _NEAR_SQUARES
+# lists the squares at most two rows and columns away (including the square itself) and _LINE_SQUARES lists the
+# remaining squares on its row and column.
+_NEAR_SQUARES = []
+_LINE_SQUARES = []
+for _sq in range(90):
+    _row, _col = divmod(_sq, 9)
+    _NEAR_SQUARES.append(tuple(r * 9 + c for r in range(max(_row - 2, 0), min(_row + 3, 10))
+                               for c in range(max(_col - 2, 0), min(_col + 3, 9))))
+    _LINE_SQUARES.append(tuple(r * 9 + _col for r in range(10) if abs(r - _row) > 2) +
+                         tuple(_row * 9 + c for c in range(9) if abs(c - _col) > 2))
+_NEAR_SETS = [frozenset(el) for el in _NEAR_SQUARES]
+_LINE_SETS = [frozenset(el) for el in _LINE_SQUARES]
+
+# Destinations of the pieces whose moves only depend on their source square, their team and at most one blocking
+# square, built once so move generation is a loop over a table. Each table has one entry per source square, in the
+# direction order the moves were always generated in. _GENERAL_MOVES and _ADVISOR_MOVES hold tuples of destinations
+# inside the castle, for each team. _ELEPHANT_MOVES holds (destination, eye) pairs on the team's side of the river,
+# where the eye is the square between that blocks the move, for each team. _HORSE_MOVES holds (destination, leg)
+# pairs, where the leg is the orthogonal square next to the horse that blocks the move.
+_GENERAL_MOVES = {RED: [], BLACK: []}
+_ADVISOR_MOVES = {RED: [], BLACK: []}
+_ELEPHANT_MOVES = {RED: [], BLACK: []}
+_HORSE_MOVES = []
+for _sq in range(90):
+    _row, _col = divmod(_sq, 9)
+    for _side, _low in ((RED, 0), (BLACK, 7)):
+        for _table, _steps in ((_GENERAL_MOVES, ((1, 0), (-1, 0), (0, -1), (0, 1))),
+                               (_ADVISOR_MOVES, ((1, 1), (-1, 1), (-1, -1), (1, -1)))):
+            _table[_side].append(tuple((_row + dy) * 9 + _col + dx for dy, dx in _steps
+                                       if _low <= _row + dy <= _low + 2 and 3 <= _col + dx <= 5))
+    for _side, _low in ((RED, 0), (BLACK, 5)):
+        _ELEPHANT_MOVES[_side].append(tuple(((_row + 2 * dy) * 9 + _col + 2 * dx, (_row + dy) * 9 + _col + dx)
+                                            for dy, dx in ((1, 1), (1, -1), (-1, -1), (-1, 1))
+                                            if _low <= _row + 2 * dy <= _low + 4 and 0 <= _col + 2 * dx <= 8))
+    _HORSE_MOVES.append(tuple(((_row + dy) * 9 + _col + dx, (_row + ly) * 9 + _col + lx)
+                              for ly, lx, moves in ((1, 0, ((2, -1), (2, 1))), (-1, 0, ((-2, -1), (-2, 1))),
+                                                    (0, -1, ((1, -2), (-1, -2))), (0, 1, ((1, 2), (-1, 2))))
+                              for dy, dx in moves if 0 <= _row + dy <= 9 and 0 <= _col + dx <= 8))
+
+
+def _line_occupancy(squares):
+    """
+    Description:
+    Builds the occupancy masks of a board, used to look up Chariot and Cannon moves
+    Parameters:
+    squares - flat list of 90 signed piece codes
+    Returns:
+    tuple of (list of 10 rank masks with bit col set for each occupied square of the row, list of 9 file masks with
+    bit row set for each occupied square of the column)
+    """
+    ranks = [0] * 10
+    files = [0] * 9
+    for sq in range(90):
+        if squares[sq] != 0:
+            row, col = divmod(sq, 9)
+            ranks[row] |= 1 << col
+            files[col] |= 1 << row
+    return ranks, files
+
+
+def _ray_table(ray, bits):
+    """
+    Description:
+    Builds the lookup table of one direction from one square, indexed by the occupancy bits of the squares in that
+    direction
+    Parameters:
+    ray - tuple of board square indices in the direction, nearest first
+    bits - tuple of the bit of the index that holds the occupancy of each square of ray
+    Returns:
+    list indexed by occupancy of (empty squares before the first piece, square of the first piece, empty squares
+    between the first and second pieces, square of the second piece) tuples, with None for a missing piece
+    """
+    table = []
+    for occupancy in range(1 << len(ray)):
+        pieces = []
+        empties = ([], [])
+        for i in range(len(ray)):
+            if occupancy >> bits[i] & 1:
+                pieces.append(ray[i])
+                if len(pieces) == 2:
+                    break
+            else:
+                empties[len(pieces)].append(ray[i])
+        table.append((tuple(empties[0]), pieces[0] if pieces else None, tuple(empties[1]),
+                      pieces[1] if len(pieces) == 2 else None))
+    return table
+
+
+# Chariot and Cannon lookup tables. The game keeps a bit mask of the occupied squares of each rank and file, and
+# _RAYS holds, for each square, a table for each direction (up, down, left, right) indexed by the part of the rank or
+# file mask on that side of the square: the file mask shifted down past the square for up, the file mask below the
+# square for down, and likewise for the rank mask. Each table entry is the result of _ray_table.
+_RAYS = []
+for _sq in range(90):
+    _row, _col = divmod(_sq, 9)
+    _RAYS.append((_ray_table(tuple(r * 9 + _col for r in range(_row + 1, 10)), tuple(range(9 - _row))),
+                  _ray_table(tuple(r * 9 + _col for r in range(_row - 1, -1, -1)), tuple(range(_row - 1, -1, -1))),
+                  _ray_table(tuple(_row * 9 + c for c in range(_col - 1, -1, -1)), tuple(range(_col - 1, -1, -1))),
+                  _ray_table(tuple(_row * 9 + c for c in range(_col + 1, 9)), tuple(range(8 - _col)))))
+
+# Zobrist keys: a random 64-bit number for each signed piece code on each square, plus one for black to move. The key
+# of a position is the XOR of the numbers of every piece on the board, so it can be updated with two XORs per square
+# changed. A fixed seed keeps keys identical between runs and processes.
+_zobrist_random = random.Random(20200303)
+_ZOBRIST_PIECES = {code: [_zobrist_random.getrandbits(64) for _ in range(90)]
+                   for code in range(-SOLDIER, SOLDIER + 1) if code != 0}
+_ZOBRIST_PIECES[0] = [0] * 90
+_ZOBRIST_BLACK = _zobrist_random.getrandbits(64)
+
+
+# Piece-square tables: the bonus, in hundredths of a soldier, of a piece type on each square, written as the board is
+# printed with rank 10 first and red at the bottom. Black pieces use the square mirrored across the river.
+PIECE_SQUARE_TABLES = (
+    None,
+    # General: stay on the home square, away from the open sides of the castle
+    (0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, -10, -15, -10, 0, 0, 0,
+     0, 0, 0, -5, -10, -5, 0, 0, 0,
+     0, 0, 0, 5, 10, 5, 0, 0, 0),
+    # Advisor: the centre of the castle covers every other advisor square
+    (0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 10, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0),
+    # Elephant: the centre in front of the castle guards it best
+    (0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, -5, 0, 0, 0, -5, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     -5, 0, 0, 0, 10, 0, 0, 0, -5,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0),
+    # Horse: strongest in the centre and across the river, weakest on the edges
+    (0, 5, 10, 10, 5, 10, 10, 5, 0,
+     5, 15, 25, 20, 10, 20, 25, 15, 5,
+     5, 15, 20, 25, 25, 25, 20, 15, 5,
+     5, 20, 20, 25, 20, 25, 20, 20, 5,
+     0, 10, 15, 20, 20, 20, 15, 10, 0,
+     0, 10, 15, 15, 15, 15, 15, 10, 0,
+     0, 5, 10, 10, 15, 10, 10, 5, 0,
+     0, 0, 5, 5, 5, 5, 5, 0, 0,
+     -5, 0, 0, 0, -10, 0, 0, 0, -5,
+     -10, -5, 0, 0, 0, 0, 0, -5, -10),
+    # Chariot: open files and ranks across the river, out of the corners
+    (10, 15, 15, 20, 20, 20, 15, 15, 10,
+     10, 20, 15, 25, 30, 25, 15, 20, 10,
+     5, 10, 10, 15, 20, 15, 10, 10, 5,
+     5, 15, 15, 20, 20, 20, 15, 15, 5,
+     5, 15, 10, 15, 15, 15, 10, 15, 5,
+     0, 10, 10, 10, 15, 10, 10, 10, 0,
+     -5, 5, 5, 5, 10, 5, 5, 5, -5,
+     -5, 5, 0, 10, 0, 10, 0, 5, -5,
+     0, 5, 0, 10, 0, 10, 0, 5, 0,
+     -10, 5, 0, 5, 0, 5, 0, 5, -10),
+    # Cannon: the central file, and its home ranks where it has screens in front of it
+    (5, 5, 0, -5, -5, -5, 0, 5, 5,
+     0, 5, 0, -5, -10, -5, 0, 5, 0,
+     0, 0, 0, -5, 0, -5, 0, 0, 0,
+     0, 0, 0, 0, 5, 0, 0, 0, 0,
+     0, 0, 0, 0, 5, 0, 0, 0, 0,
+     0, 0, 5, 0, 10, 0, 5, 0, 0,
+     0, 0, 0, 0, 5, 0, 0, 0, 0,
+     0, 5, 5, 5, 15, 5, 5, 5, 0,
+     0, 0, 0, 5, 5, 5, 0, 0, 0,
+     0, 0, 5, 5, 5, 5, 5, 0, 0),
+    # Soldier: worth more once across the river, and most near the opposing castle
+    (0, 0, 0, 5, 10, 5, 0, 0, 0,
+     20, 40, 60, 80, 90, 80, 60, 40, 20,
+     20, 40, 55, 70, 80, 70, 55, 40, 20,
+     20, 35, 45, 55, 60, 55, 45, 35, 20,
+     10, 20, 30, 35, 40, 35, 30, 20, 10,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 10, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0),
+)
+
+# Evaluation terms of each signed piece code on each board square index, from red's point of view: _MATERIAL_SCORES
+# holds the piece value and _POSITION_SCORES the piece-square bonus, both negated for black pieces. A move changes
+# each term by the scores of the squares it changes, so games keep the sums up to date as pieces move.
+_MATERIAL_SCORES = {0: [0] * 90}
+_POSITION_SCORES = {0: [0] * 90}
+for _code in range(GENERAL, SOLDIER + 1):
+    _MATERIAL_SCORES[_code] = [PIECE_VALUES[_code]] * 90
+    _MATERIAL_SCORES[-_code] = [-PIECE_VALUES[_code]] * 90
+    # table row 0 is rank 10, which is board row 9 for red and board row 0 for black
+    _POSITION_SCORES[_code] = [PIECE_SQUARE_TABLES[_code][(9 - _sq // 9) * 9 + _sq % 9] for _sq in range(90)]
+    _POSITION_SCORES[-_code] = [-PIECE_SQUARE_TABLES[_code][_sq] for _sq in range(90)]
+
+# FEN letter of each signed piece code, and piece code of each FEN letter
+_FEN_LETTERS = {GENERAL: 'K', ADVISOR: 'A', ELEPHANT: 'B', HORSE: 'N', CHARIOT: 'R', CANNON: 'C', SOLDIER: 'P'}
+for _code in list(_FEN_LETTERS):
+    _FEN_LETTERS[-_code] = _FEN_LETTERS[_code].lower()
+_FEN_CODES = {letter: code for code, letter in _FEN_LETTERS.items()}
+_FEN_CODES.update({'E': ELEPHANT, 'H': HORSE, 'e': -ELEPHANT, 'h': -HORSE})
+# piece type letter used in Piece text names
+_PIECE_LETTERS = (None, 'g', 'a', 'e', 'h', 'r', 'c', 's')
+
+START_FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1'
+
+
+def _parse_fen(fen):
+    """
+    Description:
+    Parses a FEN string in the format described in XiangqiGame.from_fen
+    Parameters:
+    fen - FEN string of position
+    Returns:
+    tuple of (list of 90 signed piece codes, team whose turn it is, moves since last capture, move number)
+    Raises:
+    ValueError if fen is not a valid FEN string
+    """
+    fields = fen.split()
+    if len(fields) < 1 or len(fields) > 6:
+        raise ValueError('FEN must have 1 to 6 fields: ' + repr(fen))
+    ranks = fields[0].split('/')
+    if len(ranks) != 10:
+        raise ValueError('FEN must have 10 ranks: ' + repr(fen))
+    squares = [0] * 90
+    generals = {RED: 0, BLACK: 0}
+    for i in range(10):
+        # first rank listed is rank 10
+        sq = (9 - i) * 9
+        end = sq + 9
+        for letter in ranks[i]:
+            if '1' <= letter <= '9':
+                sq += ord(letter) - 48
+            elif letter in _FEN_CODES:
+                if sq >= end:
+                    raise ValueError('FEN rank ' + str(10 - i) + ' has more than 9 squares: ' + repr(fen))
+                code = _FEN_CODES[letter]
+                squares[sq] = code
+                if code == GENERAL or code == -GENERAL:
+                    generals[RED if code > 0 else BLACK] += 1
+                sq += 1
+            else:
+                raise ValueError('invalid FEN piece ' + repr(letter) + ': ' + repr(fen))
+        if sq != end:
+            raise ValueError('FEN rank ' + str(10 - i) + ' does not have 9 squares: ' + repr(fen))
+    if generals[RED] > 1 or generals[BLACK] > 1:
+        raise ValueError('FEN has more than one general per team: ' + repr(fen))
+    team = 'red'
+    if len(fields) > 1:
+        if fields[1] == 'b':
+            team = 'black'
+        elif fields[1] != 'w' and fields[1] != 'r':
+            raise ValueError('invalid FEN team to move ' + repr(fields[1]) + ': ' + repr(fen))
+    try:
+        halfmove = int(fields[4]) if len(fields) > 4 else 0
+        fullmove = int(fields[5]) if len(fields) > 5 else 1
+    except ValueError:
+        raise ValueError('invalid FEN move counters: ' + repr(fen))
+    return squares, team, halfmove, max(fullmove, 1)
+
+
+# algebraic notation string of each board square index, and board square index of each algebraic notation string
+SQUARE_NAMES = tuple('abcdefghi'[_sq % 9] + str(_sq // 9 + 1) for _sq in range(90))
+SQUARE_INDICES = {name: sq for sq, name in enumerate(SQUARE_NAMES)}
+
+
+def square_name(sq):
+    """
+    Description:
+    Converts a board square index to algebraic notation
+    Parameters:
+    sq - board square index (row * 9 + col)
+    Returns:
+    algebraic notation string eg. a1
+    """
+    return SQUARE_NAMES[sq]
+
+
+def square_index(name):
+    """
+    Description:
+    Converts algebraic notation to a board square index
+    Parameters:
+    name - algebraic notation string eg. a1
+    Returns:
+    board square index (row * 9 + col), or None if name is not a square of the board
+    """
+    if isinstance(name, str):
+        return SQUARE_INDICES.get(name)
+    return None
+
+
+def print_rejected_move(game, src_sq, dest_sq):
+    """
+    Description:
+    Default rejected move hook of XiangqiGame, prints that the move would leave the team's general in check
+    Parameters:
+    game - XiangqiGame object
+    src_sq - board square index of piece that was to be moved
+    dest_sq - board square index of destination
+    """
+    print("this move results in team's general being in check - return false")
 
 
 class XiangqiGame:
     """Represents a game of Xiangqi"""
-    def __init__(self):
-        """Initialize XiangqiGame object with starting team, game_state, and check states for each team"""
-        self._current_team = 'red'
+    def __init__(self, table=None, fen=None):
+        """
+        Initialize XiangqiGame object with starting team, game_state, and check states for each team. The game starts
+        from the position of FEN string fen, or the standard starting position if fen is None. Results of positions
+        are memoized in table, a TranspositionTable which defaults to one of SHARED_TABLE_SIZE entries shared by all
+        games. Searches that should not compete with other games for its slots pass a table of their own
+        """
+        # called when make_move rejects a move that would leave the team's general in check
+        self._rejected_move_hook = print_rejected_move
+        if fen is None:
+            self._setup(_START_SQUARES, 'red', 0, 1, table)
+        else:
+            squares, team, halfmove, fullmove = _parse_fen(fen)
+            self._setup(squares, team, halfmove, fullmove, table)
+
+    @classmethod
+    def from_fen(cls, fen, table=None):
+        """
+        Description:
+        Creates a game starting from the position of a FEN string, eg.
+        rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1
+        Ranks are listed from rank 10 to rank 1. Red pieces are upper case and black pieces lower case: K general,
+        A advisor, B or E elephant, N or H horse, R chariot, C cannon, P soldier. The team to move is w or r for red
+        and b for black
+        Parameters:
+        fen - FEN string of position
+        table - TranspositionTable to memoize results in, defaults to the one shared by all games
+        Returns:
+        XiangqiGame object, with game_state already set if the team to move has lost
+        Raises:
+        ValueError if fen is not a valid FEN string
+        """
+        return cls(table, fen)
+
+    def to_fen(self):
+        """
+        Description:
+        Method returns the current position as a FEN string, in the format accepted by from_fen
+        Returns:
+        FEN string, with the number of moves since the last capture and the move number
+        """
+        squares = self._squares
+        ranks = []
+        for row in range(9, -1, -1):
+            rank = ''
+            empty = 0
+            for sq in range(row * 9, row * 9 + 9):
+                code = squares[sq]
+                if code == 0:
+                    empty += 1
+                    continue
+                if empty > 0:
+                    rank += str(empty)
+                    empty = 0
+                rank += _FEN_LETTERS[code]
+            if empty > 0:
+                rank += str(empty)
+            ranks.append(rank)
+        # count moves back to the last capture
+        halfmove = 0
+        for el in reversed(self._undo):
+            if el[2] != 0:
+                break
+            halfmove += 1
+        else:
+            halfmove += self._start_halfmove
+        ply = self._start_ply + len(self._undo)
+        team = 'w' if self._side == RED else 'b'
+        return '/'.join(ranks) + ' ' + team + ' - - ' + str(halfmove) + ' ' + str(ply // 2 + 1)
+
+    def reset(self, fen=None):
+        """
+        Description:
+        Starts the game again from the position of FEN string fen, or the standard starting position if fen is None,
+        reusing the board and attack map lists of this game instead of allocating new ones. The game keeps its
+        TranspositionTable and maximum number of moves
+        Parameters:
+        fen - FEN string of position, in the format accepted by from_fen, or None
+        Raises:
+        ValueError if fen is not a valid FEN string, in which case the game is left unchanged
+        """
+        if fen is None:
+            self._setup(_START_SQUARES, 'red', 0, 1, self._table, self._max_moves)
+        else:
+            squares, team, halfmove, fullmove = _parse_fen(fen)
+            self._setup(squares, team, halfmove, fullmove, self._table, self._max_moves)
+
+    def _setup(self, squares, team, halfmove, fullmove, table, max_moves=None):
+        """
+        Description:
+        Private method that initializes all game state for a position. Lists left by an earlier setup are refilled in
+        place
+        Parameters:
+        squares - list of 90 signed piece codes
+        team - string of team whose turn it is
+        halfmove - number of moves since the last capture
+        fullmove - move number, starting at 1 and increasing after each black move
+        table - TranspositionTable to memoize results in, or None for the one shared by all games
+        max_moves - number of moves after which the game is drawn, or None for no limit
+        """
+        # sign of the team whose turn it is
+        self._side = _SIDES[team]
         self._game_state = "UNFINISHED"
-        self._red_in_check = False
-        self._black_in_check = False
-
-        # Instantiate all Piece objects.
-        # first character in object name is Piece type, second character is team color, and third is number (if more
-        # than one)
-        # red team
-        self._g_r = General('red', 'e1', 'g_r')
-        self._a_r_1 = Advisor('red', 'd1', 'a_r_1')
-        self._a_r_2 = Advisor('red', 'f1', 'a_r_2')
-        self._e_r_1 = Elephant('red', 'c1', 'e_r_1')
-        self._e_r_2 = Elephant('red', 'g1', 'e_r_2')
-        self._h_r_1 = Horse('red', 'b1', 'h_r_1')
-        self._h_r_2 = Horse('red', 'h1', 'h_r_2')
-        self._r_r_1 = Chariot('red', 'a1', 'r_r_1')
-        self._r_r_2 = Chariot('red', 'i1', 'r_r_2')
-        self._c_r_1 = Cannon('red', 'b3', 'c_r_1')
-        self._c_r_2 = Cannon('red', 'h3', 'c_r_2')
-        self._s_r_1 = Soldier('red', 'a4', 's_r_1')
-        self._s_r_2 = Soldier('red', 'c4', 's_r_2')
-        self._s_r_3 = Soldier('red', 'e4', 's_r_3')
-        self._s_r_4 = Soldier('red', 'g4', 's_r_4')
-        self._s_r_5 = Soldier('red', 'i4', 's_r_5')
-
-        # black team
-        self._g_b = General('black', 'e10', 'g_b')
-        self._a_b_1 = Advisor('black', 'd10', 'a_b_1')
-        self._a_b_2 = Advisor('black', 'f10', 'a_b_2')
-        self._e_b_1 = Elephant('black', 'c10', 'e_b_1')
-        self._e_b_2 = Elephant('black', 'g10', 'e_b_2')
-        self._h_b_1 = Horse('black', 'b10', 'h_b_1')
-        self._h_b_2 = Horse('black', 'h10', 'h_b_2')
-        self._r_b_1 = Chariot('black', 'a10', 'r_b_1')
-        self._r_b_2 = Chariot('black', 'i10', 'r_b_2')
-        self._c_b_1 = Cannon('black', 'b8', 'c_b_1')
-        self._c_b_2 = Cannon('black', 'h8', 'c_b_2')
-        self._s_b_1 = Soldier('black', 'a7', 's_b_1')
-        self._s_b_2 = Soldier('black', 'c7', 's_b_2')
-        self._s_b_3 = Soldier('black', 'e7', 's_b_3')
-        self._s_b_4 = Soldier('black', 'g7', 's_b_4')
-        self._s_b_5 = Soldier('black', 'i7', 's_b_5')
-
-        # Initialize board
-        self._board = [[self._r_r_1, self._h_r_1, self._e_r_1, self._a_r_1, self._g_r, self._a_r_2, self._e_r_2,
-                        self._h_r_2, self._r_r_2],
-                       [0, 0, 0, 0, 0, 0, 0, 0, 0],
-                       [0, self._c_r_1, 0, 0, 0, 0, 0, self._c_r_2, 0],
-                       [self._s_r_1, 0, self._s_r_2, 0, self._s_r_3, 0, self._s_r_4, 0, self._s_r_5],
-                       [0, 0, 0, 0, 0, 0, 0, 0, 0],
-                       [0, 0, 0, 0, 0, 0, 0, 0, 0],
-                       [self._s_b_1, 0, self._s_b_2, 0, self._s_b_3, 0, self._s_b_4, 0, self._s_b_5],
-                       [0, self._c_b_1, 0, 0, 0, 0, 0, self._c_b_2, 0],
-                       [0, 0, 0, 0, 0, 0, 0, 0, 0],
-                       [self._r_b_1, self._h_b_1, self._e_b_1, self._a_b_1, self._g_b, self._a_b_2, self._e_b_2,
-                        self._h_b_2, self._r_b_2]]
-
-        # tracking list of in play pieces
-        self._in_play = [self._r_r_1, self._h_r_1, self._e_r_1, self._a_r_1, self._g_r, self._a_r_2, self._e_r_2,
-                         self._h_r_2, self._r_r_2, self._c_r_1, self._c_r_2, self._s_r_1, self._s_r_2, self._s_r_3,
-                         self._s_r_4, self._s_r_5, self._s_b_1, self._s_b_2, self._s_b_3, self._s_b_4, self._s_b_5,
-                         self._c_b_1, self._c_b_2, self._r_b_1, self._h_b_1, self._e_b_1, self._a_b_1, self._g_b,
-                         self._a_b_2, self._e_b_2, self._h_b_2, self._r_b_2]
+        if table is None:
+            table = _SHARED_TABLE
+        self._table = table
+
+        # Board as signed piece codes, the board square of each team's general, occupancy masks of ranks and files for
+        # Chariot and Cannon move lookup, and the attack maps: _targets holds the possible destinations of the piece
+        # on each square, and _attack_counts holds, for each team, how many of its pieces can move onto each square.
+        # Both are updated incrementally as pieces move, so check tests are a lookup at the general's square. The
+        # standard starting position is computed once and copied
+        if squares is _START_SQUARES:
+            state = _START_STATE
+        else:
+            state = _board_state(squares)
+        targets, red_counts, black_counts, ranks, files, key, generals, material, position = state
+        if getattr(self, '_squares', None) is None:
+            self._squares = list(squares)
+            self._targets = list(targets)
+            self._attack_counts = {RED: list(red_counts), BLACK: list(black_counts)}
+            self._occupancy = (list(ranks), list(files))
+            self._generals = dict(generals)
+            self._undo = []
+            self._check_streaks = {RED: 0, BLACK: 0}
+            self._chase_streaks = {RED: 0, BLACK: 0}
+        else:
+            self._squares[:] = squares
+            self._targets[:] = targets
+            self._attack_counts[RED][:] = red_counts
+            self._attack_counts[BLACK][:] = black_counts
+            self._occupancy[0][:] = ranks
+            self._occupancy[1][:] = files
+            self._generals.clear()
+            self._generals.update(generals)
+            self._undo.clear()
+            for el in (self._check_streaks, self._chase_streaks):
+                el[RED] = 0
+                el[BLACK] = 0
+        # Zobrist key of the position
+        self._key = key if team == 'red' else key ^ _ZOBRIST_BLACK
+        # evaluation terms from red's point of view, kept up to date as pieces move
+        self._material = material
+        self._position = position
+        # legal moves of the current team, generated on demand and cached until the next move, and _undo holds the
+        # undo records of moves made, most recent last
+        self._legal = None
+        # move counters of the position the game started from, for to_fen
+        self._start_halfmove = halfmove
+        self._start_ply = (fullmove - 1) * 2 + (1 if team == 'black' else 0)
+        # Repetition history: _positions maps the key of each position reached since the last capture to the list of
+        # move numbers it was reached at, so a repeat is found with one lookup. A capture starts a new dict, since no
+        # earlier position can occur again, which keeps the history bounded. For each team, _check_streaks and
+        # _chase_streaks count its most recent moves in a row that gave check or chased an undefended piece
+        self._positions = {self._key: [0]}
+        # number of moves after which the game is drawn, or None for no limit
+        self._max_moves = max_moves
+
+        # a position where the team to move has already lost is a won game
+        if self.is_lost() is True:
+            if team == 'red':
+                self._game_state = "BLACK_WON"
+            else:
+                self._game_state = "RED_WON"
 
     def get_game_state(self):
         """
         Description:
-        Method returns current state of game
+        Method returns current state of game: UNFINISHED, RED_WON, BLACK_WON, or DRAW when the same position is
+        reached for the third time without a perpetual check or chase, or the maximum number of moves is reached
         Return:
         self._game_state
         """
         return self._game_state
 
+    def get_max_moves(self):
+        """
+        Description:
+        Method returns the number of moves after which the game is drawn
+        Return:
+        self._max_moves, None if there is no limit
+        """
+        return self._max_moves
+
+    def set_max_moves(self, max_moves):
+        """
+        Description:
+        Method sets the number of moves, by both teams together and counted from the creation of the game, after
+        which the game is drawn if it has not been won
+        Parameters:
+        max_moves - positive number of moves, or None for no limit
+        """
+        self._max_moves = max_moves
+
+    def set_rejected_move_hook(self, hook):
+        """
+        Description:
+        Method sets the function make_move calls when it rejects a move the piece could make because it would leave
+        the team's general in check
+        Parameters:
+        hook - function called with the game, src_sq and dest_sq board square indices, print_rejected_move by
+        default, or None to call nothing
+        """
+        self._rejected_move_hook = hook
+
+    def get_rejected_move_hook(self):
+        """
+        Description:
+        Method returns the function make_move calls when it rejects a move that would leave the team's general in
+        check, or None
+        """
+        return self._rejected_move_hook
+
     def get_current_team(self):
         """
         Description:
         Method returns current team turn
         Return:
-        self._current_team
+        'red' or 'black'
+        """
+        return _TEAMS[self._side]
+
+    def get_side(self):
+        """
+        Description:
+        Method returns current team turn as its sign, for callers that compare teams in inner loops
+        Return:
+        RED (1) or BLACK (-1)
         """
-        return self._current_team
+        return self._side
 
     def is_in_check(self, team):
         """
@@ -106,280 +597,937 @@ class XiangqiGame:
         that team is currently in check
         """
         if team == 'red' or team == 'black':
-            if team == 'red':
-                return self._red_in_check
-            else:
-                return self._black_in_check
+            return self._general_attacked(_SIDES[team])
         else:
             return False
 
+    def attackers_of(self, square, team):
+        """
+        Description:
+        returns the board locations of all pieces of a team that can currently move onto a square
+        Parameters:
+        square - algebraic notation string for board location eg. e1
+        team - string of team whose pieces are returned, either 'red' or 'black'
+        Returns:
+        list of algebraic notation strings of the attacking pieces, empty if square or team are not valid
+        """
+        sq = square_index(square)
+        if sq is None or (team != 'red' and team != 'black'):
+            return []
+        if self._attack_counts[_SIDES[team]][sq] == 0:
+            return []
+        side = _SIDES[team]
+        squares = self._squares
+        targets = self._targets
+        return [SQUARE_NAMES[el] for el in range(90) if squares[el] * side > 0 and sq in targets[el]]
+
+    def get_position_key(self):
+        """
+        Description:
+        Method returns the 64-bit Zobrist key of the current position, which identifies the pieces on the board and
+        the team whose turn it is
+        Return:
+        self._key
+        """
+        return self._key
+
+    def get_transposition_table(self):
+        """
+        Description:
+        Method returns the TranspositionTable that results of this game's positions are memoized in
+        """
+        return self._table
+
+    def legal_moves(self):
+        """
+        Description:
+        returns all moves the current team can legally make. Moves are generated once per position and reused until
+        the next move is made
+        Returns:
+        list of (src, dest) tuples of algebraic notation strings, empty if the game has been won
+        """
+        if self._game_state != 'UNFINISHED':
+            return []
+        result = []
+        for src_sq, dest_list in self._legal_moves().items():
+            src = SQUARE_NAMES[src_sq]
+            for dest_sq in dest_list:
+                result.append((src, SQUARE_NAMES[dest_sq]))
+        return result
+
+    def legal_moves_from(self, square):
+        """
+        Description:
+        returns all destinations the piece at a board location can legally move to
+        Parameters:
+        square - algebraic notation string for board location of piece eg. b1
+        Returns:
+        list of algebraic notation strings, empty if the square is not valid, holds no piece of the current team, or
+        the game has been won
+        """
+        if self._game_state != 'UNFINISHED':
+            return []
+        dest_list = self._legal_moves().get(square_index(square), ())
+        return [SQUARE_NAMES[el] for el in dest_list]
+
+    def legal_moves_sq(self):
+        """
+        Description:
+        returns all moves the current team can legally make as board square indices (row * 9 + col), for callers
+        such as searches that work with square indices. Shares the cached moves used by legal_moves
+        Returns:
+        list of (src_sq, dest_sq) tuples, regardless of game_state
+        """
+        return [(src_sq, dest_sq) for src_sq, dest_list in self._legal_moves().items() for dest_sq in dest_list]
+
+    def legal_captures_sq(self):
+        """
+        Description:
+        returns the legal moves of the current team that capture an opposing piece, as board square indices, for
+        searches that only look at captures. The attack maps already hold the moves of each piece, so its captures
+        are read from them, as its Piece class's captures_from would give, and only those are tested for check
+        Returns:
+        list of (src_sq, dest_sq) tuples, regardless of game_state
+        """
+        squares = self._squares
+        side = self._side
+        legal = self._legal
+        if legal is not None:
+            return [(src_sq, dest_sq) for src_sq, dest_list in legal.items() for dest_sq in dest_list
+                    if squares[dest_sq] * side < 0]
+        targets = self._targets
+        general_sq = self._generals.get(side)
+        attackers = None
+        if general_sq is not None:
+            attackers = self._potential_attackers(general_sq, side)
+        result = []
+        for sq in range(90):
+            if squares[sq] * side > 0:
+                for el in targets[sq]:
+                    if squares[el] * side < 0 and self._move_in_check(sq, el, side, attackers) is False:
+                        result.append((sq, el))
+        return result
+
+    def get_piece_code(self, sq):
+        """
+        Description:
+        Method returns the contents of a board square index
+        Parameters:
+        sq - board square index (row * 9 + col)
+        Returns:
+        0 if empty, else piece type code, positive for a red piece and negative for a black piece
+        """
+        return self._squares[sq]
+
+    def get_squares(self):
+        """
+        Description:
+        Method returns the contents of every board square at once, for callers that copy whole positions
+        Returns:
+        tuple of 90 signed piece codes in the format of get_piece_code, indexed by board square index
+        """
+        return tuple(self._squares)
+
+    def is_lost(self):
+        """
+        Description:
+        returns if the team whose turn it is has lost in the current position, because it has no legal moves or
+        because it is in check and its general has no legal moves
+        Returns:
+        True or False, regardless of game_state
+        """
+        legal = self._legal_moves()
+        if not legal:
+            return True
+        side = self._side
+        return self._general_attacked(side) is True and self._generals.get(side) not in legal
+
+    def evaluate(self):
+        """
+        Description:
+        returns a static evaluation of the current position as the material balance plus the piece-square bonuses of
+        PIECE_SQUARE_TABLES, in hundredths of a soldier. Both are kept up to date as pieces move, so this does not
+        look at the board
+        Returns:
+        integer score, positive when red is ahead and negative when black is ahead
+        """
+        return self._material + self._position
+
+    def evaluate_terms(self):
+        """
+        Description:
+        returns the terms of evaluate separately, for tuning the piece values and tables
+        Returns:
+        dict with material and position, the terms from red's point of view whose sum is evaluate, and pieces, a dict
+        mapping each piece type letter of the text names (g, a, e, h, r, c, s) to its (material, position) terms
+        """
+        pieces = {letter: [0, 0] for letter in _PIECE_LETTERS[1:]}
+        squares = self._squares
+        for sq in range(90):
+            code = squares[sq]
+            if code != 0:
+                terms = pieces[_PIECE_LETTERS[abs(code)]]
+                terms[0] += _MATERIAL_SCORES[code][sq]
+                terms[1] += _POSITION_SCORES[code][sq]
+        return {'material': self._material, 'position': self._position,
+                'pieces': {letter: tuple(terms) for letter, terms in pieces.items()}}
+
+    def best_move(self, depth=None, time_ms=None, book=None):
+        """
+        Description:
+        Searches for the best move of the current team with iterative deepening alpha-beta search, without
+        changing the game
+        Parameters:
+        depth - maximum search depth in moves, defaults to XiangqiSearch.DEFAULT_DEPTH if time_ms is not given
+        time_ms - time budget in milliseconds, search stops after the last depth completed within it
+        book - optional XiangqiBook.OpeningBook whose move with the largest weight is played without searching when
+        the position is in it
+        Returns:
+        (src, dest) tuple of algebraic notation strings that can be passed to make_move, or None if the game has
+        been won or the current team has no legal moves
+        """
+        if self._game_state != 'UNFINISHED':
+            return None
+        if book is not None:
+            move = book.choose(self)
+            if move is not None:
+                return move
+        # search module builds on this one, so it is imported when first needed
+        from XiangqiSearch import Searcher
+        return Searcher(self).search(depth, time_ms)['move']
+
+    def probe_tablebase(self, tablebases):
+        """
+        Description:
+        Looks up the result of the current position in endgame tablebases
+        Parameters:
+        tablebases - XiangqiTablebase.Tablebases object
+        Returns:
+        tuple of ('win', 'loss' or 'draw' for the current team, number of moves until the losing team has lost or
+        None for a draw), or None if the tablebases do not hold the position
+        """
+        return tablebases.probe(self._squares, self._side)
+
     def get_board(self):
         """
         Description:
-        Method returns current board list
+        Method returns current board as a 10x9 list of lists holding Piece objects, or 0 for empty slots. The list and
+        its Piece objects are built on demand from the flat board, so changes made to them do not affect the game.
+        Text names are the piece type letter and team letter, followed for all but the general by a number counting
+        pieces of that type from rank 1 and file a, eg. g_r, a_r_1
         """
-        return self._board
+        board = [[0] * 9 for row in range(10)]
+        counts = {}
+        for sq in range(90):
+            code = self._squares[sq]
+            if code == 0:
+                continue
+            side = RED if code > 0 else BLACK
+            text_name = _PIECE_LETTERS[abs(code)] + ('_r' if code > 0 else '_b')
+            if abs(code) != GENERAL:
+                counts[code] = counts.get(code, 0) + 1
+                text_name += '_' + str(counts[code])
+            board[sq // 9][sq % 9] = _PIECE_CLASSES[abs(code)](side, sq, text_name)
+        return board
 
     def print_current_board(self):
         """
         Description:
         Method prints current board for game testing
         """
-        for i in range(len(self._board)):
-            for j in range(len(self._board[i])):
-                if self._board[9-i][j] == 0:
-                    print(self._board[9-i][j], end='')
+        board = self.get_board()
+        for i in range(len(board)):
+            for j in range(len(board[i])):
+                if board[9-i][j] == 0:
+                    print(board[9-i][j], end='')
                     print("       ", end='')
-                elif len(self._board[9-i][j].get_text()) == 3:
-                    print(self._board[9-i][j].get_text(), end='')
+                elif len(board[9-i][j].get_text()) == 3:
+                    print(board[9-i][j].get_text(), end='')
                     print("     ", end='')
-                elif len(self._board[9-i][j].get_text()) == 5:
-                    print(self._board[9-i][j].get_text(), end='')
+                elif len(board[9-i][j].get_text()) == 5:
+                    print(board[9-i][j].get_text(), end='')
                     print("   ", end='')
             print()
 
     def make_move(self, src, dest):
         """
         Description:
-        Performs move operation of pieces on board if desired move is valid. Updates game_state, board, in_play list,
-        whose team it is, is_in_check for each team as required
+        Performs move operation of pieces on board if desired move is valid. Updates game_state, board, whose team it
+        is, is_in_check for each team as required
         Parameters:
         src - algebraic notation string for board location of piece to be moved
         dest - algebraic notation string for board location of destination for piece
         Returns:
         True if move was successful, else returns False
         """
-        # Check if game has already been won
-        if self._game_state != 'UNFINISHED':
-            return False
         # Perform input validation
-        if src == dest:
-            return False
-        src_coord = self._input_validation(src)
-        dest_coord = self._input_validation(dest)
-        if (src_coord is False) or (dest_coord is False):
-            return False
-        src_piece = self._board[src_coord[0]][src_coord[1]]
-        dest_piece = self._board[dest_coord[0]][dest_coord[1]]
-        # if source slot contains no piece to move
-        if src_piece == 0:
-            return False
-        # if the piece at source location does not belong to team whose turn it is
-        if src_piece.get_team() != self._current_team:
+        src_sq = square_index(src)
+        dest_sq = square_index(dest)
+        if src_sq is None or dest_sq is None:
             return False
-        # if piece at destination belongs to team whose turn it currently is
-        if dest_piece != 0:
-            if dest_piece.get_team() == self._current_team:
-                return False
+        return self.make_move_sq(src_sq, dest_sq)
 
-        # check if move is valid for specific Piece class
-        valid_list = src_piece.possible_moves(src_coord, self._board)
-        validity = False
-        # find dest_coord in list of valid move coordinates for that piece type
-        for el in valid_list:
-            if el == dest_coord:
-                validity = True
-        if validity is False:
+    def make_move_sq(self, src_sq, dest_sq):
+        """
+        Description:
+        Performs move operation like make_move, for callers that already hold board square indices
+        Parameters:
+        src_sq - board square index (row * 9 + col) of piece to be moved
+        dest_sq - board square index of destination for piece
+        Returns:
+        True if move was successful, else returns False
+        """
+        # Check if game has already been won
+        if self._game_state != 'UNFINISHED':
             return False
 
-        # check if move results in general being in check or does not fix check- if so do not execute move
-        if dest_piece != 0:
-            # remove opponent piece at destination so that it doesnt influence if general is in check
-            self._in_play.remove(dest_piece)
-        if self._move_in_check(src_coord, dest_coord, self._current_team) is True:
-            # move does not fix check
-            print("this move results in team's general being in check - return false")
-            # restore dest_piece back into in play pieces
-            if dest_piece != 0:
-                self._in_play.append(dest_piece)
+        # check move against the legal moves of the current team
+        if dest_sq not in self._legal_moves().get(src_sq, ()):
+            # move is valid for the specific Piece class but does not fix check or results in check
+            if (self._rejected_move_hook is not None and 0 <= src_sq < 90 and
+                    self._squares[src_sq] * self._side > 0 and dest_sq in self._targets[src_sq]):
+                self._rejected_move_hook(self, src_sq, dest_sq)
             return False
-        else:
-            # move made general no longer in check - update check status
-            if self._current_team == 'red':
-                self._red_in_check = False
-            else:
-                self._black_in_check = False
 
         # make move
-        if dest_piece != 0:
-            # set destination piece to captured by defining board location of piece to False
-            dest_piece.update_board_location(False)
-        # update moved piece's location to the destination
-        src_piece.update_board_location(dest)
-        # perform board move
-        self._board[dest_coord[0]][dest_coord[1]] = src_piece
-        self._board[src_coord[0]][src_coord[1]] = 0
-
-        # update turn to opposing team
-        self._current_team = self._change_turn(self._current_team)
-
-        # determine if opposing team is now in check
-        if self._move_in_check(src_coord, dest_coord, self._current_team) is True:
-            if self._current_team == 'red':
-                self._red_in_check = True
-            else:
-                self._black_in_check = True
-            # check if general of opposing team is in checkmate
-            if self._current_team == 'red':
-                # check all valid moves for red team general
-                general_coord = self._input_validation(self._g_r.get_board_location())
-                general_mov_list = self._g_r.possible_moves(general_coord, self.get_board())
+        self.push_move(src_sq, dest_sq)
+
+        # if opposing team is now in check and its general has no legal move, general is in checkmate
+        # if opposing team has no legal moves at all, it is in stalemate
+        # either way the other team wins
+        if self.is_lost() is True:
+            if self._side == RED:
+                self._game_state = "BLACK_WON"
             else:
-                # check all valid moves for black team general
-                general_coord = self._input_validation(self._g_b.get_board_location())
-                general_mov_list = self._g_b.possible_moves(general_coord, self.get_board())
-            rec = True
-            for coord in general_mov_list:
-                # for each of the valid moves, see if the general will have more valid moves when it gets there
-                rec = self._move_in_check(general_coord, coord, self._current_team)
-                if rec is False:
-                    break
-            if rec is True:
-                # general is in checkmate - update game state
-                if self._current_team == 'red':
-                    self._game_state = "BLACK_WON"
-                else:
-                    self._game_state = "RED_WON"
-
-        # check if opposing team is in stalemate
-        for el in self._in_play:
-            # for all pieces in play that belong to opposing team
-            if el.get_team() == self._current_team:
-                # see if piece has valid moves
-                piece_coord = self._input_validation(el.get_board_location())
-                mov_list = el.possible_moves(piece_coord, self._board)
-                # add moves to mov_list_result that don't put general in check
-                mov_list_result = []
-                for el_mov in mov_list:
-                    if self._move_in_check(piece_coord, el_mov, self._current_team) is False:
-                        mov_list_result.append(el_mov)
-                # return true if one of the pieces has at least one valid move
-                if mov_list_result != []:
-                    return True
-        # team is in stalemate so other team wins
-        if self._current_team == 'red':
-            self._game_state = "BLACK_WON"
+                self._game_state = "RED_WON"
         else:
-            self._game_state = "RED_WON"
+            self._game_state = self._repetition_state()
 
         return True
 
-    def _move_in_check(self, src_coord, dest_coord, team):
+    def _repetition_state(self):
+        """
+        Description:
+        Private method that applies the repetition rules and the maximum number of moves to the position just
+        reached. When a position is reached for the third time, a team that gave check with every one of its moves
+        since the previous time loses, then likewise a team that chased an undefended piece with every move, and
+        otherwise the game is drawn
+        Returns:
+        new game_state
+        """
+        plies = self._positions[self._key]
+        if len(plies) >= 3:
+            # moves each team made in the cycle between the last two times the position was reached
+            moves = (plies[-1] - plies[-2]) // 2
+            for streaks in (self._check_streaks, self._chase_streaks):
+                red = streaks[RED] >= moves
+                black = streaks[BLACK] >= moves
+                if red is True and black is False:
+                    return "BLACK_WON"
+                if black is True and red is False:
+                    return "RED_WON"
+            return "DRAW"
+        if self._max_moves is not None and len(self._undo) >= self._max_moves:
+            return "DRAW"
+        return "UNFINISHED"
+
+    def push_move(self, src_sq, dest_sq):
+        """
+        Description:
+        Makes a move without validating it or updating game_state, recording what is needed to take it back with
+        pop_move. Meant for searches and what-if analysis that make and take back many moves
+        Parameters:
+        src_sq - board square index of piece to be moved, which must belong to the current team
+        dest_sq - board square index of destination, which must be one of the piece's legal moves
+        """
+        squares = self._squares
+        src_code = squares[src_sq]
+        dest_code = squares[dest_sq]
+        side = RED if src_code > 0 else BLACK
+        # undo record holds everything the move changes that can not be recomputed cheaply
+        self._undo.append((src_sq, dest_sq, dest_code, self._legal, self._game_state, self._key, self._positions,
+                           self._check_streaks[side], self._chase_streaks[side]))
+        # perform board move
+        self._set_squares(((dest_sq, src_code), (src_sq, 0)))
+        if src_code == GENERAL or src_code == -GENERAL:
+            self._generals[side] = dest_sq
+        # update turn to opposing team
+        self._side = -self._side
+        self._key ^= _ZOBRIST_BLACK
+        self._legal = None
+
+        # record the new position and whether the move checked or chased, for the repetition rules
+        if dest_code != 0:
+            self._positions = {}
+        plies = self._positions.get(self._key)
+        if plies is None:
+            self._positions[self._key] = [len(self._undo)]
+        else:
+            plies.append(len(self._undo))
+        if self._general_attacked(-side) is True:
+            self._check_streaks[side] += 1
+        else:
+            self._check_streaks[side] = 0
+        if self._chases(dest_sq, side) is True:
+            self._chase_streaks[side] += 1
+        else:
+            self._chase_streaks[side] = 0
+
+    def _chases(self, sq, side):
+        """
+        Description:
+        Private method to determine if a piece threatens an undefended opposing piece other than a General or
+        Soldier, which repeated every move is a perpetual chase
+        Parameters:
+        sq - board square index of piece
+        side - sign of team of piece
+        Returns:
+        True if piece chases an opposing piece, False otherwise
+        """
+        squares = self._squares
+        for el in self._targets[sq]:
+            code = squares[el] * side
+            if code < 0 and code != -GENERAL and code != -SOLDIER and self._defended(el) is False:
+                return True
+        return False
+
+    def _defended(self, sq):
+        """
+        Description:
+        Private method to determine if a piece is protected, that is if a piece of its own team could capture on its
+        square were it taken by an opposing piece. The attack maps can not answer this, since no piece can move onto
+        a square held by its own team, so the moves of the nearby team members are generated with the piece
+        temporarily changed to the opposing team
+        Parameters:
+        sq - board square index of piece
+        Returns:
+        True if piece is protected, False otherwise
+        """
+        squares = self._squares
+        code = squares[sq]
+        side = RED if code > 0 else BLACK
+        # team members whose moves could include the square
+        defenders = self._potential_attackers(sq, -side)
+        if not defenders:
+            return False
+        occupancy = self._occupancy
+        result = False
+        squares[sq] = -code
+        for el in defenders:
+            if sq in _PIECE_CLASSES[squares[el] * side].moves_from(el, squares, occupancy):
+                result = True
+                break
+        squares[sq] = code
+        return result
+
+    def pop_move(self):
+        """
+        Description:
+        Takes back the most recent move made by push_move or make_move, restoring the board, game_state and whose
+        turn it is
+        Returns:
+        tuple of (src_sq, dest_sq) board square indices of the move taken back, or None if no moves have been made
+        """
+        if not self._undo:
+            return None
+        plies = self._positions[self._key]
+        plies.pop()
+        if not plies:
+            del self._positions[self._key]
+        src_sq, dest_sq, dest_code, legal, game_state, key, positions, check_streak, chase_streak = self._undo.pop()
+        src_code = self._squares[dest_sq]
+        # put moved piece back and restore captured piece, if any
+        self._set_squares(((src_sq, src_code), (dest_sq, dest_code)))
+        side = RED if src_code > 0 else BLACK
+        if src_code == GENERAL or src_code == -GENERAL:
+            self._generals[side] = src_sq
+        self._side = -self._side
+        self._key = key
+        self._legal = legal
+        self._game_state = game_state
+        self._positions = positions
+        self._check_streaks[side] = check_streak
+        self._chase_streaks[side] = chase_streak
+        return src_sq, dest_sq
+
+    def get_move_history(self):
+        """
+        Description:
+        Method returns the moves made so far, which replayed with push_move on a new game reach the current position
+        Returns:
+        list of (src_sq, dest_sq) tuples of board square indices, oldest first
+        """
+        return [(el[0], el[1]) for el in self._undo]
+
+    def undo_move(self):
         """
         Description:
-        Private method to determine if move causes check condition
+        Takes back the most recent move, including a move that won the game
+        Returns:
+        True if a move was taken back, False if no moves have been made
+        """
+        return self.pop_move() is not None
+
+    def _legal_moves(self):
+        """
+        Description:
+        Private method that generates the legal moves of the current team in a single pass over its pieces, and
+        caches them until the next move
+        Returns:
+        dict mapping source square index to list of legal destination square indices, for each piece of the current
+        team with at least one legal move
+        """
+        legal = self._legal
+        if legal is not None:
+            return legal
+        # positions reached before, by this game or any other sharing the table, are not generated again
+        legal = self._table.get_legal(self._key)
+        if legal is None:
+            legal = self._generate_legal()
+            self._table.store_legal(self._key, legal)
+        self._legal = legal
+        return legal
+
+    def _generate_legal(self):
+        """
+        Description:
+        Private method that generates the legal moves of the current team in a single pass over its pieces, without
+        using any cached results
+        Returns:
+        dict mapping source square index to list of legal destination square indices, for each piece of the current
+        team with at least one legal move
+        """
+        legal = {}
+        squares = self._squares
+        targets = self._targets
+        side = self._side
+        general_sq = self._generals.get(side)
+        # opposing pieces that could reach the general are the same for every move that leaves it in place
+        attackers = None
+        if general_sq is not None:
+            attackers = self._potential_attackers(general_sq, side)
+        for sq in range(90):
+            if squares[sq] * side > 0:
+                dest_list = [el for el in targets[sq] if self._move_in_check(sq, el, side, attackers) is False]
+                if dest_list:
+                    legal[sq] = dest_list
+        return legal
+
+    def perft(self, depth, divide=False):
+        """
+        Description:
+        Counts the move sequences of a given length from the current position, for testing and benchmarking move
+        generation. Moves are generated fresh at every node, without the transposition table, and only running out
+        of legal moves ends a line
         Parameters:
-        src_coord - tuple source coord from which move is made
-        dest_coord - tuple destination of move
-        team - team with which to check is in check or not
+        depth - number of moves in each sequence
+        divide - if True, count separately for each legal move of the current team
+        Returns:
+        number of sequences, or if divide is True a dict mapping each (src, dest) tuple of algebraic notation strings
+        to the number of sequences starting with that move
+        """
+        if divide is True:
+            result = {}
+            for src_sq, dest_list in self._generate_legal().items():
+                for dest_sq in dest_list:
+                    self.push_move(src_sq, dest_sq)
+                    result[(SQUARE_NAMES[src_sq], SQUARE_NAMES[dest_sq])] = self._perft(depth - 1)
+                    self.pop_move()
+            return result
+        return self._perft(depth)
+
+    def _perft(self, depth):
+        """
+        Description:
+        Private recursive helper of perft
+        Parameters:
+        depth - number of moves in each sequence
+        Returns:
+        number of sequences of that length from the current position
+        """
+        if depth <= 0:
+            return 1
+        legal = self._generate_legal()
+        if depth == 1:
+            return sum(len(el) for el in legal.values())
+        nodes = 0
+        for src_sq, dest_list in legal.items():
+            for dest_sq in dest_list:
+                self.push_move(src_sq, dest_sq)
+                nodes += self._perft(depth - 1)
+                self.pop_move()
+        return nodes
+
+    def _move_in_check(self, src_sq, dest_sq, side, attackers=None):
+        """
+        Description:
+        Private method to determine if move causes check condition. Only opposing pieces that could reach the
+        general are considered; those whose moves can not be changed by the move are answered from the attack maps,
+        and the rest are regenerated with the move temporarily made
+        Parameters:
+        src_sq - board square index from which move is made
+        dest_sq - board square index of move destination
+        side - sign of team with which to check is in check or not
+        attackers - optional list from _potential_attackers for the general's current square, reused by callers
+        testing many moves of the same position
         Returns:
         True of general is in check of that team
         False otherwise
         """
-        src_piece = self._board[src_coord[0]][src_coord[1]]
-        dest_piece = self._board[dest_coord[0]][dest_coord[1]]
-        # check if move results in general being in check
+        squares = self._squares
+        src_code = squares[src_sq]
+        if src_code == GENERAL * side:
+            general_sq = dest_sq
+            attackers = None
+        else:
+            general_sq = self._generals.get(side)
+            if general_sq is None:
+                return False
+        if attackers is None:
+            attackers = self._potential_attackers(general_sq, side)
+        if not attackers:
+            return False
+        targets = self._targets
+        dest_code = squares[dest_sq]
+        occupancy = self._occupancy
+        ranks, files = occupancy
+        src_row, src_col = divmod(src_sq, 9)
+        dest_row, dest_col = divmod(dest_sq, 9)
         # temporarily move piece out of way and into new location
-        self._board[src_coord[0]][src_coord[1]] = 0
-        self._board[dest_coord[0]][dest_coord[1]] = src_piece
-
-        # iterate over all pieces currently in play
-        for piece in self._in_play:
-            # for all pieces of opposing team
-            if piece.get_team() != team:
-                loc = piece.get_board_location()
-                loc_coord = self._input_validation(loc)
-                # at the coordinate location of that piece, determine all possible move coordinates and
-                # iterate through each one
-                all_moves = piece.possible_moves(loc_coord, self.get_board())
-                if all_moves != []:
-                    for coord in all_moves:
-                        # if the piece at this coordinate is the general of the team
-                        if team == 'red':
-                            if self._board[coord[0]][coord[1]] == self._g_r:
-                                self._board[dest_coord[0]][dest_coord[1]] = dest_piece
-                                self._board[src_coord[0]][src_coord[1]] = src_piece
-                                return True
-                        else:
-                            if self._board[coord[0]][coord[1]] == self._g_b:
-                                self._board[dest_coord[0]][dest_coord[1]] = dest_piece
-                                self._board[src_coord[0]][src_coord[1]] = src_piece
-                                return True
+        squares[src_sq] = 0
+        squares[dest_sq] = src_code
+        ranks[src_row] ^= 1 << src_col
+        files[src_col] ^= 1 << src_row
+        if dest_code == 0:
+            ranks[dest_row] ^= 1 << dest_col
+            files[dest_col] ^= 1 << dest_row
+        result = False
+        for sq in attackers:
+            # piece is captured by the move
+            if sq == dest_sq:
+                continue
+            near = _NEAR_SETS[sq]
+            line = _LINE_SETS[sq]
+            code = squares[sq]
+            if src_sq in near or dest_sq in near or (code in _SLIDERS and (src_sq in line or dest_sq in line)):
+                # moves of this piece can be changed by the move, so regenerate them
+                if general_sq in _PIECE_CLASSES[-code * side].moves_from(sq, squares, occupancy):
+                    result = True
+                    break
+            elif general_sq in targets[sq]:
+                result = True
+                break
         # restore proper pieces back to original positions
-        self._board[dest_coord[0]][dest_coord[1]] = dest_piece
-        self._board[src_coord[0]][src_coord[1]] = src_piece
-        return False
+        squares[dest_sq] = dest_code
+        squares[src_sq] = src_code
+        ranks[src_row] ^= 1 << src_col
+        files[src_col] ^= 1 << src_row
+        if dest_code == 0:
+            ranks[dest_row] ^= 1 << dest_col
+            files[dest_col] ^= 1 << dest_row
+        return result
 
-    def _input_validation(self, slot):
+    def _potential_attackers(self, sq, side):
         """
         Description:
-        Private method that checks if slot is a valid slot on the game board and converts from algebraic notation
-        to coordinate notation for specific elements within board list
+        Private method that lists the opposing pieces whose moves could include a square: Chariots and Cannons on its
+        row or column, and any piece within two rows and columns of it
         Parameters:
-        slot - string of slot position to be validated eg. a1
+        sq - board square index
+        side - sign of team the square belongs to
         Returns:
-        returns Returns tuple of board list coordinates if it is valid input, else returns False
+        list of square indices of those opposing pieces
         """
-        # if input is 2 characters
-        if len(slot) == 2:
-            is_num = False
-            # check if second character is number
-            for i in range(10):
-                if slot[1] == str(i):
-                    is_num = True
-            if is_num is False:
-                return is_num
-            col_pos = ord(slot[0]) - 97
-            row_pos = int(slot[1]) - 1
-            # check if col_pos falls in correct board range
-            if col_pos > 8 or col_pos < 0:
-                return False
-            # check if row_pos falls in correct board range
-            if row_pos >= 10 or row_pos < 0:
-                return False
-            board_pos = (row_pos, col_pos)
-            return board_pos
-        # if input is 3 characters
-        elif len(slot) == 3:
-            col_pos = ord(slot[0]) - 97
-            # ensure values for row pos are equal to 10
-            if slot[1] != '1':
-                return False
-            if slot[2] != '0':
-                return False
-            # ensure col_pos falls in correct range
-            if col_pos > 8 or col_pos < 0:
-                return False
-            row_pos = 9
-            board_pos = (row_pos, col_pos)
-            return board_pos
-        else:
+        squares = self._squares
+        result = [el for el in _NEAR_SQUARES[sq] if squares[el] * side < 0]
+        for el in _LINE_SQUARES[sq]:
+            if squares[el] in _SLIDERS and squares[el] * side < 0:
+                result.append(el)
+        return result
+
+    def _general_attacked(self, side):
+        """
+        Description:
+        Private method to determine if any opposing piece can move onto the general of a team
+        Parameters:
+        side - sign of team whose general is checked
+        Returns:
+        True if general of that team is attacked, False otherwise
+        """
+        general_sq = self._generals.get(side)
+        if general_sq is None:
             return False
+        return self._attack_counts[-side][general_sq] > 0
+
+    def _affected_pieces(self, changed):
+        """
+        Description:
+        Private method that finds the pieces whose possible moves can depend on the contents of some squares
+        Parameters:
+        changed - iterable of board square indices
+        Returns:
+        set of square indices of those pieces, including any piece on the changed squares themselves
+        """
+        squares = self._squares
+        affected = set(changed)
+        for el in changed:
+            for sq in _NEAR_SQUARES[el]:
+                if squares[sq] != 0:
+                    affected.add(sq)
+            for sq in _LINE_SQUARES[el]:
+                if squares[sq] in _SLIDERS:
+                    affected.add(sq)
+        return affected
+
+    def _set_squares(self, changes):
+        """
+        Description:
+        Private method that writes piece codes to the board and updates the attack maps of every piece affected
+        Parameters:
+        changes - tuple of (square index, signed piece code) pairs
+        """
+        squares = self._squares
+        targets = self._targets
+        attack_counts = self._attack_counts
+        occupancy = self._occupancy
+        ranks, files = occupancy
+        key = self._key
+        affected = self._affected_pieces([el[0] for el in changes])
+        # remove the moves of affected pieces from the attack counts
+        for sq in affected:
+            counts = attack_counts[RED if squares[sq] > 0 else BLACK]
+            for el in targets[sq]:
+                counts[el] -= 1
+        material = self._material
+        position = self._position
+        for sq, code in changes:
+            key ^= _ZOBRIST_PIECES[squares[sq]][sq] ^ _ZOBRIST_PIECES[code][sq]
+            material += _MATERIAL_SCORES[code][sq] - _MATERIAL_SCORES[squares[sq]][sq]
+            position += _POSITION_SCORES[code][sq] - _POSITION_SCORES[squares[sq]][sq]
+            if (squares[sq] == 0) != (code == 0):
+                row, col = divmod(sq, 9)
+                ranks[row] ^= 1 << col
+                files[col] ^= 1 << row
+            squares[sq] = code
+        self._key = key
+        self._material = material
+        self._position = position
+        # regenerate moves of affected pieces now on the board
+        for sq in affected:
+            code = squares[sq]
+            if code == 0:
+                targets[sq] = ()
+            else:
+                new_targets = _PIECE_CLASSES[abs(code)].moves_from(sq, squares, occupancy)
+                targets[sq] = new_targets
+                counts = attack_counts[RED if code > 0 else BLACK]
+                for el in new_targets:
+                    counts[el] += 1
+
+
+class TranspositionTable:
+    """
+    Represents a fixed-size table of results memoized by position Zobrist key. Each key maps to one slot; when two
+    positions share a slot, an entry stored during the current search generation with a deeper score is kept, and
+    anything else is replaced
+    """
+    # bound types of stored scores
+    EXACT = 0
+    LOWER_BOUND = 1
+    UPPER_BOUND = 2
+
+    def __init__(self, size=1 << 16):
+        """
+        Initializes TranspositionTable object with room for size entries, rounded down to a power of two. An entry
+        holding the legal moves of a position takes about 2 KB, so a full table of the default size takes about 130 MB
+        """
+        slots = 1
+        while slots * 2 <= size:
+            slots *= 2
+        self._mask = slots - 1
+        # each slot holds None or an entry list of [key, age, depth, score, flag, move, legal], where depth
+        # is -1 until a score is stored
+        self._entries = [None] * slots
+        self._age = 0
+
+    def __len__(self):
+        """
+        Description:
+        Method returns number of slots in the table
+        """
+        return self._mask + 1
+
+    def clear(self):
+        """
+        Description:
+        Method empties every slot of the table
+        """
+        self._entries = [None] * (self._mask + 1)
+
+    def new_search(self):
+        """
+        Description:
+        Method starts a new search generation, after which entries from older generations are replaced first
+        """
+        self._age += 1
+
+    def _slot(self, key, depth):
+        """
+        Description:
+        Private method that returns the entry for key, replacing the entry in its slot if the replacement policy
+        allows it
+        Parameters:
+        key - Zobrist key of position
+        depth - search depth of the result about to be stored, -1 for results that do not come from a search
+        Returns:
+        entry list for key, or None if the slot holds an entry that must be kept
+        """
+        index = key & self._mask
+        entry = self._entries[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        if entry is None or entry[1] != self._age or depth >= entry[2]:
+            entry = [key, self._age, -1, 0, self.EXACT, None, None]
+            self._entries[index] = entry
+            return entry
+        return None
+
+    def get_legal(self, key):
+        """
+        Description:
+        Method returns the memoized legal moves of a position
+        Parameters:
+        key - Zobrist key of position
+        Returns:
+        dict mapping source square index to list of destination square indices, or None if not memoized
+        """
+        entry = self._entries[key & self._mask]
+        if entry is not None and entry[0] == key:
+            return entry[6]
+        return None
+
+    def store_legal(self, key, legal):
+        """
+        Description:
+        Method memoizes the legal moves of a position
+        Parameters:
+        key - Zobrist key of position
+        legal - dict mapping source square index to list of destination square indices, must not be changed after
+        """
+        entry = self._slot(key, -1)
+        if entry is not None:
+            entry[6] = legal
+
+    def get_score(self, key):
+        """
+        Description:
+        Method returns the memoized evaluation score of a position
+        Parameters:
+        key - Zobrist key of position
+        Returns:
+        tuple of (depth, score, flag, move), or None if no score is memoized
+        """
+        entry = self._entries[key & self._mask]
+        if entry is not None and entry[0] == key and entry[2] >= 0:
+            return entry[2], entry[3], entry[4], entry[5]
+        return None
+
+    def store_score(self, key, depth, score, flag, move):
+        """
+        Description:
+        Method memoizes the evaluation score of a position, unless a deeper score for it is already stored
+        Parameters:
+        key - Zobrist key of position
+        depth - remaining search depth the score was computed with, 0 for a static evaluation
+        score - score from the point of view of the team to move
+        flag - EXACT, LOWER_BOUND or UPPER_BOUND
+        move - best move found, or None
+        """
+        entry = self._slot(key, depth)
+        if entry is not None and depth >= entry[2]:
+            entry[1] = self._age
+            entry[2] = depth
+            entry[3] = score
+            entry[4] = flag
+            entry[5] = move
+
+
+class GamePool:
+    """
+    Represents a pool of finished XiangqiGame objects kept for reuse, so games that are started and ended at a high
+    rate are reset instead of constructed. acquire and release may be called from different threads
+    """
+    def __init__(self, size=64, table=None):
+        """
+        Initializes GamePool object keeping up to size idle games, which memoize results in table, a
+        TranspositionTable which defaults to the one shared by all games
+        """
+        self._size = size
+        self._table = table
+        self._idle = []
+        # guards the idle list, so a game is never handed out twice
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Description:
+        Method returns number of idle games in the pool
+        """
+        return len(self._idle)
 
-    def _change_turn(self, curr_team):
+    def acquire(self, fen=None):
         """
         Description:
-        Private method that changes turn by updating self._current_team to team other than curr_team
-        Parameter:
-        curr_team - string of team to be changed from
+        Returns a game starting from the position of FEN string fen, or the standard starting position if fen is
+        None, reusing an idle game when there is one
+        Parameters:
+        fen - FEN string of position, in the format accepted by XiangqiGame.from_fen, or None
         Returns:
-        updated self._current_team
+        XiangqiGame object with no maximum number of moves and the default rejected move hook
+        Raises:
+        ValueError if fen is not a valid FEN string
         """
-        if curr_team == 'red':
-            self._current_team = 'black'
-        elif curr_team == 'black':
-            self._current_team = 'red'
-        return self._current_team
+        with self._lock:
+            game = self._idle.pop() if self._idle else None
+        if game is None:
+            return XiangqiGame(self._table, fen)
+        try:
+            game.reset(fen)
+        except ValueError:
+            # the game is left unchanged by a FEN string that is not valid, so it stays idle
+            self.release(game)
+            raise
+        game.set_max_moves(None)
+        game.set_rejected_move_hook(print_rejected_move)
+        return game
+
+    def release(self, game):
+        """
+        Description:
+        Returns a game to the pool once it is no longer used. Games beyond the pool's size are left to be freed
+        Parameters:
+        game - XiangqiGame object from acquire
+        """
+        with self._lock:
+            if len(self._idle) < self._size:
+                self._idle.append(game)
 
 
 class Piece:
     """Represents a Piece in the game Xiangqi"""
+    # piece type code stored on the flat board, defined by each child class
+    code = 0
+    # pieces hold only their team sign, board square index and text name, without a per-instance __dict__
+    __slots__ = ('_side', '_square', '_text_name')
+
     def __init__(self, team, board_loc, text_name):
         """
-        Initializes Piece object with team, current board location, and text name
+        Initializes Piece object with team as a string or team sign (RED or BLACK), current board location as an
+        algebraic notation string or board square index, and text name
         """
-        self._team = team
-        self._board_location = board_loc
+        self._side = _SIDES.get(team, team)
+        self._square = None
+        self.update_board_location(board_loc)
         self._text_name = text_name
 
     def get_text(self):
@@ -394,23 +1542,43 @@ class Piece:
         Description:
         Method returns team of piece object
         """
-        return self._team
+        return _TEAMS[self._side]
+
+    def get_side(self):
+        """
+        Description:
+        Method returns team of piece object as its sign, RED or BLACK
+        """
+        return self._side
 
     def get_board_location(self):
         """
         Description:
-        Method returns current board location
+        Method returns current board location as an algebraic notation string, or False if the piece was captured
         """
-        return self._board_location
+        if self._square is None:
+            return False
+        return SQUARE_NAMES[self._square]
+
+    def get_square(self):
+        """
+        Description:
+        Method returns current board location as a board square index (row * 9 + col), or None if the piece was
+        captured
+        """
+        return self._square
 
     def update_board_location(self, dest):
         """
         Description:
         Method updates current board location to new dest
         Parameters:
-        dest - string board slot position, must be valid
+        dest - string board slot position or board square index, must be valid, or False if the piece was captured
         """
-        self._board_location = dest
+        if dest is False:
+            self._square = None
+        else:
+            self._square = dest if isinstance(dest, int) else square_index(dest)
 
     def is_on_the_board(self, coord):
         """
@@ -429,555 +1597,465 @@ class Piece:
             return False
         return True
 
+    def possible_moves(self, src_coord, board):
+        """
+        Description:
+        returns a list of tuples of all possible moves that can be made from current location coordinates
+        Parameters:
+        src_coord - tuple of source board slot coordinates
+        board - 10x9 board list that contains piece objects, as returned by XiangqiGame.get_board
+        Returns:
+        list of tuples of all possible moves for this Piece class from the src_coord location
+        """
+        src_sq = src_coord[0] * 9 + src_coord[1]
+        return [divmod(sq, 9) for sq in self.moves_from(src_sq, self._flat_board(src_sq, board))]
+
+    def possible_captures(self, src_coord, board):
+        """
+        Description:
+        returns a list of tuples of the possible moves from current location coordinates that capture an opponent
+        Parameters:
+        src_coord - tuple of source board slot coordinates
+        board - 10x9 board list that contains piece objects, as returned by XiangqiGame.get_board
+        Returns:
+        list of tuples of the capturing moves for this Piece class from the src_coord location
+        """
+        src_sq = src_coord[0] * 9 + src_coord[1]
+        return [divmod(sq, 9) for sq in self.captures_from(src_sq, self._flat_board(src_sq, board))]
+
+    def _flat_board(self, src_sq, board):
+        """
+        Description:
+        Private method that converts a board of piece objects to a flat list of signed piece codes, with this piece
+        on src_sq
+        """
+        squares = [0] * 90
+        for row in range(10):
+            for col in range(9):
+                piece = board[row][col]
+                if piece != 0:
+                    squares[row * 9 + col] = piece.code * piece._side
+        squares[src_sq] = self.code * self._side
+        return squares
+
 
 class General(Piece):
     """Represents a General Piece"""
+    code = GENERAL
+    __slots__ = ()
 
-    def _is_valid(self, possible_list, board):
+    @staticmethod
+    def moves_from(src_sq, squares, occupancy=None):
         """
         Description:
-        Private method that determines if moves are valid for this piece type with the current context of board
+        returns a list of all possible destination squares for a General at src_sq on the flat board
         Parameters:
-        possible_list: list of tuples of all possible moves for piece type
-        board - current board layout with pieces as a list from XiangqiGame method
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares, not needed by this piece type
         Returns:
-        valid_list of all valid moves with respect to the board
+        list of square indices the piece can move to
         """
-        team = self.get_team()
-        valid_list = []
-        result = []
-        # valid list will contain only those moves that exist within the castle of team
-        for el in possible_list:
-            if team == 'black':
-                if (el[0] <= 9) and (el[0] >= 7):
-                    if (el[1] <= 5) and (el[1] >= 3):
-                        valid_list.append(el)
-            if team == 'red':
-                if (el[0] <= 2) and (el[0] >= 0):
-                    if (el[1] <= 5) and (el[1] >= 3):
-                        valid_list.append(el)
-        for el in valid_list:
-            # if destination is empty, add coord to result list
-            if board[el[0]][el[1]] == 0:
-                result.append(el)
-            # if destination has opponent in it, add coord to result list
-            elif board[el[0]][el[1]].get_team() != team:
-                result.append(el)
-        return result
+        # only moves that exist within the castle, onto an empty slot or an opponent
+        if squares[src_sq] > 0:
+            return [sq for sq in _GENERAL_MOVES[RED][src_sq] if squares[sq] <= 0]
+        return [sq for sq in _GENERAL_MOVES[BLACK][src_sq] if squares[sq] >= 0]
 
-    def possible_moves(self, src_coord, board):
+    @staticmethod
+    def captures_from(src_sq, squares, occupancy=None):
         """
         Description:
-        returns a list of tuples of all possible moves that can be made from current location coordinates
+        returns a list of the destination squares of the moves of a General at src_sq that capture an opponent
         Parameters:
-        src_coord - tuple of source board slot coordinates
-        board - current board list that contains piece objects
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares, not needed by this piece type
         Returns:
-        list of tuples of all possible moves for this Piece class from the src_coord location validated with is_valid
-        method
+        list of square indices the piece can capture on
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        possible_list = [(y+1, x), (y-1, x), (y, x-1), (y, x+1)]
-
-        return self._is_valid(possible_list, board)
+        if squares[src_sq] > 0:
+            return [sq for sq in _GENERAL_MOVES[RED][src_sq] if squares[sq] < 0]
+        return [sq for sq in _GENERAL_MOVES[BLACK][src_sq] if squares[sq] > 0]
 
 
 class Advisor(Piece):
     """Represents an Advisor Piece"""
+    code = ADVISOR
+    __slots__ = ()
 
-    def _is_valid(self, possible_list, board):
+    @staticmethod
+    def moves_from(src_sq, squares, occupancy=None):
         """
         Description:
-        Private method that determines if moves are valid for this piece type with the current context of board
+        returns a list of all possible destination squares for an Advisor at src_sq on the flat board
         Parameters:
-        possible_list: list of tuples of all possible moves for piece type
-        board - current board layout with pieces as a list from XiangqiGame method
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares, not needed by this piece type
         Returns:
-        valid_list of all valid moves with respect to the board
+        list of square indices the piece can move to
         """
-        team = self.get_team()
-        valid_list = []
-        result = []
-        # valid list will contain only those moves that exist within the castle of team
-        for el in possible_list:
-            if team == 'black':
-                if (el[0] <= 9) and (el[0] >= 7):
-                    if (el[1] <= 5) and (el[1] >= 3):
-                        valid_list.append(el)
-            if team == 'red':
-                if (el[0] <= 2) and (el[0] >= 0):
-                    if (el[1] <= 5) and (el[1] >= 3):
-                        valid_list.append(el)
-        for el in valid_list:
-            # if destination is empty, add coord to result list
-            if board[el[0]][el[1]] == 0:
-                result.append(el)
-            # if destination has opponent in it, add coord to result list
-            elif board[el[0]][el[1]].get_team() != team:
-                result.append(el)
-        return result
+        # only moves that exist within the castle, onto an empty slot or an opponent
+        if squares[src_sq] > 0:
+            return [sq for sq in _ADVISOR_MOVES[RED][src_sq] if squares[sq] <= 0]
+        return [sq for sq in _ADVISOR_MOVES[BLACK][src_sq] if squares[sq] >= 0]
 
-    def possible_moves(self, src_coord, board):
+    @staticmethod
+    def captures_from(src_sq, squares, occupancy=None):
         """
         Description:
-        returns a list of tuples of all possible moves that can be made from current location coordinates
+        returns a list of the destination squares of the moves of an Advisor at src_sq that capture an opponent
         Parameters:
-        src_coord - tuple of source board slot coordinates
-        board - current board list that contains piece objects
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares, not needed by this piece type
         Returns:
-        list of tuples of all possible moves for this Piece class from the src_coord location validated with is_valid
-        method
+        list of square indices the piece can capture on
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        possible_list = [(y+1, x+1), (y-1, x+1), (y-1, x-1), (y+1, x-1)]
-
-        return self._is_valid(possible_list, board)
+        if squares[src_sq] > 0:
+            return [sq for sq in _ADVISOR_MOVES[RED][src_sq] if squares[sq] < 0]
+        return [sq for sq in _ADVISOR_MOVES[BLACK][src_sq] if squares[sq] > 0]
 
 
 class Elephant(Piece):
     """Represents an Elephant Piece"""
+    code = ELEPHANT
+    __slots__ = ()
 
-    def _is_valid(self, possible_list, board, opp_list, src_coord):
+    @staticmethod
+    def moves_from(src_sq, squares, occupancy=None):
         """
         Description:
-        Private method that determines if moves are valid for this piece type with the current context of board
+        returns a list of all possible destination squares for an Elephant at src_sq on the flat board
         Parameters:
-        possible_list: list of tuples of all possible moves for piece type
-        board - current board layout with pieces as a list from XiangqiGame method
-        opp_list - list of tuples for coordinates of potential blocking pieces
-        src_coord - tuple coordinates for board location
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares, not needed by this piece type
         Returns:
-        valid_list of all valid moves with respect to the board
+        list of square indices the piece can move to
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        team = self.get_team()
-        opp_list_ob = []
-        result = []
-        for el in opp_list:
-            on_board = self.is_on_the_board(el)
-            if on_board is True:
-                # append new list which represents blocking coordinates that are on the board
-                opp_list_ob.append(el)
-
-        for el in opp_list_ob:
-            # if blocking coordinate has pieces there - remove appropriate valid moves
-            if board[el[0]][el[1]] != 0:
-                if y > el[0] and x > el[1]:
-                    possible_list.remove((y - 2, x - 2))
-                elif y < el[0] and x < el[1]:
-                    possible_list.remove((y + 2, x + 2))
-                elif y < el[0] and x > el[1]:
-                    possible_list.remove((y + 2, x - 2))
-                elif y > el[0] and x < el[1]:
-                    possible_list.remove((y - 2, x + 2))
-
-        # remove any destination coordinates that have pieces of the same team
-        for el in possible_list:
-            # if the coordinate exists on the board
-            # red team
-            if team == 'red':
-                if self.is_on_the_board(el) is True and (el[0] < 5):
-                    # if destination is empty, add coord to result list
-                    if board[el[0]][el[1]] == 0:
-                        result.append(el)
-                    # if destination has opponent in it, add coord to result list
-                    elif board[el[0]][el[1]].get_team() != team:
-                        result.append(el)
-            # black team
-            else:
-                if self.is_on_the_board(el) is True and (el[0] > 4):
-                    # if destination is empty, add coord to result list
-                    if board[el[0]][el[1]] == 0:
-                        result.append(el)
-                    # if destination has opponent in it, add coord to result list
-                    elif board[el[0]][el[1]].get_team() != team:
-                        result.append(el)
-        return result
+        # elephants stay on their own side of the river, and are blocked by a piece on the eye square between
+        if squares[src_sq] > 0:
+            return [sq for sq, eye in _ELEPHANT_MOVES[RED][src_sq] if squares[eye] == 0 and squares[sq] <= 0]
+        return [sq for sq, eye in _ELEPHANT_MOVES[BLACK][src_sq] if squares[eye] == 0 and squares[sq] >= 0]
 
-    def possible_moves(self, src_coord, board):
+    @staticmethod
+    def captures_from(src_sq, squares, occupancy=None):
         """
         Description:
-        returns a list of tuples of all possible moves that can be made from current location coordinates
+        returns a list of the destination squares of the moves of an Elephant at src_sq that capture an opponent
         Parameters:
-        src_coord - tuple of source board slot coordinates
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares, not needed by this piece type
         Returns:
-        list of tuples of all possible moves for this Piece class from the src_coord location validated with is_valid
-        method
+        list of square indices the piece can capture on
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        possible_list = [(y + 2, x + 2), (y + 2, x - 2), (y - 2, x - 2), (y - 2, x + 2)]
-        # list of all possible locations where opponents can block move
-        opp_list = [(y + 1, x + 1), (y - 1, x + 1), (y - 1, x - 1), (y + 1, x - 1)]
-        return self._is_valid(possible_list, board, opp_list, src_coord)
+        if squares[src_sq] > 0:
+            return [sq for sq, eye in _ELEPHANT_MOVES[RED][src_sq] if squares[eye] == 0 and squares[sq] < 0]
+        return [sq for sq, eye in _ELEPHANT_MOVES[BLACK][src_sq] if squares[eye] == 0 and squares[sq] > 0]
 
 
 class Horse(Piece):
     """Represents a Horse Piece"""
+    code = HORSE
+    __slots__ = ()
 
-    def _is_valid(self, possible_list, board, opp_list, src_coord):
+    @staticmethod
+    def moves_from(src_sq, squares, occupancy=None):
         """
         Description:
-        Private method that determines if moves are valid for this piece type with the current context of board
+        returns a list of all possible destination squares for a Horse at src_sq on the flat board
         Parameters:
-        possible_list: list of tuples of all possible moves for piece type
-        board - current board layout with pieces as a list from XiangqiGame method
-        src_coord - tuple that represents board coordinate
-        opp_list - list of tuples for coordinates of potential blocking pieces
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares, not needed by this piece type
         Returns:
-        valid_list of all valid moves with respect to the board
+        list of square indices the piece can move to
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        team = self.get_team()
-        opp_list_ob = []
-        result = []
-        for el in opp_list:
-            on_board = self.is_on_the_board(el)
-            if on_board is True:
-                # append new list which represents blocking coordinates that are on the board
-                opp_list_ob.append(el)
-
-        for el in opp_list_ob:
-            # if blocking coordinate has pieces there - remove appropriate valid moves
-            if board[el[0]][el[1]] != 0:
-                if y > el[0]:
-                    possible_list.remove((y - 2, x - 1))
-                    possible_list.remove((y - 2, x + 1))
-                elif y < el[0]:
-                    possible_list.remove((y + 2, x - 1))
-                    possible_list.remove((y + 2, x + 1))
-                elif x > el[1]:
-                    possible_list.remove((y + 1, x - 2))
-                    possible_list.remove((y - 1, x - 2))
-                elif x < el[1]:
-                    possible_list.remove((y + 1, x + 2))
-                    possible_list.remove((y - 1, x + 2))
-
-        # remove any destination coordinates that have pieces of the same team
-        for el in possible_list:
-            # if the coordinate exists on the board
-            if self.is_on_the_board(el) is True:
-                # if destination is empty, add coord to result list
-                if board[el[0]][el[1]] == 0:
-                    result.append(el)
-                # if destination has opponent in it, add coord to result list
-                elif board[el[0]][el[1]].get_team() != team:
-                    result.append(el)
-        return result
+        # moves are blocked by a piece on the leg square next to the horse
+        if squares[src_sq] > 0:
+            return [sq for sq, leg in _HORSE_MOVES[src_sq] if squares[leg] == 0 and squares[sq] <= 0]
+        return [sq for sq, leg in _HORSE_MOVES[src_sq] if squares[leg] == 0 and squares[sq] >= 0]
 
-    def possible_moves(self, src_coord, board):
+    @staticmethod
+    def captures_from(src_sq, squares, occupancy=None):
         """
         Description:
-        returns a list of tuples of all possible moves that can be made from current location coordinates
+        returns a list of the destination squares of the moves of a Horse at src_sq that capture an opponent
         Parameters:
-        src_coord - tuple of source board slot coordinates
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares, not needed by this piece type
         Returns:
-        list of tuples of all possible moves for this Piece class from the src_coord location validated with is_valid
-        method
+        list of square indices the piece can capture on
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        possible_list = [(y + 2, x - 1), (y + 2, x + 1), (y + 1, x + 2), (y - 1, x + 2),
-                         (y - 2, x - 1), (y - 2, x + 1), (y + 1, x - 2), (y - 1, x - 2)]
-        # list of all possible locations where opponents can block move
-        opp_list = [(y + 1, x), (y - 1, x), (y, x - 1), (y, x + 1)]
-        return self._is_valid(possible_list, board, opp_list, src_coord)
+        if squares[src_sq] > 0:
+            return [sq for sq, leg in _HORSE_MOVES[src_sq] if squares[leg] == 0 and squares[sq] < 0]
+        return [sq for sq, leg in _HORSE_MOVES[src_sq] if squares[leg] == 0 and squares[sq] > 0]
 
 
 class Chariot(Piece):
     """Represents a Chariot (rook) Piece"""
+    code = CHARIOT
+    __slots__ = ()
 
-    def _is_valid(self, start_list, board, src_coord):
+    @staticmethod
+    def moves_from(src_sq, squares, occupancy=None):
         """
         Description:
-        Private method that determines if moves are valid for this piece type with the current context of board
+        returns a list of all possible destination squares for a Chariot at src_sq on the flat board
         Parameters:
-        start_list: list of tuples of all possible moves for piece type
-        board - current board layout with pieces as a list from XiangqiGame method
-        src_coord - tuple that represents board coordinate
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares as returned by _line_occupancy, built from squares if
+        None
         Returns:
-        valid_list of all valid moves with respect to the board
+        list of square indices the piece can move to
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        team = self.get_team()
+        if occupancy is None:
+            occupancy = _line_occupancy(squares)
+        side = 1 if squares[src_sq] > 0 else -1
+        row, col = divmod(src_sq, 9)
+        rank = occupancy[0][row]
+        file = occupancy[1][col]
+        rays = _RAYS[src_sq]
         result = []
-        start_list_val = []
-        for el in start_list:
-            # if the coordinate exists on the board
-            if self.is_on_the_board(el) is True:
-                # if destination is empty, add coord to start_list_val
-                if board[el[0]][el[1]] == 0:
-                    start_list_val.append(el)
-                    result.append(el)
-                # if destination has opponent in it, add coord to result list
-                elif board[el[0]][el[1]].get_team() != team:
-                    result.append(el)
-        # for each element in the list that contains the starter coordinate for each direction
-        for el in start_list_val:
-            for i in range(10):
-                j = i + 1
-
-                # depending on starting direction coordinate, define curr_coordinate which is next in line
-                if el[0] > y:
-                    curr_coord = (el[0] + j, el[1])
-                elif el[0] < y:
-                    curr_coord = (el[0] - j, el[1])
-                elif el[1] < x:
-                    curr_coord = (el[0], el[1] - j)
-                elif el[1] > x:
-                    curr_coord = (el[0], el[1] + j)
-                else:
-                    curr_coord = (-1, 0)
-
-                # if this next coordinate in the line is not on the board, break and don't add it to list
-                if self.is_on_the_board(curr_coord) is False:
-                    break
-
-                # if this next coordinate is occupied
-                if board[curr_coord[0]][curr_coord[1]] != 0:
-                    # if this next coordinate in line is filled by team member, break and don't add to list
-                    if board[curr_coord[0]][curr_coord[1]].get_team() == team:
-                        break
-                    elif board[curr_coord[0]][curr_coord[1]].get_team() != team:
-                        result.append(curr_coord)
-                        break
-                # next coordinate is empty
-                else:
-                    result.append(curr_coord)
+        # slide up, down, left and right until the first occupied slot
+        for empties, first, screened, second in (rays[0][file >> (row + 1)], rays[1][file & ((1 << row) - 1)],
+                                                 rays[2][rank & ((1 << col) - 1)], rays[3][rank >> (col + 1)]):
+            result.extend(empties)
+            # capture an opponent, stop in front of a team member
+            if first is not None and squares[first] * side < 0:
+                result.append(first)
         return result
 
-    def possible_moves(self, src_coord, board):
+    @staticmethod
+    def captures_from(src_sq, squares, occupancy=None):
         """
         Description:
-        returns a list of tuples of all possible moves that can be made from current location coordinates
+        returns a list of the destination squares of the moves of a Chariot at src_sq that capture an opponent
         Parameters:
-        src_coord - tuple of source board slot coordinates
-        board - current board list that contains piece objects
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares as returned by _line_occupancy, built from squares if
+        None
         Returns:
-        list of tuples of all possible moves for this Piece class from the src_coord location validated with is_valid
-        method
+        list of square indices the piece can capture on
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        start_list = [(y+1, x), (y-1, x), (y, x-1), (y, x+1)]
-
-        return self._is_valid(start_list, board, src_coord)
+        if occupancy is None:
+            occupancy = _line_occupancy(squares)
+        side = 1 if squares[src_sq] > 0 else -1
+        row, col = divmod(src_sq, 9)
+        rank = occupancy[0][row]
+        file = occupancy[1][col]
+        rays = _RAYS[src_sq]
+        result = []
+        # the first piece in each direction, if it is an opponent
+        for empties, first, screened, second in (rays[0][file >> (row + 1)], rays[1][file & ((1 << row) - 1)],
+                                                 rays[2][rank & ((1 << col) - 1)], rays[3][rank >> (col + 1)]):
+            if first is not None and squares[first] * side < 0:
+                result.append(first)
+        return result
 
 
 class Cannon(Piece):
     """Represents a Cannon Piece"""
+    code = CANNON
+    __slots__ = ()
 
-    def _is_valid(self, start_list, board, src_coord):
+    @staticmethod
+    def moves_from(src_sq, squares, occupancy=None):
         """
         Description:
-        Private method that determines if moves are valid for this piece type with the current context of board
+        returns a list of all possible destination squares for a Cannon at src_sq on the flat board
         Parameters:
-        possible_list: list of tuples of all possible moves for piece type
-        board - current board layout with pieces as a list from XiangqiGame method
-        src_coord - tuple that represents board coordinate
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares as returned by _line_occupancy, built from squares if
+        None
         Returns:
-        valid_list of all valid moves with respect to the board
+        list of square indices the piece can move to
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        team = self.get_team()
+        if occupancy is None:
+            occupancy = _line_occupancy(squares)
+        side = 1 if squares[src_sq] > 0 else -1
+        row, col = divmod(src_sq, 9)
+        rank = occupancy[0][row]
+        file = occupancy[1][col]
+        rays = _RAYS[src_sq]
+        entries = (rays[0][file >> (row + 1)], rays[1][file & ((1 << row) - 1)],
+                   rays[2][rank & ((1 << col) - 1)], rays[3][rank >> (col + 1)])
+        # an opponent directly next to the cannon counts as a jump already taken, both in its own direction and in
+        # every direction checked before it (up, down, left, right order)
+        jumped = [False] * 4
+        adjacent_opponent = False
+        for i in range(3, -1, -1):
+            empties, first, screened, second = entries[i]
+            if not empties and first is not None and squares[first] * side < 0:
+                adjacent_opponent = True
+            jumped[i] = adjacent_opponent
         result = []
-        start_list_val = []
-        jump_left = 0
-        jump_right = 0
-        jump_up = 0
-        jump_down = 0
-        mov_up = False
-        mov_down = False
-        mov_left = False
-        mov_right = False
-        for el in start_list:
-            # tracker for direction on board relative to source coordinate
-            if el[0] > y:
-                mov_up = True
-            elif el[0] < y:
-                mov_down = True
-            elif el[1] < x:
-                mov_left = True
-            elif el[1] > x:
-                mov_right = True
-            # if the coordinate exists on the board
-            if self.is_on_the_board(el) is True:
-                # if destination is empty, add coord to start_list_val and result
-                if board[el[0]][el[1]] == 0:
-                    start_list_val.append(el)
-                    result.append(el)
-                # if destination has piece in it, add to start_list_val but not result
-                elif board[el[0]][el[1]].get_team() != team:
-                    # track that a jump has been performed
-                    if mov_up is True:
-                        jump_up = 1
-                    if mov_down is True:
-                        jump_down = 1
-                    if mov_left is True:
-                        jump_left = 1
-                    if mov_right is True:
-                        jump_right = 1
-                    start_list_val.append(el)
-        # for each element in the list that contains the starter coordinate for each direction
-        for el in start_list_val:
-            for i in range(10):
-                mov_up = False
-                mov_down = False
-                mov_left = False
-                mov_right = False
-                j = i + 1
-
-                # tracker for direction on board relative to source coordinate
-                if el[0] > y:
-                    curr_coord = (el[0] + j, el[1])
-                    mov_up = True
-                elif el[0] < y:
-                    curr_coord = (el[0] - j, el[1])
-                    mov_down = True
-                elif el[1] < x:
-                    curr_coord = (el[0], el[1] - j)
-                    mov_left = True
-                elif el[1] > x:
-                    curr_coord = (el[0], el[1] + j)
-                    mov_right = True
-                else:
-                    curr_coord = (-1, 0)
-
-                # if this next coordinate in the line is not on the board, break and don't add it to list
-                if self.is_on_the_board(curr_coord) is False:
-                    break
-
-                # if this next coordinate is occupied and direction is up from src_coord
-                elif board[curr_coord[0]][curr_coord[1]] != 0 and (mov_up is True):
-                    # if this next coordinate in line is filled by team member, break and don't add to list
-                    if board[curr_coord[0]][curr_coord[1]].get_team() == team and (jump_up == 1):
-                        break
-                    elif board[curr_coord[0]][curr_coord[1]].get_team() != team and (jump_up == 1):
-                        result.append(curr_coord)
-                        break
-                    elif jump_up == 0:
-                        # record that a jump has taken place in this direction
-                        jump_up = 1
-
-                # if this next coordinate is occupied and direction is down from src_coord
-                elif board[curr_coord[0]][curr_coord[1]] != 0 and (mov_down is True):
-                    # if this next coordinate in line is filled by team member, break and don't add to list
-                    if board[curr_coord[0]][curr_coord[1]].get_team() == team and (jump_down == 1):
-                        break
-                    elif board[curr_coord[0]][curr_coord[1]].get_team() != team and (jump_down == 1):
-                        result.append(curr_coord)
-                        break
-                    elif jump_down == 0:
-                        # record that jump has taken place in this direction
-                        jump_down = 1
-
-                # if this next coordinate is occupied and direction is left from src_coord
-                elif board[curr_coord[0]][curr_coord[1]] != 0 and (mov_left is True):
-                    # if this next coordinate in line is filled by team member, break and don't add to list
-                    if board[curr_coord[0]][curr_coord[1]].get_team() == team and (jump_left == 1):
-                        break
-                    elif board[curr_coord[0]][curr_coord[1]].get_team() != team and (jump_left == 1):
-                        result.append(curr_coord)
-                        break
-                    elif jump_left == 0:
-                        # record that jump has taken place in this direction
-                        jump_left = 1
-
-                # if this next coordinate is occupied and direction is right from src_coord
-                elif board[curr_coord[0]][curr_coord[1]] != 0 and (mov_right is True):
-                    # if this next coordinate in line is filled by team member, break and don't add to list
-                    if board[curr_coord[0]][curr_coord[1]].get_team() == team and (jump_right == 1):
-                        break
-                    elif board[curr_coord[0]][curr_coord[1]].get_team() != team and (jump_right == 1):
-                        result.append(curr_coord)
-                        break
-                    elif jump_right == 0:
-                        # record that jump has taken place in this direction
-                        jump_right = 1
-
-                # next coordinate is empty
-                else:
-                    result.append(curr_coord)
+        for i in range(4):
+            empties, first, screened, second = entries[i]
+            if empties:
+                result.extend(empties)
+                if jumped[i] is True:
+                    # capture an opponent at the first piece, stop at a team member
+                    if first is not None and squares[first] * side < 0:
+                        result.append(first)
+                    continue
+            elif first is None or squares[first] * side > 0:
+                # a team member directly next to the cannon blocks that direction entirely
+                continue
+            # empty slots are reachable on either side of the jump, and an opponent on the far side can be captured
+            result.extend(screened)
+            if second is not None and squares[second] * side < 0:
+                result.append(second)
         return result
 
-    def possible_moves(self, src_coord, board):
+    @staticmethod
+    def captures_from(src_sq, squares, occupancy=None):
         """
         Description:
-        returns a list of tuples of all possible moves that can be made from current location coordinates
+        returns a list of the destination squares of the moves of a Cannon at src_sq that capture an opponent
         Parameters:
-        src_coord - tuple of source board slot coordinates
-        board - current board list that contains piece objects
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares as returned by _line_occupancy, built from squares if
+        None
         Returns:
-        list of tuples of all possible moves for this Piece class from the src_coord location validated with is_valid
-        method
+        list of square indices the piece can capture on
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        start_list = [(y+1, x), (y-1, x), (y, x-1), (y, x+1)]
-
-        return self._is_valid(start_list, board, src_coord)
+        if occupancy is None:
+            occupancy = _line_occupancy(squares)
+        side = 1 if squares[src_sq] > 0 else -1
+        row, col = divmod(src_sq, 9)
+        rank = occupancy[0][row]
+        file = occupancy[1][col]
+        rays = _RAYS[src_sq]
+        entries = (rays[0][file >> (row + 1)], rays[1][file & ((1 << row) - 1)],
+                   rays[2][rank & ((1 << col) - 1)], rays[3][rank >> (col + 1)])
+        # same jump rules as moves_from, keeping only the moves onto an opponent
+        jumped = [False] * 4
+        adjacent_opponent = False
+        for i in range(3, -1, -1):
+            empties, first, screened, second = entries[i]
+            if not empties and first is not None and squares[first] * side < 0:
+                adjacent_opponent = True
+            jumped[i] = adjacent_opponent
+        result = []
+        for i in range(4):
+            empties, first, screened, second = entries[i]
+            if empties:
+                if jumped[i] is True:
+                    if first is not None and squares[first] * side < 0:
+                        result.append(first)
+                    continue
+            elif first is None or squares[first] * side > 0:
+                continue
+            # capture an opponent past the screen
+            if second is not None and squares[second] * side < 0:
+                result.append(second)
+        return result
 
 
 class Soldier(Piece):
     """Represents a Soldier Piece"""
+    code = SOLDIER
+    __slots__ = ()
 
-    def _is_valid(self, possible_list, board):
+    @staticmethod
+    def moves_from(src_sq, squares, occupancy=None):
         """
         Description:
-        Private method that determines if moves are valid for this piece type with the current context of board
+        returns a list of all possible destination squares for a Soldier at src_sq on the flat board
         Parameters:
-        possible_list: list of tuples of all possible moves for piece type
-        board - current board layout with pieces as a list from XiangqiGame method
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares, not needed by this piece type
         Returns:
-        valid_list of all valid moves with respect to the board
+        list of square indices the piece can move to
         """
-        team = self.get_team()
+        side = 1 if squares[src_sq] > 0 else -1
+        y, x = divmod(src_sq, 9)
+        if side > 0:
+            # red team soldier movement, with orthogonal movements once past the river
+            possible_list = [(y + 1, x)]
+            if y > 4:
+                possible_list.append((y, x - 1))
+                possible_list.append((y, x + 1))
+        else:
+            # black team soldier movement, with orthogonal movements once past the river
+            possible_list = [(y - 1, x)]
+            if y < 5:
+                possible_list.append((y, x - 1))
+                possible_list.append((y, x + 1))
         result = []
-        for el in possible_list:
-            # if the coordinate exists on the board
-            if self.is_on_the_board(el) is True:
-                # if destination is empty, add coord to result list
-                if board[el[0]][el[1]] == 0:
-                    result.append(el)
-                # if destination has opponent in it, add coord to result list
-                elif board[el[0]][el[1]].get_team() != team:
-                    result.append(el)
+        for row, col in possible_list:
+            if 0 <= row <= 9 and 0 <= col <= 8:
+                sq = row * 9 + col
+                if squares[sq] * side <= 0:
+                    result.append(sq)
         return result
 
-    def possible_moves(self, src_coord, board):
+    @staticmethod
+    def captures_from(src_sq, squares, occupancy=None):
         """
         Description:
-        returns a list of tuples of all possible moves that can be made from current location coordinates
+        returns a list of the destination squares of the moves of a Soldier at src_sq that capture an opponent
         Parameters:
-        src_coord - tuple of source board slot coordinates
-        board - current board list that contains piece objects
+        src_sq - board square index of the piece, team is taken from the sign of its code
+        squares - flat list of 90 signed piece codes
+        occupancy - rank and file occupancy masks of squares, not needed by this piece type
         Returns:
-        list of tuples of all possible moves for this Piece class from the src_coord location validated with is_valid
-        method
+        list of square indices the piece can capture on
         """
-        y = src_coord[0]
-        x = src_coord[1]
-        if self.get_team() == 'red':
-            # read team soldier movement
-            possible_list = [(y + 1, x)]
-            # if the solider is past the river, add orthogonal movements
-            if y > 4:
-                possible_list.append((y, x-1))
-                possible_list.append((y, x+1))
-        else:
-            # black team soldier movement
-            possible_list = [(y - 1, x)]
-            # if the solider is past the river, add orthogonal movements
-            if y < 5:
-                possible_list.append((y, x-1))
-                possible_list.append((y, x+1))
-
-        return self._is_valid(possible_list, board)
-
-
+        side = 1 if squares[src_sq] > 0 else -1
+        return [sq for sq in Soldier.moves_from(src_sq, squares) if squares[sq] * side < 0]
+
+
+# Piece child class for each piece type code
+_PIECE_CLASSES = (None, General, Advisor, Elephant, Horse, Chariot, Cannon, Soldier)
+
+# table shared by games created without one of their own, small enough to stay at about 8 MB when full
+_SHARED_TABLE = TranspositionTable(SHARED_TABLE_SIZE)
+
+
+def _board_state(squares):
+    """
+    Description:
+    Computes the game state that depends only on the pieces of a board, which XiangqiGame._setup copies into a game
+    Parameters:
+    squares - list of 90 signed piece codes
+    Returns:
+    tuple of (possible destinations of the piece on each square, red attack counts, black attack counts, rank
+    occupancy masks, file occupancy masks, Zobrist key of the pieces with red to move, dict of team sign to general
+    square, material evaluation term, position evaluation term)
+    """
+    targets = [()] * 90
+    counts = {RED: [0] * 90, BLACK: [0] * 90}
+    ranks, files = _line_occupancy(squares)
+    key = 0
+    generals = {}
+    material = 0
+    position = 0
+    for sq in range(90):
+        code = squares[sq]
+        if code != 0:
+            side = RED if code > 0 else BLACK
+            # destinations are replaced rather than changed when pieces move, so games can share these lists
+            targets[sq] = _PIECE_CLASSES[abs(code)].moves_from(sq, squares, (ranks, files))
+            for el in targets[sq]:
+                counts[side][el] += 1
+            key ^= _ZOBRIST_PIECES[code][sq]
+            material += _MATERIAL_SCORES[code][sq]
+            position += _POSITION_SCORES[code][sq]
+            if code == GENERAL * side:
+                generals[side] = sq
+    return tuple(targets), counts[RED], counts[BLACK], ranks, files, key, generals, material, position
+
+
+# board codes of the standard starting position, and its state from _board_state
+_START_SQUARES = _parse_fen(START_FEN)[0]
+_START_STATE = _board_state(_START_SQUARES)
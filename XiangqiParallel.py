@@ -0,0 +1,134 @@
+# Description: Parallel analysis for XiangqiGame using a pool of worker processes, so a search is not limited to the
+#              one core a Python process can use. The root position is split by move: each legal move of the team to
+#              move is sent to a worker together with the position as a FEN string, and searched there to one less
+#              depth with a full window and a transposition table of its own. Each move's score therefore depends only
+#              on the position and depth, and the moves are merged in their legal move order, keeping the first of
+#              equal scores, so the result is the same for any number of workers.
+#
+#              Run as a script to compare against single-process search: python XiangqiParallel.py [--depth N]
+#              [--workers N]
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from XiangqiGame import XiangqiGame, TranspositionTable, square_name
+from XiangqiSearch import Searcher, MATE_SCORE, MATE_BOUND
+
+# slots in the transposition table of each root move search
+WORKER_TABLE_SIZE = 1 << 16
+
+
+def _search_root_move(task):
+    """
+    Description:
+    Searches one root move in a worker process
+    Parameters:
+    task - tuple of (position, move, depth), where position is the FEN string of the root position, move is the
+    (src_sq, dest_sq) root move and depth is the depth of the whole search
+    Returns:
+    tuple of (move, score from the point of view of the team to move at the root, principal variation as a list of
+    (src, dest) tuples of algebraic notation strings, nodes searched)
+    """
+    position, move, depth = task
+    game = XiangqiGame.from_fen(position, TranspositionTable(WORKER_TABLE_SIZE))
+    game.push_move(move[0], move[1])
+    names = (square_name(move[0]), square_name(move[1]))
+    if depth <= 1:
+        # the child is scored by quiescence search one move from the root, as in a single-process search
+        result = Searcher(game).evaluate_leaf(1)
+        return move, -result['score'], [names], result['nodes'] + 1
+    if game.is_lost() is True:
+        # move wins immediately
+        return move, MATE_SCORE - 1, [names], 1
+    result = Searcher(game).search(depth - 1)
+    score = -result['score']
+    # a win or loss found from the child is one move further from the root
+    if score > MATE_BOUND:
+        score -= 1
+    elif score < -MATE_BOUND:
+        score += 1
+    return move, score, [names] + result['pv'], result['nodes'] + 1
+
+
+def analyze(game, depth, workers=None, executor=None):
+    """
+    Description:
+    Searches the current position of a game to a fixed depth, spreading the root moves over worker processes. The
+    game is not changed
+    Parameters:
+    game - XiangqiGame object to analyze
+    depth - search depth in moves, at least 1
+    workers - number of worker processes, defaults to the number of CPUs
+    executor - optional ProcessPoolExecutor to reuse instead of starting one
+    Returns:
+    dict with move ((src, dest) tuple of algebraic notation strings, or None if the team to move has lost), score,
+    depth, pv, nodes, seconds, nodes_per_second and moves (dict mapping each root move to its score)
+    """
+    start = time.perf_counter()
+    result = {'move': None, 'score': -MATE_SCORE, 'depth': depth, 'pv': [], 'nodes': 0, 'seconds': 0.0,
+              'nodes_per_second': 0.0, 'moves': {}}
+    if game.is_lost() is True:
+        return result
+    position = game.to_fen()
+    tasks = [(position, move, depth) for move in game.legal_moves_sq()]
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(_search_root_move, tasks))
+    else:
+        outcomes = list(executor.map(_search_root_move, tasks))
+
+    # merge in legal move order so equal scores always resolve to the same move
+    best = None
+    for move, score, pv, nodes in outcomes:
+        result['nodes'] += nodes
+        result['moves'][(square_name(move[0]), square_name(move[1]))] = score
+        if best is None or score > best[1]:
+            best = (move, score, pv)
+    seconds = time.perf_counter() - start
+    result['move'] = (square_name(best[0][0]), square_name(best[0][1]))
+    result['score'] = best[1]
+    result['pv'] = best[2]
+    result['seconds'] = seconds
+    result['nodes_per_second'] = result['nodes'] / seconds if seconds > 0 else 0.0
+    return result
+
+
+def compare(game, depth, workers=None):
+    """
+    Description:
+    Searches the current position of a game to a fixed depth both in this process and with analyze, to measure the
+    speedup of parallel analysis. Single-process search shares alpha-beta bounds between root moves and so searches
+    fewer nodes, which the speedup includes
+    Parameters:
+    game - XiangqiGame object to analyze
+    depth - search depth in moves
+    workers - number of worker processes, defaults to the number of CPUs
+    Returns:
+    dict with single and parallel results and speedup, the single-process time divided by the parallel time
+    """
+    single = Searcher(game, TranspositionTable(WORKER_TABLE_SIZE)).search(depth)
+    parallel = analyze(game, depth, workers)
+    speedup = single['seconds'] / parallel['seconds'] if parallel['seconds'] > 0 else 0.0
+    return {'single': single, 'parallel': parallel, 'speedup': speedup}
+
+
+def main():
+    """
+    Description:
+    Command line entry point, compares single-process and parallel search of the starting position
+    """
+    parser = argparse.ArgumentParser(description='Compare single-process and parallel XiangqiGame search')
+    parser.add_argument('--depth', type=int, default=4, help='search depth (default 4)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+    comparison = compare(XiangqiGame(), args.depth, args.workers)
+    for name in ('single', 'parallel'):
+        el = comparison[name]
+        print('%-8s move %s%s score %d nodes %d seconds %.3f nodes/sec %.0f' % (
+            name, el['move'][0], el['move'][1], el['score'], el['nodes'], el['seconds'], el['nodes_per_second']))
+    print('speedup %.2f' % comparison['speedup'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+# Description: Perft (performance test) suite for the XiangqiGame move generator. Each test position is played out
+#              from the starting position, and the number of move sequences of each length from it is counted with
+#              XiangqiGame.perft and compared to a known count. Any change to the move rules of a Piece class, or to
+#              the legality filtering in XiangqiGame, changes the counts. Nodes per second are reported for each
+#              depth so move generation throughput can be compared between versions.
+#
+#              Run as a script: python XiangqiPerft.py [--depth N] [--divide NAME]
+
+import argparse
+import time
+
+from XiangqiGame import XiangqiGame
+
+# Test positions as (name, moves from the starting position, {depth: expected node count}). Counts are for the move
+# rules of this program, which differ from other engines' (for example Cannons may move to empty squares past their
+# screen, and the Generals may face each other), so they do not match published Xiangqi perft tables.
+PERFT_POSITIONS = [
+    ('start', [],
+     {1: 48, 2: 2290, 3: 101875, 4: 4510230}),
+    ('central cannon', [('h3', 'e3')],
+     {1: 48, 2: 1909, 3: 85507, 4: 3280535}),
+    ('screen horse defence', [('h3', 'e3'), ('h10', 'g8'), ('h1', 'g3'), ('i10', 'h10')],
+     {1: 38, 2: 1509, 3: 57147, 4: 2355214}),
+    ('elephant opening', [('c1', 'e3'), ('h8', 'e8'), ('b1', 'c3')],
+     {1: 40, 2: 1645, 3: 63625, 4: 2652895}),
+    ('cannon check', [('c1', 'e3'), ('b8', 'b1')],
+     {1: 4, 2: 153, 3: 6536, 4: 249147}),
+]
+
+# Repetition rule positions as (name, FEN string, moves, expected game_state once the moves are played or the game
+# ends). Each team repeats a pair of moves until the position is reached for the third time.
+RULE_POSITIONS = [
+    ('perpetual chase', '4k4/9/9/6n2/R5n2/9/9/9/9/3K5 w',
+     [('a6', 'a7'), ('e10', 'e9'), ('a7', 'a6'), ('e9', 'e10')] * 3, 'BLACK_WON'),
+    ('defended piece chased', '4k4/9/9/1n7/9/r8/9/9/R8/3K5 w',
+     [('a2', 'b2'), ('e10', 'e9'), ('b2', 'a2'), ('e9', 'e10')] * 3, 'DRAW'),
+]
+
+
+def perft_game(moves):
+    """
+    Description:
+    Creates a game and plays a list of moves from the starting position
+    Parameters:
+    moves - list of (src, dest) tuples of algebraic notation strings
+    Returns:
+    XiangqiGame object in the resulting position
+    """
+    game = XiangqiGame()
+    for src, dest in moves:
+        if game.make_move(src, dest) is False:
+            raise ValueError('illegal move in perft position: ' + src + dest)
+    return game
+
+
+def run_suite(max_depth=3, positions=PERFT_POSITIONS, report=print):
+    """
+    Description:
+    Runs perft on every test position for each depth with a known count, up to max_depth
+    Parameters:
+    max_depth - largest depth to run
+    positions - list of test positions in the format of PERFT_POSITIONS
+    report - function called with one line of text per result, or None for no output
+    Returns:
+    list of dicts with name, depth, nodes, expected, seconds and nodes_per_second of each run
+    """
+    results = []
+    if report is not None:
+        report('%-22s %5s %10s %10s %8s %12s' % ('position', 'depth', 'nodes', 'expected', 'seconds', 'nodes/sec'))
+    for name, moves, expected in positions:
+        game = perft_game(moves)
+        for depth in sorted(expected):
+            if depth > max_depth:
+                break
+            start = time.perf_counter()
+            nodes = game.perft(depth)
+            seconds = time.perf_counter() - start
+            rate = nodes / seconds if seconds > 0 else 0.0
+            results.append({'name': name, 'depth': depth, 'nodes': nodes, 'expected': expected[depth],
+                            'seconds': seconds, 'nodes_per_second': rate})
+            if report is not None:
+                status = '' if nodes == expected[depth] else '  MISMATCH'
+                report('%-22s %5d %10d %10d %8.3f %12.0f%s' % (name, depth, nodes, expected[depth], seconds, rate,
+                                                              status))
+    return results
+
+
+def run_rules(positions=RULE_POSITIONS, report=print):
+    """
+    Description:
+    Plays out every repetition rule position and compares the game state it ends in to the expected one
+    Parameters:
+    positions - list of positions in the format of RULE_POSITIONS
+    report - function called with one line of text per position, or None for no output
+    Returns:
+    list of dicts with name, game_state and expected of each position
+    """
+    results = []
+    for name, fen, moves, expected in positions:
+        game = XiangqiGame.from_fen(fen)
+        for src, dest in moves:
+            if game.get_game_state() != 'UNFINISHED' or game.make_move(src, dest) is False:
+                break
+        results.append({'name': name, 'game_state': game.get_game_state(), 'expected': expected})
+        if report is not None:
+            status = '' if game.get_game_state() == expected else '  MISMATCH'
+            report('%-22s %-10s %-10s%s' % (name, game.get_game_state(), expected, status))
+    return results
+
+
+def divide(name, depth, report=print):
+    """
+    Description:
+    Runs perft in divide mode on one test position, to find which move a count mismatch comes from
+    Parameters:
+    name - name of a position in PERFT_POSITIONS
+    depth - depth to run
+    report - function called with one line of text per move
+    Returns:
+    dict mapping each (src, dest) move to its node count
+    """
+    for position in PERFT_POSITIONS:
+        if position[0] == name:
+            counts = perft_game(position[1]).perft(depth, divide=True)
+            for move in sorted(counts):
+                report('%s%s %d' % (move[0], move[1], counts[move]))
+            report('total %d' % sum(counts.values()))
+            return counts
+    raise ValueError('unknown perft position: ' + name)
+
+
+def main():
+    """
+    Description:
+    Command line entry point, exits with status 1 if any count does not match
+    """
+    parser = argparse.ArgumentParser(description='Run the XiangqiGame perft suite')
+    parser.add_argument('--depth', type=int, default=3, help='largest depth to run (default 3)')
+    parser.add_argument('--divide', metavar='NAME', help='print per-move counts for one position instead')
+    args = parser.parse_args()
+    if args.divide is not None:
+        divide(args.divide, args.depth)
+        return
+    results = run_suite(args.depth)
+    rules = run_rules()
+    if (any(el['nodes'] != el['expected'] for el in results) or
+            any(el['game_state'] != el['expected'] for el in rules)):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
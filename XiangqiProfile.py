@@ -0,0 +1,156 @@
+# Description: Opt-in profiling of the XiangqiGame move pipeline. enable replaces the methods of each stage, and the
+#              moves_from and captures_from methods of each Piece class, with wrappers that count calls and add up the
+#              time spent in them; disable puts the original methods back. Nothing is counted, and nothing costs
+#              anything, while profiling is disabled. Times are inclusive, so a stage's time includes the stages and
+#              piece moves it calls.
+#
+#              from XiangqiProfile import measure
+#              with measure() as stats:
+#                  game.make_move('h3', 'e3')
+#              print(stats['move_in_check'])
+#
+#              percentile summarizes timings collected elsewhere, such as the latencies measured by XiangqiBenchmark
+#              and XiangqiServer.load_test.
+
+import time
+from contextlib import contextmanager
+
+from XiangqiGame import XiangqiGame, _PIECE_CLASSES
+
+# stage name of each profiled XiangqiGame method
+STAGES = {
+    'make_move': 'make_move_sq',
+    'legal_moves': '_generate_legal',
+    'move_in_check': '_move_in_check',
+    'is_lost': 'is_lost',
+    'repetition': '_repetition_state',
+    'push_move': 'push_move',
+    'pop_move': 'pop_move',
+    'attack_maps': '_set_squares',
+}
+
+# [calls, seconds] of each stage, and original class attributes replaced while enabled
+_counters = {}
+_originals = []
+
+
+def _timed(function, counter):
+    """
+    Description:
+    Wraps a function to count its calls and time in a counter
+    Parameters:
+    function - function to wrap
+    counter - [calls, seconds] list to add to
+    Returns:
+    wrapping function
+    """
+    clock = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            counter[0] += 1
+            counter[1] += clock() - start
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def is_enabled():
+    """
+    Description:
+    Returns True if profiling is enabled, else False
+    """
+    return bool(_originals)
+
+
+def enable():
+    """
+    Description:
+    Starts counting calls and time of every stage and piece type, keeping the counts of earlier profiling
+    """
+    if _originals:
+        return
+    for name, method in STAGES.items():
+        counter = _counters.setdefault(name, [0, 0.0])
+        _originals.append((XiangqiGame, method, XiangqiGame.__dict__[method]))
+        setattr(XiangqiGame, method, _timed(XiangqiGame.__dict__[method], counter))
+    for piece_class in _PIECE_CLASSES[1:]:
+        for method in ('moves_from', 'captures_from'):
+            counter = _counters.setdefault(piece_class.__name__ + '.' + method, [0, 0.0])
+            original = piece_class.__dict__[method]
+            _originals.append((piece_class, method, original))
+            setattr(piece_class, method, staticmethod(_timed(original.__func__, counter)))
+
+
+def disable():
+    """
+    Description:
+    Stops counting, putting the original methods back
+    """
+    while _originals:
+        owner, method, original = _originals.pop()
+        setattr(owner, method, original)
+
+
+def reset():
+    """
+    Description:
+    Sets every count back to zero
+    """
+    for counter in _counters.values():
+        counter[0] = 0
+        counter[1] = 0.0
+
+
+def get_stats():
+    """
+    Description:
+    Returns a snapshot of the counts
+    Returns:
+    dict mapping each stage name of STAGES, and Piece class method names such as Cannon.moves_from, to a dict of
+    calls and seconds, for those called while profiling was enabled
+    """
+    return {name: {'calls': counter[0], 'seconds': counter[1]} for name, counter in _counters.items()
+            if counter[0] > 0}
+
+
+@contextmanager
+def measure():
+    """
+    Description:
+    Profiles the statements of a with block, enabling profiling for it if it is not enabled already
+    Returns:
+    dict that is filled in at the end of the block with the calls and seconds of each stage during the block, in the
+    format of get_stats
+    """
+    stats = {}
+    was_enabled = is_enabled()
+    enable()
+    before = get_stats()
+    try:
+        yield stats
+    finally:
+        for name, el in get_stats().items():
+            start = before.get(name, {'calls': 0, 'seconds': 0.0})
+            if el['calls'] > start['calls']:
+                stats[name] = {'calls': el['calls'] - start['calls'], 'seconds': el['seconds'] - start['seconds']}
+        if not was_enabled:
+            disable()
+
+
+def percentile(ordered, fraction):
+    """
+    Description:
+    Returns the value a fraction of the way through a sorted list, using the nearest rank
+    Parameters:
+    ordered - sorted list of numbers
+    fraction - number from 0 to 1
+    Returns:
+    value from ordered, or 0.0 if ordered is empty
+    """
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
@@ -0,0 +1,429 @@
+# Description: Streaming reader and validator for archives of Xiangqi game records. read_records reads records one at
+#              a time from a file or file-like object, so an archive of any size is never held in memory, and
+#              validate_records replays each game against XiangqiGame and yields one result per game, with the first
+#              move that could not be read or was not legal. Validation is spread over a pool of worker processes in
+#              chunks of games, with a bounded number of chunks in flight, so memory stays bounded whatever the size
+#              of the archive, and results are yielded in archive order.
+#
+#              Archives are read in a PGN-like format: optional tag lines such as [Result "1-0"] or [FEN "..."],
+#              then the moves, which may be split over several lines and numbered (1. h2e2 h9g7 2. ...). A game
+#              ends at a result token (1-0, 0-1, 1/2-1/2 or *), a blank line, even after tags only, or the tags of
+#              the next game, so the one game per line records read by XiangqiBook.read_games are read too. Text in
+#              braces and after a ; or # is ignored.
+#
+#              Moves are read in one of three notations:
+#              iccs - file a-i and rank 0-9 from red's side, such as h2e2 or H2-E2
+#              wxf - piece letter (K, A, E or B, H or N, R, C, P), file 1-9 counted from the right of the team
+#              moving, direction (+ forward, - backward, = or . along the rank) and a file or number of ranks, such
+#              as C2=5 or H8+7. Two pieces of a type on one file are told apart by + (front) or - (rear) in place of
+#              the file, before or after the letter, such as +R+1 or R-=4
+#              algebraic - file a-i and rank 1-10 as used by XiangqiGame.make_move, such as h3e3 or h3-e3
+#
+#              Run as a script: python XiangqiRecords.py ARCHIVE [--notation NAME] [--workers N] [--all]
+
+import argparse
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from XiangqiGame import (XiangqiGame, TranspositionTable, GENERAL, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON,
+                         SOLDIER, SQUARE_NAMES, square_index)
+
+NOTATIONS = ('iccs', 'wxf', 'algebraic')
+# games validated together by one worker task, and chunks in flight per worker by default
+DEFAULT_CHUNK_SIZE = 64
+PENDING_PER_WORKER = 2
+# slots in the transposition table of the game each worker replays records with
+WORKER_TABLE_SIZE = 1 << 16
+_RESULT_TOKENS = ('1-0', '0-1', '1/2-1/2', '*')
+_TAG_PATTERN = re.compile(r'^\[\s*(\w+)\s+"(.*)"\s*\]$')
+_NUMBER_PATTERN = re.compile(r'^\d+\.+')
+_ICCS_PATTERN = re.compile(r'^([a-i])([0-9])-?([a-i])([0-9])$', re.IGNORECASE)
+_ALGEBRAIC_PATTERN = re.compile(r'^([a-i](?:10|[1-9]))-?([a-i](?:10|[1-9]))$')
+_WXF_PATTERN = re.compile(r'^([+-]?)([KAEBHNRCP])([1-9+-]?)([+\-=.])([1-9])$', re.IGNORECASE)
+_WXF_PIECES = {'K': GENERAL, 'A': ADVISOR, 'E': ELEPHANT, 'B': ELEPHANT, 'H': HORSE, 'N': HORSE, 'R': CHARIOT,
+               'C': CANNON, 'P': SOLDIER}
+
+# game each worker process replays records with, created by its first task
+_worker_game = None
+
+
+def read_records(source):
+    """
+    Description:
+    Reads game records in the format described at the top of this module, one at a time
+    Parameters:
+    source - path of an archive file, or a file-like object or other iterable of lines of text or bytes
+    Returns:
+    generator of a dict for each game with index (0 for the first game), line (line number the game starts on), tags
+    (dict of tag names and values), moves (list of move tokens as written) and result (result token, or None)
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, encoding='utf-8', errors='replace') as archive:
+            yield from read_records(archive)
+        return
+    index = 0
+    record = None
+    in_comment = False
+    for number, line in enumerate(source, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        # comments in braces may span lines
+        text = ''
+        while line:
+            if in_comment:
+                end = line.find('}')
+                if end < 0:
+                    line = ''
+                else:
+                    in_comment = False
+                    line = line[end + 1:]
+            else:
+                start = line.find('{')
+                if start < 0:
+                    text += line
+                    line = ''
+                else:
+                    text += line[:start] + ' '
+                    in_comment = True
+                    line = line[start + 1:]
+        text = re.split('[;#]', text, maxsplit=1)[0].strip()
+        if not text:
+            # a blank line ends a game, even one of tags only
+            if record is not None:
+                yield record
+                index += 1
+                record = None
+            continue
+        match = _TAG_PATTERN.match(text)
+        if match is not None:
+            if record is not None and record['moves']:
+                yield record
+                index += 1
+                record = None
+            if record is None:
+                record = {'index': index, 'line': number, 'tags': {}, 'moves': [], 'result': None}
+            record['tags'][match.group(1)] = match.group(2)
+            continue
+        for token in text.split():
+            if record is None:
+                record = {'index': index, 'line': number, 'tags': {}, 'moves': [], 'result': None}
+            token = _NUMBER_PATTERN.sub('', token)
+            if not token:
+                continue
+            if token in _RESULT_TOKENS:
+                record['result'] = token
+                yield record
+                index += 1
+                record = None
+            else:
+                record['moves'].append(token)
+    if record is not None:
+        yield record
+
+
+def _file_column(side, file_number):
+    """
+    Description:
+    Returns the board column of a WXF file number, counted from the right of the team moving
+    """
+    return 9 - file_number if side > 0 else file_number - 1
+
+
+def _wxf_moves(game, token):
+    """
+    Description:
+    Finds the moves a WXF notation move describes in the current position of a game
+    Parameters:
+    game - XiangqiGame object
+    token - move in WXF notation
+    Returns:
+    list of (src_sq, dest_sq) tuples on the board, None if token is not WXF notation
+    """
+    match = _WXF_PATTERN.match(token)
+    if match is None:
+        return None
+    prefix, letter, source, direction, amount = match.groups()
+    # the piece is named by exactly one of a front or rear prefix, a file, or a front or rear suffix
+    if bool(prefix) == bool(source):
+        return None
+    side = game.get_side()
+    piece_type = _WXF_PIECES[letter.upper()]
+    code = piece_type * side
+    amount = int(amount)
+    # board squares of the team's pieces of this type, by column
+    columns = {}
+    for sq in range(90):
+        if game.get_piece_code(sq) == code:
+            columns.setdefault(sq % 9, []).append(sq)
+    if prefix or source in '+-':
+        # front or rear piece of a column holding more than one, front being furthest forward
+        position = prefix or source
+        sources = []
+        for squares in columns.values():
+            if len(squares) > 1:
+                squares = sorted(squares, key=lambda sq: sq * side)
+                sources.append(squares[-1] if position == '+' else squares[0])
+    else:
+        sources = columns.get(_file_column(side, int(source)), [])
+    moves = []
+    for src_sq in sources:
+        row, col = divmod(src_sq, 9)
+        if piece_type in (ADVISOR, ELEPHANT, HORSE):
+            # diagonal movers name the file they move to
+            if direction in '=.':
+                continue
+            dest_col = _file_column(side, amount)
+            columns_moved = abs(dest_col - col)
+            if piece_type == HORSE:
+                if columns_moved not in (1, 2):
+                    continue
+                rows_moved = 3 - columns_moved
+            else:
+                rows_moved = 1 if piece_type == ADVISOR else 2
+                if columns_moved != rows_moved:
+                    continue
+            dest_row = row + (rows_moved if direction == '+' else -rows_moved) * side
+        elif direction in '=.':
+            dest_row = row
+            dest_col = _file_column(side, amount)
+        else:
+            dest_row = row + (amount if direction == '+' else -amount) * side
+            dest_col = col
+        if 0 <= dest_row <= 9 and (dest_row, dest_col) != (row, col):
+            moves.append((src_sq, dest_row * 9 + dest_col))
+    return moves
+
+
+def parse_move(game, token, notation='iccs'):
+    """
+    Description:
+    Converts a move token to board squares in the current position of a game. The move is not checked for legality,
+    except that of several moves a WXF token could describe the legal one is chosen
+    Parameters:
+    game - XiangqiGame object
+    token - move as written in a game record
+    notation - notation of token, from NOTATIONS
+    Returns:
+    (src_sq, dest_sq) tuple, or None if token is not a move in the notation
+    Raises:
+    ValueError if notation is not one of NOTATIONS
+    """
+    if notation == 'iccs':
+        match = _ICCS_PATTERN.match(token)
+        if match is None:
+            return None
+        src_file, src_rank, dest_file, dest_rank = match.groups()
+        return (int(src_rank) * 9 + 'abcdefghi'.index(src_file.lower()),
+                int(dest_rank) * 9 + 'abcdefghi'.index(dest_file.lower()))
+    if notation == 'algebraic':
+        match = _ALGEBRAIC_PATTERN.match(token)
+        if match is None:
+            return None
+        return square_index(match.group(1)), square_index(match.group(2))
+    if notation == 'wxf':
+        moves = _wxf_moves(game, token)
+        if not moves:
+            return None
+        if len(moves) > 1:
+            legal = set(game.legal_moves_sq())
+            for el in moves:
+                if el in legal:
+                    return el
+        return moves[0]
+    raise ValueError('unknown notation: ' + repr(notation))
+
+
+def validate_record(record, notation='iccs', game=None):
+    """
+    Description:
+    Replays a game record from its starting position, up to its first move that cannot be read or is not legal
+    Parameters:
+    record - dict from read_records
+    notation - notation of the record's moves, from NOTATIONS
+    game - XiangqiGame object to replay the record with, which is reset, or None to create one
+    Returns:
+    dict with index, line, tags and result of the record, valid (True if every move was legal), moves (list of
+    (src, dest) tuples of algebraic notation strings of the legal moves played), game_state after them and
+    illegal_move (None, or dict with ply (0 for the first move), move (token as written) and reason: notation if the
+    token is not a move, illegal if the move is not legal, finished if the game was already over, or fen if the FEN
+    tag is not a valid position)
+    """
+    result = {'index': record['index'], 'line': record['line'], 'tags': record['tags'], 'result': record['result'],
+              'valid': True, 'moves': [], 'game_state': 'UNFINISHED', 'illegal_move': None}
+    fen = record['tags'].get('FEN')
+    try:
+        if game is None:
+            game = XiangqiGame(fen=fen)
+        else:
+            game.reset(fen)
+    except ValueError:
+        result['valid'] = False
+        result['illegal_move'] = {'ply': 0, 'move': fen, 'reason': 'fen'}
+        return result
+    # rejected moves are reported in the result, and the caller's hook is put back afterwards
+    hook = game.get_rejected_move_hook()
+    game.set_rejected_move_hook(None)
+    try:
+        moves = result['moves']
+        for ply, token in enumerate(record['moves']):
+            reason = None
+            move = parse_move(game, token, notation)
+            if move is None:
+                reason = 'notation'
+            elif game.get_game_state() != 'UNFINISHED':
+                reason = 'finished'
+            elif game.make_move_sq(move[0], move[1]) is False:
+                reason = 'illegal'
+            if reason is not None:
+                result['valid'] = False
+                result['illegal_move'] = {'ply': ply, 'move': token, 'reason': reason}
+                break
+            moves.append((SQUARE_NAMES[move[0]], SQUARE_NAMES[move[1]]))
+        result['game_state'] = game.get_game_state()
+    finally:
+        game.set_rejected_move_hook(hook)
+    return result
+
+
+def worker_game():
+    """
+    Description:
+    Returns the game a worker process replays records with, so one game is reset for every record the process
+    handles instead of one being constructed for each
+    Returns:
+    XiangqiGame object with a TranspositionTable of its own, created by the process's first call
+    """
+    global _worker_game
+    if _worker_game is None:
+        _worker_game = XiangqiGame(TranspositionTable(WORKER_TABLE_SIZE))
+    return _worker_game
+
+
+def map_ordered(function, tasks, workers=None, executor=None, max_pending=None):
+    """
+    Description:
+    Calls a function on each task over worker processes, taking the next task from tasks only as earlier results
+    are yielded, so at most max_pending tasks and their results are held in memory at once however many tasks
+    there are
+    Parameters:
+    function - module level function of one task, run in the worker processes
+    tasks - iterable of tasks, which may be a generator reading from a file
+    workers - number of worker processes, defaults to the number of CPUs, or 0 to call function in this process
+    executor - optional ProcessPoolExecutor to reuse instead of starting one
+    max_pending - tasks in flight at once, defaults to PENDING_PER_WORKER per worker
+    Returns:
+    generator of the results of function, in the order of tasks
+    """
+    if executor is None and workers == 0:
+        for task in tasks:
+            yield function(task)
+        return
+    pool = executor
+    if pool is None:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        if max_pending is None:
+            max_pending = PENDING_PER_WORKER * (workers or os.cpu_count() or 1)
+        pending = deque()
+        for task in tasks:
+            if len(pending) >= max(max_pending, 1):
+                yield pending.popleft().result()
+            pending.append(pool.submit(function, task))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if executor is None:
+            pool.shutdown(cancel_futures=True)
+
+
+def _validate_chunk(task):
+    """
+    Description:
+    Validates a chunk of records in a worker process
+    Parameters:
+    task - tuple of (list of records from read_records, notation)
+    Returns:
+    list of validate_record results
+    """
+    records, notation = task
+    game = worker_game()
+    return [validate_record(record, notation, game) for record in records]
+
+
+def _chunks(records, chunk_size):
+    """
+    Description:
+    Groups records into lists of up to chunk_size records
+    """
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate_records(records, notation='iccs', workers=None, executor=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                     max_pending=None):
+    """
+    Description:
+    Validates game records over worker processes, reading the next records only as earlier results are yielded, so
+    at most max_pending chunks of records and their results are held in memory at once
+    Parameters:
+    records - iterable of records from read_records, such as read_records(path)
+    notation - notation of the records' moves, from NOTATIONS
+    workers - number of worker processes, defaults to the number of CPUs, or 0 to validate in this process
+    executor - optional ProcessPoolExecutor to reuse instead of starting one
+    chunk_size - records validated together by one worker task
+    max_pending - chunks in flight at once, defaults to PENDING_PER_WORKER per worker
+    Returns:
+    generator of validate_record results, in the order of records
+    Raises:
+    ValueError if notation is not one of NOTATIONS
+    """
+    if notation not in NOTATIONS:
+        raise ValueError('unknown notation: ' + repr(notation))
+    tasks = ((chunk, notation) for chunk in _chunks(records, chunk_size))
+    for results in map_ordered(_validate_chunk, tasks, workers, executor, max_pending):
+        yield from results
+
+
+def main():
+    """
+    Description:
+    Command line entry point, validates the games of an archive and prints the games with an illegal move
+    """
+    parser = argparse.ArgumentParser(description='Validate an archive of Xiangqi game records')
+    parser.add_argument('archive', help='file of game records')
+    parser.add_argument('--notation', choices=NOTATIONS, default='iccs', help='notation of moves (default iccs)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes, 0 for none (default: number of CPUs)')
+    parser.add_argument('--all', action='store_true', help='print every game, not only those with an illegal move')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    games = 0
+    invalid = 0
+    moves = 0
+    for result in validate_records(read_records(args.archive), args.notation, args.workers):
+        games += 1
+        moves += len(result['moves'])
+        illegal = result['illegal_move']
+        if illegal is not None:
+            invalid += 1
+            print('game %d (line %d): %s move %d %s' % (result['index'] + 1, result['line'], illegal['reason'],
+                                                       illegal['ply'] + 1, illegal['move']))
+        elif args.all:
+            print('game %d (line %d): %d moves %s' % (result['index'] + 1, result['line'], len(result['moves']),
+                                                     result['game_state']))
+    seconds = time.perf_counter() - start
+    print('games %d invalid %d moves %d seconds %.3f games/sec %.0f' % (
+        games, invalid, moves, seconds, games / seconds if seconds > 0 else 0.0))
+
+
+if __name__ == '__main__':
+    main()
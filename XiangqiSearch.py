@@ -0,0 +1,545 @@
+# Description: Computer opponent for XiangqiGame. Searcher runs a negamax alpha-beta search with iterative deepening
+#              over the positions of a game, making and taking back moves with push_move and pop_move so the game is
+#              left exactly as it was found. Scores and best moves are stored in the game's TranspositionTable, and
+#              the best move of each position is searched first on the next iteration. The principal variation is
+#              tracked for every completed depth. A search can be limited by depth, time and number of nodes.
+#
+#              MoveOrderer searches likely best moves first: the stored best move, then captures by most valuable
+#              victim and least valuable attacker (MVV-LVA), then quiet moves that caused a cutoff at the same
+#              distance from the root (killer moves) and finally quiet moves by how often they caused cutoffs anywhere
+#              (history). At depth 0 a quiescence search keeps searching captures, and every move when in check, until
+#              the position is quiet, so the static evaluation is not taken in the middle of an exchange. Each search
+#              reports the branching factor it achieved.
+#
+#              Run as a script to compare searches with and without move ordering: python XiangqiSearch.py
+#              [--depth N]
+
+import argparse
+import time
+
+from XiangqiGame import XiangqiGame, TranspositionTable, square_name, PIECE_VALUES, GENERAL
+
+# score of a position where the team to move has lost; a loss n moves from the root scores -(MATE_SCORE - n)
+MATE_SCORE = 100000
+# scores beyond this are losses or wins
+MATE_BOUND = MATE_SCORE - 1000
+# larger than any score
+INFINITY = MATE_SCORE + 1
+# search depth used when neither a depth nor a time budget is given
+DEFAULT_DEPTH = 4
+# search depth used when only a time budget is given
+MAX_DEPTH = 64
+# most moves quiescence search plays beyond the full depth, after which it stands on the static evaluation even
+# in check, so long chains of checks and evasions can not make it run away
+MAX_QUIESCENCE_PLY = 8
+# number of nodes searched between checks of the time and node budget
+_CHECK_INTERVAL = 1024
+# move ordering keys of the stored best move, captures and killer moves, above any history count
+_HASH_MOVE_KEY = 1 << 30
+_CAPTURE_KEY = 1 << 28
+_KILLER_KEY = 1 << 27
+# history counts are halved once one reaches this, to stay below the killer move key
+_HISTORY_LIMIT = 1 << 26
+# piece values for MVV-LVA, with the general as the least willing attacker
+_ORDER_VALUES = tuple(PIECE_VALUES[:GENERAL]) + (1000,) + tuple(PIECE_VALUES[GENERAL + 1:])
+
+
+class _SearchStopped(Exception):
+    """Raised inside the search when the time or node budget runs out"""
+
+
+class MoveOrderer:
+    """Represents the move ordering heuristics of a search: MVV-LVA for captures, and killer moves and a history table
+    for quiet moves"""
+    def __init__(self):
+        """
+        Initializes MoveOrderer object with no killer moves and an empty history table
+        """
+        # up to two quiet moves that caused a cutoff at each distance from the root, most recent first
+        self._killers = []
+        # cutoffs caused by each quiet move, indexed by src_sq * 90 + dest_sq and weighted by depth
+        self._history = [0] * 8100
+
+    def new_search(self):
+        """
+        Description:
+        Method forgets the killer moves and halves the history table, so a new search keeps what the previous one
+        learned without being dominated by it
+        """
+        self._killers = []
+        self._history = [el // 2 for el in self._history]
+
+    def order(self, game, moves, hash_move=None, ply=0):
+        """
+        Description:
+        Method orders moves of the current position of a game, most promising first
+        Parameters:
+        game - XiangqiGame object
+        moves - list of (src_sq, dest_sq) tuples
+        hash_move - best move stored in the transposition table, or None
+        ply - number of moves from the root, to look up killer moves
+        Returns:
+        ordered list of moves
+        """
+        killers = self._killers[ply] if ply < len(self._killers) else ()
+        history = self._history
+        keys = {}
+        for move in moves:
+            if move == hash_move:
+                keys[move] = _HASH_MOVE_KEY
+                continue
+            victim = game.get_piece_code(move[1])
+            if victim != 0:
+                attacker = game.get_piece_code(move[0])
+                keys[move] = _CAPTURE_KEY + _ORDER_VALUES[abs(victim)] * 10 - _ORDER_VALUES[abs(attacker)] // 100
+            elif move in killers:
+                keys[move] = _KILLER_KEY - killers.index(move)
+            else:
+                keys[move] = history[move[0] * 90 + move[1]]
+        return sorted(moves, key=keys.__getitem__, reverse=True)
+
+    def record_cutoff(self, move, depth, ply):
+        """
+        Description:
+        Method records a quiet move that caused a beta cutoff
+        Parameters:
+        move - (src_sq, dest_sq) tuple
+        depth - remaining depth of the position
+        ply - number of moves from the root
+        """
+        while len(self._killers) <= ply:
+            self._killers.append([])
+        killers = self._killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        index = move[0] * 90 + move[1]
+        self._history[index] += depth * depth
+        if self._history[index] >= _HISTORY_LIMIT:
+            self._history = [el // 2 for el in self._history]
+
+
+class Searcher:
+    """Represents an alpha-beta search over the positions of a XiangqiGame"""
+    def __init__(self, game, table=None, ordering=True, quiescence=True):
+        """
+        Initializes Searcher object for game, storing results in table, which defaults to the game's
+        TranspositionTable. If ordering is False, moves are only ordered as the stored best move, captures and the
+        rest, and if quiescence is False, positions at depth 0 are scored by their static evaluation
+        """
+        self._game = game
+        if table is None:
+            table = game.get_transposition_table()
+        self._table = table
+        self._orderer = MoveOrderer() if ordering else None
+        self._quiescence_enabled = quiescence
+        # statistics of the current search: nodes searched by quiescence search, positions whose moves were
+        # searched, moves searched in them, beta cutoffs and beta cutoffs by the first move
+        self._qnodes = 0
+        self._expanded = 0
+        self._moves_searched = 0
+        self._cutoffs = 0
+        self._first_cutoffs = 0
+        self._nodes = 0
+        self._next_check = _CHECK_INTERVAL
+        self._deadline = None
+        self._max_nodes = None
+        self._completed_depth = 0
+        # number of moves currently pushed on the game by the search
+        self._pushed = 0
+
+    def search(self, depth=None, time_ms=None, max_nodes=None, report=None):
+        """
+        Description:
+        Searches the current position of the game one depth at a time, until depth is reached or the time or node
+        budget runs out. The result of the last completed depth is returned; the first depth is always completed
+        Parameters:
+        depth - maximum depth in moves, defaults to DEFAULT_DEPTH if no time or node budget is given
+        time_ms - time budget in milliseconds
+        max_nodes - budget of positions searched
+        report - function called with a dict like the returned one after each completed depth, or None
+        Returns:
+        dict with move ((src, dest) tuple of algebraic notation strings, or None if the team to move has lost),
+        score (from the point of view of the team to move), depth, pv (list of moves), nodes, seconds and
+        nodes_per_second, and the statistics qnodes (nodes searched by quiescence search), branching_factor (nodes
+        searched to complete the last depth divided by those of the depth before it), moves_per_node (moves searched
+        per position whose moves were searched) and first_move_cutoffs (fraction of cutoffs caused by the first move)
+        """
+        if depth is None:
+            depth = DEFAULT_DEPTH if time_ms is None and max_nodes is None else MAX_DEPTH
+        start = time.perf_counter()
+        self._begin(None if time_ms is None else start + time_ms / 1000.0, max_nodes)
+        result = {'move': None, 'score': 0, 'depth': 0, 'pv': [], 'nodes': 0, 'seconds': 0.0,
+                  'nodes_per_second': 0.0, 'qnodes': 0, 'branching_factor': 0.0, 'moves_per_node': 0.0,
+                  'first_move_cutoffs': 0.0}
+        if self._game.is_lost() is True:
+            result['score'] = -MATE_SCORE
+            return result
+
+        depth_nodes = []
+        for current in range(1, depth + 1):
+            pv = []
+            start_nodes = self._nodes
+            try:
+                score = self._negamax(current, -INFINITY, INFINITY, 0, pv)
+            except _SearchStopped:
+                # take back the moves of the unfinished depth
+                for i in range(self._pushed):
+                    self._game.pop_move()
+                self._pushed = 0
+                break
+            self._completed_depth = current
+            seconds = time.perf_counter() - start
+            depth_nodes.append(self._nodes - start_nodes)
+            result = {'move': self._move_names(pv[0]), 'score': score, 'depth': current,
+                      'pv': [self._move_names(el) for el in pv], 'nodes': self._nodes, 'seconds': seconds,
+                      'nodes_per_second': self._nodes / seconds if seconds > 0 else 0.0}
+            result.update(self._statistics(depth_nodes))
+            if report is not None:
+                report(result)
+            # no deeper search can change a forced win or loss
+            if score > MATE_BOUND or score < -MATE_BOUND:
+                break
+        result['nodes'] = self._nodes
+        result['qnodes'] = self._qnodes
+        return result
+
+    def evaluate_leaf(self, ply=0):
+        """
+        Description:
+        Scores the current position as the search scores the positions at its full depth: by quiescence search, or by
+        the static evaluation if quiescence is disabled
+        Parameters:
+        ply - number of moves the position is from the root of a larger search, so wins and losses are scored as the
+        same distance from it
+        Returns:
+        dict with score (from the point of view of the team to move), nodes, qnodes, seconds and nodes_per_second
+        """
+        start = time.perf_counter()
+        self._begin(None, None)
+        if self._quiescence_enabled:
+            score = self._quiescence(-INFINITY, INFINITY, ply)
+        else:
+            self._nodes += 1
+            score = self._evaluate()
+        seconds = time.perf_counter() - start
+        return {'score': score, 'nodes': self._nodes, 'qnodes': self._qnodes, 'seconds': seconds,
+                'nodes_per_second': self._nodes / seconds if seconds > 0 else 0.0}
+
+    def _begin(self, deadline, max_nodes):
+        """
+        Description:
+        Private method that resets the budget and statistics at the start of a search
+        Parameters:
+        deadline - time.perf_counter value at which to stop, or None
+        max_nodes - budget of positions searched, or None
+        """
+        self._deadline = deadline
+        self._max_nodes = max_nodes
+        self._nodes = 0
+        self._next_check = _CHECK_INTERVAL
+        self._completed_depth = 0
+        self._pushed = 0
+        self._qnodes = 0
+        self._expanded = 0
+        self._moves_searched = 0
+        self._cutoffs = 0
+        self._first_cutoffs = 0
+        self._table.new_search()
+        if self._orderer is not None:
+            self._orderer.new_search()
+
+    def _statistics(self, depth_nodes):
+        """
+        Description:
+        Private method that returns the branching factor statistics of the search so far
+        Parameters:
+        depth_nodes - list of the nodes searched to complete each depth
+        Returns:
+        dict with qnodes, branching_factor, moves_per_node and first_move_cutoffs
+        """
+        branching = 0.0
+        if len(depth_nodes) > 1 and depth_nodes[-2] > 0:
+            branching = depth_nodes[-1] / depth_nodes[-2]
+        return {'qnodes': self._qnodes, 'branching_factor': branching,
+                'moves_per_node': self._moves_searched / self._expanded if self._expanded > 0 else 0.0,
+                'first_move_cutoffs': self._first_cutoffs / self._cutoffs if self._cutoffs > 0 else 0.0}
+
+    def _negamax(self, depth, alpha, beta, ply, pv):
+        """
+        Description:
+        Private method that searches the current position with principal variation search: the first move gets the
+        full window, and later moves a null window around alpha, re-searched only if they beat it
+        Parameters:
+        depth - remaining depth in moves
+        alpha - score the team to move is already guaranteed
+        beta - score the opposing team is already guaranteed, as seen by the team to move
+        ply - number of moves from the root
+        pv - list that is filled with the principal variation from this position
+        Returns:
+        score of the position from the point of view of the team to move
+        """
+        game = self._game
+        table = self._table
+        self._nodes += 1
+        if self._nodes >= self._next_check:
+            self._check_budget()
+
+        key = game.get_position_key()
+        hash_move = None
+        entry = table.get_score(key)
+        if entry is not None:
+            hash_move = entry[3]
+            if entry[0] >= depth and ply > 0:
+                score = _score_from_table(entry[1], ply)
+                flag = entry[2]
+                if flag == TranspositionTable.EXACT:
+                    return score
+                if flag == TranspositionTable.LOWER_BOUND and score >= beta:
+                    return score
+                if flag == TranspositionTable.UPPER_BOUND and score <= alpha:
+                    return score
+
+        if depth <= 0:
+            if self._quiescence_enabled:
+                return self._quiescence(alpha, beta, ply)
+            return self._evaluate()
+        if game.is_lost() is True:
+            return -MATE_SCORE + ply
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        first = True
+        if self._orderer is None:
+            moves = self._order_moves(game.legal_moves_sq(), hash_move)
+        else:
+            moves = self._orderer.order(game, game.legal_moves_sq(), hash_move, ply)
+        self._expanded += 1
+        for move in moves:
+            self._moves_searched += 1
+            child_pv = []
+            game.push_move(move[0], move[1])
+            self._pushed += 1
+            if first is True:
+                score = -self._negamax(depth - 1, -beta, -alpha, ply + 1, child_pv)
+                first = False
+            else:
+                score = -self._negamax(depth - 1, -alpha - 1, -alpha, ply + 1, child_pv)
+                if alpha < score < beta:
+                    child_pv = []
+                    score = -self._negamax(depth - 1, -beta, -alpha, ply + 1, child_pv)
+            game.pop_move()
+            self._pushed -= 1
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    pv[:] = [move] + child_pv
+                    if alpha >= beta:
+                        self._cutoffs += 1
+                        if move is moves[0]:
+                            self._first_cutoffs += 1
+                        if self._orderer is not None and game.get_piece_code(move[1]) == 0:
+                            self._orderer.record_cutoff(move, depth, ply)
+                        break
+
+        if best_score <= original_alpha:
+            flag = TranspositionTable.UPPER_BOUND
+        elif best_score >= beta:
+            flag = TranspositionTable.LOWER_BOUND
+        else:
+            flag = TranspositionTable.EXACT
+        table.store_score(key, depth, _score_to_table(best_score, ply), flag, best_move)
+        return best_score
+
+    def _quiescence(self, alpha, beta, ply, quiescence_ply=0):
+        """
+        Description:
+        Private method that searches only captures from the current position, or every move if the team to move is in
+        check, until the position is quiet or MAX_QUIESCENCE_PLY moves have been played. Otherwise the team to move
+        may stand on the static evaluation, unless it has lost
+        Parameters:
+        alpha - score the team to move is already guaranteed
+        beta - score the opposing team is already guaranteed, as seen by the team to move
+        ply - number of moves from the root
+        quiescence_ply - number of moves played by quiescence search to reach the position
+        Returns:
+        score of the position from the point of view of the team to move
+        """
+        game = self._game
+        self._nodes += 1
+        self._qnodes += 1
+        if self._nodes >= self._next_check:
+            self._check_budget()
+        if game.is_in_check(game.get_current_team()) is True:
+            if game.is_lost() is True:
+                return -MATE_SCORE + ply
+            if quiescence_ply >= MAX_QUIESCENCE_PLY:
+                return self._evaluate()
+            moves = game.legal_moves_sq()
+            best_score = -INFINITY
+        else:
+            moves = game.legal_captures_sq()
+            # a team with no legal moves has lost even when not in check; one with a legal capture cannot have
+            if not moves and game.is_lost() is True:
+                return -MATE_SCORE + ply
+            best_score = self._evaluate()
+            if best_score >= beta or quiescence_ply >= MAX_QUIESCENCE_PLY:
+                return best_score
+            alpha = max(alpha, best_score)
+        if self._orderer is not None:
+            moves = self._orderer.order(game, moves, None, ply)
+        else:
+            moves = self._order_moves(moves, None)
+        if moves:
+            self._expanded += 1
+        for move in moves:
+            self._moves_searched += 1
+            game.push_move(move[0], move[1])
+            self._pushed += 1
+            score = -self._quiescence(-beta, -alpha, ply + 1, quiescence_ply + 1)
+            game.pop_move()
+            self._pushed -= 1
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self._cutoffs += 1
+                        if move is moves[0]:
+                            self._first_cutoffs += 1
+                        break
+        return best_score
+
+    def _evaluate(self):
+        """
+        Description:
+        Private method that returns the static evaluation of the current position
+        Returns:
+        score from the point of view of the team to move
+        """
+        game = self._game
+        return game.evaluate() * game.get_side()
+
+    def _order_moves(self, moves, hash_move):
+        """
+        Description:
+        Private method that orders moves so the ones most likely to be best are searched first: the best move
+        stored for the position, then captures, then the rest
+        Parameters:
+        moves - list of (src_sq, dest_sq) tuples
+        hash_move - best move stored in the transposition table, or None
+        Returns:
+        ordered list of moves
+        """
+        game = self._game
+        first = []
+        captures = []
+        quiet = []
+        for move in moves:
+            if move == hash_move:
+                first.append(move)
+            elif game.get_piece_code(move[1]) != 0:
+                captures.append(move)
+            else:
+                quiet.append(move)
+        return first + captures + quiet
+
+    def _check_budget(self):
+        """
+        Description:
+        Private method that stops the search if its time or node budget has run out. The first depth is always
+        allowed to complete, so a search always has a move to return
+        """
+        self._next_check = self._nodes + _CHECK_INTERVAL
+        if self._completed_depth == 0:
+            return
+        if self._max_nodes is not None and self._nodes >= self._max_nodes:
+            raise _SearchStopped()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise _SearchStopped()
+
+    def _move_names(self, move):
+        """
+        Description:
+        Private method that converts a move of board square indices to algebraic notation
+        Parameters:
+        move - (src_sq, dest_sq) tuple
+        Returns:
+        (src, dest) tuple of algebraic notation strings
+        """
+        return square_name(move[0]), square_name(move[1])
+
+
+def compare_ordering(game, depth):
+    """
+    Description:
+    Searches the current position of a game to a fixed depth with and without MoveOrderer, each with a transposition
+    table of its own, to measure the nodes it saves
+    Parameters:
+    game - XiangqiGame object to search
+    depth - search depth in moves
+    Returns:
+    dict with plain and ordered search results
+    """
+    plain = Searcher(game, TranspositionTable(), ordering=False).search(depth)
+    ordered = Searcher(game, TranspositionTable(), ordering=True).search(depth)
+    return {'plain': plain, 'ordered': ordered}
+
+
+def _score_to_table(score, ply):
+    """
+    Description:
+    Converts a score to be stored in the transposition table, making wins and losses relative to the stored position
+    instead of the root
+    Parameters:
+    score - score from the search
+    ply - number of moves from the root to the position
+    Returns:
+    score to store
+    """
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    """
+    Description:
+    Converts a score read from the transposition table back to being relative to the root
+    Parameters:
+    score - stored score
+    ply - number of moves from the root to the position
+    Returns:
+    score for the search
+    """
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def main():
+    """
+    Description:
+    Command line entry point, compares searches of the starting position with and without move ordering
+    """
+    parser = argparse.ArgumentParser(description='Compare XiangqiGame searches with and without move ordering')
+    parser.add_argument('--depth', type=int, default=4, help='search depth (default 4)')
+    args = parser.parse_args()
+    comparison = compare_ordering(XiangqiGame(), args.depth)
+    for name in ('plain', 'ordered'):
+        el = comparison[name]
+        print('%-8s move %s%s score %d nodes %d qnodes %d branching %.2f moves/node %.2f first cutoffs %.2f '
+              'seconds %.3f' % (name, el['move'][0], el['move'][1], el['score'], el['nodes'], el['qnodes'],
+                                el['branching_factor'], el['moves_per_node'], el['first_move_cutoffs'],
+                                el['seconds']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,494 @@
+# Description: asyncio game server hosting many XiangqiGame sessions over a local TCP connection. Clients send one JSON
+#              object per line and receive one JSON object per line. Each request names an op and may carry an id,
+#              which is copied into its response so a client can send many requests without waiting for the answers:
+#
+#              {"op": "new", "fen": optional FEN string, "max_moves": optional} - starts a session
+#              {"op": "move", "session": id, "src": "h3", "dest": "e3"} - makes a move
+#              {"op": "legal", "session": id, "square": optional square} - lists legal moves
+#              {"op": "state", "session": id} - reports game state, team to move, check flags and FEN
+#              {"op": "subscribe", "session": id} / {"op": "unsubscribe", "session": id} - starts or stops
+#              {"event": "move", ...} messages on this connection after every move made in the session
+#              {"op": "close", "session": id} - ends a session
+#
+#              A session also ends when the connection that started it closes, and its game goes back to the pool.
+#
+#              Responses hold "ok": true and the results, or "ok": false and an "error" message. Requests for the
+#              same session are handled in the order they arrive. Move validation and legal move generation run on
+#              an executor, one worker thread by default so games are never used by two threads at once, which keeps
+#              the event loop free to accept connections and answer other sessions while a move is checked.
+#
+#              Run as a script to serve: python XiangqiServer.py [--host H] [--port N], or to measure a running
+#              server: python XiangqiServer.py --load-test [--games N] [--moves N] [--connections N]
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from XiangqiGame import GamePool
+from XiangqiProfile import percentile
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# largest request line accepted, in bytes
+MAX_LINE = 1 << 16
+
+
+class _Session:
+    """Represents one game hosted by a GameServer"""
+    __slots__ = ('game', 'lock', 'subscribers', 'owner')
+
+    def __init__(self, game, owner=None):
+        """
+        Initializes _Session object for game, with a lock that keeps its requests in order, the set of connection
+        writers subscribed to its moves, and owner, the writer of the connection that started it, or None if it was
+        not started over a connection
+        """
+        self.game = game
+        self.lock = asyncio.Lock()
+        self.subscribers = set()
+        self.owner = owner
+
+
+def _game_status(game):
+    """
+    Description:
+    Collects the state of a game reported to clients
+    Parameters:
+    game - XiangqiGame object
+    Returns:
+    dict with state, team, in_check (dict of team to True or False) and fen
+    """
+    return {'state': game.get_game_state(), 'team': game.get_current_team(),
+            'in_check': {'red': game.is_in_check('red'), 'black': game.is_in_check('black')}, 'fen': game.to_fen()}
+
+
+def _move_and_status(game, src, dest):
+    """
+    Description:
+    Makes a move and collects the resulting state, in one call so the whole move runs on the executor
+    Parameters:
+    game - XiangqiGame object
+    src - algebraic notation string for board location of piece to be moved
+    dest - algebraic notation string for board location of destination for piece
+    Returns:
+    tuple of (True if the move was made, dict from _game_status)
+    """
+    return game.make_move(src, dest), _game_status(game)
+
+
+def _legal_list(game, square):
+    """
+    Description:
+    Lists the legal moves of a game, or of one of its pieces
+    Parameters:
+    game - XiangqiGame object
+    square - algebraic notation string for board location of piece, or None for every piece
+    Returns:
+    list of [src, dest] lists of algebraic notation strings
+    """
+    if square is None:
+        return [[src, dest] for src, dest in game.legal_moves()]
+    return [[square, dest] for dest in game.legal_moves_from(square)]
+
+
+class GameServer:
+    """Represents an asyncio server hosting XiangqiGame sessions"""
+    def __init__(self, executor=None):
+        """
+        Initializes GameServer object, running game work on executor, which defaults to a single worker thread
+        """
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        self._executor = executor
+        # games of closed sessions are reset for new ones
+        self._pool = GamePool()
+        self._sessions = {}
+        self._next_id = itertools.count(1)
+        self._server = None
+
+    def __len__(self):
+        """
+        Description:
+        Method returns number of open sessions
+        """
+        return len(self._sessions)
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Description:
+        Starts listening for connections
+        Parameters:
+        host - address to listen on
+        port - port to listen on, 0 for any free port
+        Returns:
+        port being listened on
+        """
+        self._server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_LINE)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """
+        Description:
+        Serves connections until cancelled
+        """
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        """
+        Description:
+        Stops listening and waits for the listening socket to close
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Description:
+        Private method that reads the requests of one connection, handling each as its own task so slow requests do
+        not hold up requests for other sessions
+        Parameters:
+        reader - asyncio StreamReader of the connection
+        writer - asyncio StreamWriter of the connection
+        """
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    break
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for session_id, session in list(self._sessions.items()):
+                session.subscribers.discard(writer)
+                if session.owner is writer:
+                    # sessions end with the connection that started them, so their games are not leaked
+                    async with session.lock:
+                        if self._sessions.get(session_id) is session:
+                            self._end_session(session_id, session)
+            writer.close()
+
+    async def _respond(self, line, writer):
+        """
+        Description:
+        Private method that handles one request line and writes its response
+        Parameters:
+        line - bytes of the request line
+        writer - asyncio StreamWriter to write the response to
+        """
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('request must be a JSON object')
+            request_id = request.get('id')
+            response = await self.handle(request, writer)
+        except ValueError as error:
+            response = {'ok': False, 'error': str(error)}
+        except Exception as error:
+            # any other failure still gets a response, so a client waiting on this id is not left hanging
+            response = {'ok': False, 'error': 'internal error: ' + type(error).__name__}
+        if request_id is not None:
+            response['id'] = request_id
+        await self._send(writer, response)
+
+    async def handle(self, request, writer=None):
+        """
+        Description:
+        Handles one request
+        Parameters:
+        request - dict of the decoded request
+        writer - asyncio StreamWriter of the connection the request came from, needed by subscribe and unsubscribe
+        Returns:
+        dict of the response
+        Raises:
+        ValueError if the request is not valid
+        """
+        op = request.get('op')
+        if op == 'new':
+            return await self._new_session(request, writer)
+        if op not in ('move', 'legal', 'state', 'subscribe', 'unsubscribe', 'close'):
+            raise ValueError('unknown op: ' + str(op))
+        session_id = request.get('session')
+        if not isinstance(session_id, int) or isinstance(session_id, bool):
+            raise ValueError('session must be an integer')
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise ValueError('unknown session: ' + str(session_id))
+        loop = asyncio.get_running_loop()
+        async with session.lock:
+            response = await self._handle_locked(op, request, session_id, session, writer, loop)
+        event = response.pop('event', None)
+        if event is not None:
+            # sent once the lock is released, so a slow subscriber does not hold up the session's next requests. The
+            # event is written to every subscriber before waiting on any of them, so each sees the moves in order
+            line = json.dumps(event).encode() + b'\n'
+            subscribers = [el for el in session.subscribers if not el.is_closing()]
+            for el in subscribers:
+                el.write(line)
+            for el in subscribers:
+                try:
+                    await el.drain()
+                except ConnectionError:
+                    pass
+        return response
+
+    async def _handle_locked(self, op, request, session_id, session, writer, loop):
+        """
+        Description:
+        Private method that handles a request for a session while holding the session's lock
+        Parameters:
+        op - op of the request, other than new
+        request - dict of the decoded request
+        session_id - id of the session
+        session - _Session object
+        writer - asyncio StreamWriter of the connection the request came from, or None
+        loop - running event loop
+        Returns:
+        dict of the response, with the message to send the session's subscribers under event, if any
+        Raises:
+        ValueError if the request is not valid
+        """
+        # the session may have been closed, and its game reused, while this request waited
+        if self._sessions.get(session_id) is not session:
+            raise ValueError('unknown session: ' + str(session_id))
+        if op == 'move':
+            src = request.get('src')
+            dest = request.get('dest')
+            if not isinstance(src, str) or not isinstance(dest, str):
+                raise ValueError('move needs src and dest strings')
+            moved, status = await loop.run_in_executor(self._executor, _move_and_status, session.game, src, dest)
+            if moved is False:
+                return dict(status, ok=False, error='illegal move: ' + src + dest)
+            event = dict(status, event='move', session=session_id, src=src, dest=dest)
+            return dict(status, ok=True, event=event)
+        if op == 'legal':
+            moves = await loop.run_in_executor(self._executor, _legal_list, session.game, request.get('square'))
+            return {'ok': True, 'moves': moves}
+        if op == 'state':
+            status = await loop.run_in_executor(self._executor, _game_status, session.game)
+            return dict(status, ok=True)
+        if op == 'subscribe':
+            if writer is not None:
+                session.subscribers.add(writer)
+            return {'ok': True}
+        if op == 'unsubscribe':
+            session.subscribers.discard(writer)
+            return {'ok': True}
+        self._end_session(session_id, session)
+        return {'ok': True}
+
+    def _end_session(self, session_id, session):
+        """
+        Description:
+        Private method that removes a session and returns its game to the pool. The caller holds the session's lock
+        Parameters:
+        session_id - id of the session
+        session - _Session object
+        """
+        del self._sessions[session_id]
+        self._pool.release(session.game)
+
+    async def _new_session(self, request, writer=None):
+        """
+        Description:
+        Private method that starts a session
+        Parameters:
+        request - dict of the decoded new request
+        writer - asyncio StreamWriter of the connection the request came from, whose closing ends the session, or
+        None
+        Returns:
+        dict of the response, with the id of the session and its state
+        Raises:
+        ValueError if the FEN string or maximum number of moves is not valid
+        """
+        fen = request.get('fen')
+        if fen is not None and not isinstance(fen, str):
+            raise ValueError('fen must be a string')
+        max_moves = request.get('max_moves')
+        if max_moves is not None and (not isinstance(max_moves, int) or isinstance(max_moves, bool) or
+                                      max_moves <= 0):
+            raise ValueError('max_moves must be a positive integer')
+        loop = asyncio.get_running_loop()
+        game = await loop.run_in_executor(self._executor, self._pool.acquire, fen)
+        game.set_max_moves(max_moves)
+        # rejected moves are reported in the response rather than printed
+        game.set_rejected_move_hook(None)
+        session_id = next(self._next_id)
+        self._sessions[session_id] = _Session(game, writer)
+        status = await loop.run_in_executor(self._executor, _game_status, game)
+        return dict(status, ok=True, session=session_id)
+
+    @staticmethod
+    async def _send(writer, message):
+        """
+        Description:
+        Private method that writes one message to a connection, ignoring connections that have closed
+        Parameters:
+        writer - asyncio StreamWriter of the connection
+        message - dict to send as a JSON line
+        """
+        if writer is None or writer.is_closing():
+            return
+        writer.write(json.dumps(message).encode() + b'\n')
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+class _Client:
+    """Represents a load-test connection that sends requests without waiting for earlier answers"""
+    def __init__(self, reader, writer):
+        """
+        Initializes _Client object for an open connection, and starts reading its responses
+        """
+        self._reader = reader
+        self._writer = writer
+        self._pending = {}
+        self._next_id = itertools.count(1)
+        self._reading = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        """
+        Description:
+        Private method that passes each response to the request waiting for it
+        """
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self._pending.pop(response.get('id'), None)
+            if future is not None and not future.done():
+                future.set_result(response)
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError('server closed the connection'))
+
+    async def request(self, message):
+        """
+        Description:
+        Sends a request and waits for its response
+        Parameters:
+        message - dict of the request, without an id
+        Returns:
+        dict of the response
+        """
+        request_id = next(self._next_id)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(json.dumps(dict(message, id=request_id)).encode() + b'\n')
+        await self._writer.drain()
+        return await future
+
+    async def close(self):
+        """
+        Description:
+        Closes the connection
+        """
+        self._writer.close()
+        self._reading.cancel()
+
+
+async def load_test(host=DEFAULT_HOST, port=DEFAULT_PORT, games=10000, moves=20, connections=100, seed=0):
+    """
+    Description:
+    Plays many games at once against a running server, each making random legal moves, and measures how long each
+    move takes to be answered
+    Parameters:
+    host - address of the server
+    port - port of the server
+    games - number of games played at the same time
+    moves - number of moves each game makes, fewer if it finishes first
+    connections - number of connections the games are spread over
+    seed - seed of the random move choices
+    Returns:
+    dict with games, moves (moves made), seconds, moves_per_second, and p50 and p99 move latency in milliseconds
+    """
+    clients = []
+    for i in range(min(connections, games)):
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+        clients.append(_Client(reader, writer))
+    latencies = []
+    rng = random.Random(seed)
+
+    async def play(client, choose):
+        session = (await client.request({'op': 'new'}))['session']
+        for i in range(moves):
+            legal = (await client.request({'op': 'legal', 'session': session}))['moves']
+            if not legal:
+                break
+            src, dest = choose(legal)
+            sent = time.perf_counter()
+            response = await client.request({'op': 'move', 'session': session, 'src': src, 'dest': dest})
+            latencies.append(time.perf_counter() - sent)
+            if response['state'] != 'UNFINISHED':
+                break
+        await client.request({'op': 'close', 'session': session})
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*[play(clients[i % len(clients)], random.Random(rng.random()).choice)
+                               for i in range(games)])
+    finally:
+        for client in clients:
+            await client.close()
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {'games': games, 'moves': len(latencies), 'seconds': seconds,
+            'moves_per_second': len(latencies) / seconds if seconds > 0 else 0.0,
+            'p50_ms': percentile(latencies, 0.5) * 1000, 'p99_ms': percentile(latencies, 0.99) * 1000}
+
+
+async def _serve(host, port):
+    """
+    Description:
+    Runs a GameServer until cancelled
+    """
+    server = GameServer()
+    port = await server.start(host, port)
+    print('serving on %s:%d' % (host, port))
+    await server.serve_forever()
+
+
+def main():
+    """
+    Description:
+    Command line entry point, serves games or load tests a running server
+    """
+    parser = argparse.ArgumentParser(description='Host XiangqiGame sessions over TCP, or load test a server')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='address (default %s)' % DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port (default %d)' % DEFAULT_PORT)
+    parser.add_argument('--load-test', action='store_true', help='load test a running server instead of serving')
+    parser.add_argument('--games', type=int, default=10000, help='concurrent games in the load test (default 10000)')
+    parser.add_argument('--moves', type=int, default=20, help='moves per game in the load test (default 20)')
+    parser.add_argument('--connections', type=int, default=100, help='load test connections (default 100)')
+    args = parser.parse_args()
+    if not args.load_test:
+        try:
+            asyncio.run(_serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return
+    result = asyncio.run(load_test(args.host, args.port, args.games, args.moves, args.connections))
+    print('games %d moves %d seconds %.3f moves/sec %.0f p50 %.2f ms p99 %.2f ms' % (
+        result['games'], result['moves'], result['seconds'], result['moves_per_second'], result['p50_ms'],
+        result['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
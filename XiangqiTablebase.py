@@ -0,0 +1,550 @@
+# Description: Endgame tablebases for XiangqiGame. A tablebase holds the result of every position with a given set of
+#              pieces, its material signature, written like KR-KAA (red pieces, then black pieces, with the FEN letters
+#              K general, A advisor, B elephant, N horse, R chariot, C cannon, P soldier). generate_tablebase
+#              enumerates the positions of a signature, generates their moves with the Piece classes and the check
+#              rules of XiangqiGame, and solves them by retrograde analysis: positions where the team to move has lost
+#              are found first, then every position one move before them, and so on. Captures lead to positions of a
+#              smaller signature, whose tablebases are generated first. Move generation is spread over worker
+#              processes; the retrograde analysis itself runs in one.
+#
+#              Results are distances in moves until the losing team has lost (XiangqiGame.is_lost is True), counted by
+#              both teams together and assuming the winning team wins as quickly and the losing team loses as slowly
+#              as it can. Positions neither team can force a win from are draws. Repetition rules and move limits are
+#              not taken into account.
+#
+#              File format: a 32-byte header of the magic bytes TABLEBASE_MAGIC, the signature as 16 ASCII bytes
+#              padded with NUL bytes and the number of positions as a little-endian unsigned 64-bit integer, followed
+#              by one little-endian unsigned 16-bit value per position: 0 for a draw, 0xFFFF for an index that is not a
+#              reachable position, otherwise the distance plus 1, so odd values are losses and even values wins for
+#              the team to move. Position indices are described in _Layout.
+#
+#              Run as a script: python XiangqiTablebase.py SIGNATURE [--directory DIR] [--workers N]
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from XiangqiGame import GENERAL, SOLDIER, RED, BLACK, _FEN_CODES, _FEN_LETTERS, _PIECE_CLASSES, _START_SQUARES
+
+TABLEBASE_MAGIC = b'XQTB\x00\x00\x00\x01'
+_HEADER = struct.Struct('<8s16sQ')
+_VALUE = struct.Struct('<H')
+# stored values of positions that are drawn and indices that are not positions
+_DRAW = 0
+_INVALID = 0xFFFF
+# number of positions whose moves are generated by each worker task
+_TASK_SIZE = 1 << 14
+# most pieces of each type a team can have
+_MAX_PIECES = (0, 1, 2, 2, 2, 2, 2, 5)
+
+
+def parse_signature(signature):
+    """
+    Description:
+    Parses a material signature such as KR-KAA
+    Parameters:
+    signature - string of red piece letters, a dash and black piece letters, each including one K
+    Returns:
+    tuple of signed piece codes, red pieces then black pieces, each in order of piece type code
+    Raises:
+    ValueError if signature is not valid
+    """
+    halves = signature.upper().split('-')
+    if len(halves) != 2:
+        raise ValueError('signature must be red pieces, a dash and black pieces: ' + repr(signature))
+    codes = []
+    for side, half in zip((RED, BLACK), halves):
+        types = []
+        for letter in half:
+            if letter not in _FEN_CODES:
+                raise ValueError('invalid piece ' + repr(letter) + ' in signature ' + repr(signature))
+            types.append(_FEN_CODES[letter])
+        for piece_type in range(GENERAL, SOLDIER + 1):
+            if types.count(piece_type) > _MAX_PIECES[piece_type]:
+                raise ValueError('too many ' + _FEN_LETTERS[piece_type] + ' in signature ' + repr(signature))
+        if GENERAL not in types:
+            raise ValueError('each team needs a general: ' + repr(signature))
+        codes.extend(piece_type * side for piece_type in sorted(types))
+    return tuple(codes)
+
+
+def signature_name(codes):
+    """
+    Description:
+    Returns the material signature of a tuple of signed piece codes, as used in tablebase file names
+    """
+    return (''.join(_FEN_LETTERS[el] for el in codes if el > 0) + '-' +
+            ''.join(_FEN_LETTERS[-el] for el in codes if el < 0))
+
+
+def _piece_squares(code):
+    """
+    Description:
+    Finds the squares a piece can reach from the squares it starts on, by the moves of its Piece class on an
+    otherwise empty board
+    Parameters:
+    code - signed piece code
+    Returns:
+    sorted tuple of board square indices
+    """
+    found = set(sq for sq in range(90) if _START_SQUARES[sq] == code)
+    frontier = list(found)
+    board = [0] * 90
+    while frontier:
+        sq = frontier.pop()
+        board[sq] = code
+        for el in _PIECE_CLASSES[abs(code)].moves_from(sq, board):
+            if el not in found:
+                found.add(el)
+                frontier.append(el)
+        board[sq] = 0
+    return tuple(sorted(found))
+
+
+class _Layout:
+    """
+    Represents the position indices of a material signature. Each piece has a slot with the list of squares it can
+    reach, and a position index is the team to move (0 red, 1 black) plus twice the square of each slot in mixed
+    radix. Two pieces of the same type are only a position with the lower slot on the lower square, so every
+    position has one index
+    """
+    __slots__ = ('codes', 'squares', 'lookup', 'multipliers', 'count')
+
+    def __init__(self, codes):
+        """
+        Initializes _Layout object for a tuple of signed piece codes from parse_signature
+        """
+        self.codes = codes
+        self.squares = [_piece_squares(code) for code in codes]
+        self.lookup = [{sq: i for i, sq in enumerate(el)} for el in self.squares]
+        self.multipliers = []
+        multiplier = 2
+        for el in self.squares:
+            self.multipliers.append(multiplier)
+            multiplier *= len(el)
+        self.count = multiplier
+
+    def decode(self, index):
+        """
+        Description:
+        Method sets up the position of an index
+        Parameters:
+        index - position index
+        Returns:
+        tuple of (list of 90 signed piece codes, sign of team to move), or None if index is not a position
+        """
+        board = [0] * 90
+        side = RED if index % 2 == 0 else BLACK
+        index //= 2
+        previous = -1
+        for i in range(len(self.codes)):
+            squares = self.squares[i]
+            index, position = divmod(index, len(squares))
+            sq = squares[position]
+            if board[sq] != 0:
+                return None
+            if i > 0 and self.codes[i] == self.codes[i - 1] and sq < previous:
+                return None
+            board[sq] = self.codes[i]
+            previous = sq
+        return board, side
+
+    def encode(self, pieces, side):
+        """
+        Description:
+        Method returns the index of a position
+        Parameters:
+        pieces - list of (square index, signed piece code) pairs of every piece, in order of square index
+        side - sign of team to move
+        Returns:
+        position index, or None if a piece is on a square its slot does not allow
+        """
+        index = 0 if side == RED else 1
+        slot = {}
+        for sq, code in pieces:
+            # pieces of the same type fill their slots in order of square
+            i = self.codes.index(code) + slot.get(code, 0)
+            slot[code] = slot.get(code, 0) + 1
+            position = self.lookup[i].get(sq)
+            if position is None:
+                return None
+            index += position * self.multipliers[i]
+        return index
+
+
+# layouts built so far, by tuple of piece codes
+_LAYOUTS = {}
+
+
+def _layout(codes):
+    """
+    Description:
+    Returns the _Layout of a tuple of piece codes, building it the first time it is needed
+    """
+    layout = _LAYOUTS.get(codes)
+    if layout is None:
+        layout = _Layout(codes)
+        _LAYOUTS[codes] = layout
+    return layout
+
+
+def _occupancy(pieces):
+    """
+    Description:
+    Builds the rank and file occupancy masks of a board from its occupied squares, for the moves_from methods of the
+    Piece classes
+    """
+    ranks = [0] * 10
+    files = [0] * 9
+    for sq in pieces:
+        row, col = divmod(sq, 9)
+        ranks[row] |= 1 << col
+        files[col] |= 1 << row
+    return ranks, files
+
+
+def _attacked(board, pieces, sq, side, occupancy):
+    """
+    Description:
+    Determines if any opposing piece can move onto a square
+    Parameters:
+    board - list of 90 signed piece codes
+    pieces - list of occupied square indices
+    sq - board square index
+    side - sign of team the square belongs to
+    occupancy - rank and file occupancy masks of board
+    Returns:
+    True or False
+    """
+    for el in pieces:
+        code = board[el]
+        if code * side < 0 and sq in _PIECE_CLASSES[-code * side].moves_from(el, board, occupancy):
+            return True
+    return False
+
+
+class Tablebases:
+    """Represents the tablebase files of a directory, each opened and memory-mapped when first probed"""
+    def __init__(self, directory='.'):
+        """
+        Initializes Tablebases object for the tablebase files in directory
+        """
+        self._directory = directory
+        self._files = {}
+
+    def path(self, codes):
+        """
+        Description:
+        Method returns the path of the tablebase file of a tuple of piece codes
+        """
+        return os.path.join(self._directory, signature_name(codes) + '.xqtb')
+
+    def close(self):
+        """
+        Description:
+        Method unmaps every open tablebase file
+        """
+        for el in self._files.values():
+            if el is not None:
+                el.close()
+        self._files = {}
+
+    def _map(self, codes):
+        """
+        Description:
+        Private method that returns the memory map of the tablebase file of a tuple of piece codes
+        Returns:
+        mmap object, or None if there is no such file
+        """
+        if codes in self._files:
+            return self._files[codes]
+        path = self.path(codes)
+        table_map = None
+        if os.path.exists(path):
+            with open(path, 'rb') as table_file:
+                table_map = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, name, count = _HEADER.unpack_from(table_map)
+            if (magic != TABLEBASE_MAGIC or name.rstrip(b'\x00').decode() != signature_name(codes) or
+                    len(table_map) < _HEADER.size + count * _VALUE.size):
+                table_map.close()
+                raise ValueError('not a valid tablebase file: ' + repr(path))
+        self._files[codes] = table_map
+        return table_map
+
+    def _value(self, board, side):
+        """
+        Description:
+        Private method that returns the stored value of a position
+        Parameters:
+        board - list of 90 signed piece codes
+        side - sign of team to move
+        Returns:
+        stored value, or None if there is no tablebase for the position's pieces
+        """
+        pieces = [(sq, board[sq]) for sq in range(90) if board[sq] != 0]
+        codes = tuple(sorted((el[1] for el in pieces), key=lambda el: (el < 0, abs(el))))
+        table_map = self._map(codes)
+        if table_map is None:
+            return None
+        index = _layout(codes).encode(pieces, side)
+        if index is None:
+            return _INVALID
+        return _VALUE.unpack_from(table_map, _HEADER.size + index * _VALUE.size)[0]
+
+    def probe(self, board, side):
+        """
+        Description:
+        Method looks up the result of a position
+        Parameters:
+        board - list of 90 signed piece codes
+        side - sign of team to move, RED or BLACK
+        Returns:
+        tuple of ('win', 'loss' or 'draw' for the team to move, number of moves until the losing team has lost or
+        None for a draw), or None if there is no tablebase for the position's pieces or the position can not be
+        reached, such as when the team not to move is in check
+        """
+        value = self._value(board, side)
+        if value is None or value == _INVALID:
+            return None
+        if value == _DRAW:
+            return 'draw', None
+        plies = value - 1
+        return ('win' if plies % 2 == 1 else 'loss'), plies
+
+
+def _generate_moves(task):
+    """
+    Description:
+    Generates the legal moves of a range of positions in a worker process
+    Parameters:
+    task - tuple of (piece codes, tablebase directory, first index, index after the last)
+    Returns:
+    tuple of arrays for each position of the range: status (0 position, 1 not a position, 2 team to move has lost),
+    offsets into children (one more than the number of positions), children (indices of the positions reached by
+    moves that capture nothing), nearest loss reached by a capture (-1 if none), farthest win reached by a capture
+    (-1 if none) and whether a capture reaches a draw
+    """
+    codes, directory, start, stop = task
+    layout = _layout(codes)
+    tablebases = Tablebases(directory)
+    status = bytearray(stop - start)
+    offsets = array('l', [0])
+    children = array('l')
+    capture_loss = array('l', [-1]) * (stop - start)
+    capture_win = array('l', [-1]) * (stop - start)
+    capture_draw = bytearray(stop - start)
+    for index in range(start, stop):
+        i = index - start
+        position = layout.decode(index)
+        if position is None:
+            status[i] = 1
+            offsets.append(len(children))
+            continue
+        board, side = position
+        pieces = [sq for sq in range(90) if board[sq] != 0]
+        occupancy = _occupancy(pieces)
+        general_sq = board.index(GENERAL * side)
+        # a position where the team that just moved left its general attacked can not be reached
+        if _attacked(board, pieces, board.index(-GENERAL * side), -side, occupancy):
+            status[i] = 1
+            offsets.append(len(children))
+            continue
+        in_check = _attacked(board, pieces, general_sq, side, occupancy)
+        legal_count = 0
+        general_moves = 0
+        for src_sq in pieces:
+            src_code = board[src_sq]
+            if src_code * side <= 0:
+                continue
+            for dest_sq in _PIECE_CLASSES[abs(src_code)].moves_from(src_sq, board, occupancy):
+                dest_code = board[dest_sq]
+                board[src_sq] = 0
+                board[dest_sq] = src_code
+                after = [el for el in pieces if el != src_sq and el != dest_sq] + [dest_sq]
+                after.sort()
+                after_occupancy = _occupancy(after)
+                target = dest_sq if src_code == GENERAL * side else general_sq
+                if not _attacked(board, after, target, side, after_occupancy):
+                    legal_count += 1
+                    if src_sq == general_sq:
+                        general_moves += 1
+                    if dest_code == 0:
+                        children.append(layout.encode([(el, board[el]) for el in after], -side))
+                    else:
+                        value = tablebases._value(board, -side)
+                        if value == _DRAW:
+                            capture_draw[i] = 1
+                        elif (value - 1) % 2 == 0:
+                            if capture_loss[i] < 0 or value - 1 < capture_loss[i]:
+                                capture_loss[i] = value - 1
+                        else:
+                            capture_win[i] = max(capture_win[i], value - 1)
+                board[dest_sq] = dest_code
+                board[src_sq] = src_code
+        # lost with no legal moves, or in check without a legal move of the general, as XiangqiGame.is_lost
+        if legal_count == 0 or (in_check and general_moves == 0):
+            status[i] = 2
+        offsets.append(len(children))
+    tablebases.close()
+    return status, offsets, children, capture_loss, capture_win, capture_draw
+
+
+def _solve(count, results):
+    """
+    Description:
+    Solves a tablebase by retrograde analysis from the moves generated by _generate_moves. Positions are resolved in
+    order of distance: a position is won one move after the nearest loss it can move to, and lost one move after the
+    farthest win once every move it has reaches a win
+    Parameters:
+    count - number of position indices
+    results - list of the results of _generate_moves, in order of index
+    Returns:
+    array of the stored value of each position index
+    """
+    status = bytearray()
+    offsets = array('l', [0])
+    children = array('l')
+    capture_loss = array('l')
+    capture_win = array('l')
+    capture_draw = bytearray()
+    for part_status, part_offsets, part_children, part_loss, part_win, part_draw in results:
+        base = len(children)
+        offsets.extend(el + base for el in part_offsets[1:])
+        children.extend(part_children)
+        status += part_status
+        capture_loss.extend(part_loss)
+        capture_win.extend(part_win)
+        capture_draw += part_draw
+
+    # moves that capture nothing, reversed: the positions that can move to each position
+    remaining = array('l', (offsets[i + 1] - offsets[i] for i in range(count)))
+    parent_offsets = array('l', [0]) * (count + 1)
+    for el in children:
+        parent_offsets[el + 1] += 1
+    for i in range(count):
+        parent_offsets[i + 1] += parent_offsets[i]
+    parents = array('l', [0]) * len(children)
+    fill = array('l', parent_offsets)
+    for index in range(count):
+        for el in children[offsets[index]:offsets[index + 1]]:
+            parents[fill[el]] = index
+            fill[el] += 1
+
+    buckets = {}
+    for index in range(count):
+        if status[index] == 1:
+            continue
+        if status[index] == 2:
+            buckets.setdefault(0, []).append(index)
+        elif capture_loss[index] >= 0:
+            buckets.setdefault(capture_loss[index] + 1, []).append(index)
+        elif remaining[index] == 0 and not capture_draw[index]:
+            # every move is a capture that reaches a win
+            buckets.setdefault(capture_win[index] + 1, []).append(index)
+
+    plies = array('l', [-1]) * count
+    distance = 0
+    while buckets:
+        for index in buckets.pop(distance, ()):
+            if plies[index] >= 0:
+                continue
+            plies[index] = distance
+            for parent in parents[parent_offsets[index]:parent_offsets[index + 1]]:
+                if plies[parent] >= 0:
+                    continue
+                if distance % 2 == 0:
+                    # parent can move to a loss of the opposing team
+                    buckets.setdefault(distance + 1, []).append(parent)
+                else:
+                    remaining[parent] -= 1
+                    if remaining[parent] == 0 and not capture_draw[parent] and capture_loss[parent] < 0:
+                        buckets.setdefault(max(distance, capture_win[parent]) + 1, []).append(parent)
+        distance += 1
+
+    values = array('H', [_DRAW]) * count
+    for index in range(count):
+        if status[index] == 1:
+            values[index] = _INVALID
+        elif plies[index] >= 0:
+            values[index] = min(plies[index] + 1, _INVALID - 1)
+    return values
+
+
+def generate_tablebase(signature, directory='.', workers=None, report=print):
+    """
+    Description:
+    Generates the tablebase of a material signature, and first those of every signature its captures lead to that
+    are not in directory yet
+    Parameters:
+    signature - material signature string, such as KR-KAA
+    directory - directory to write the tablebase files to
+    workers - number of worker processes, defaults to the number of CPUs
+    report - function called with one line of text per tablebase generated, or None for no output
+    Returns:
+    list of dicts with signature, positions (reachable positions), wins, draws, losses, seconds and
+    positions_per_second of each tablebase generated
+    Raises:
+    ValueError if signature is not valid
+    """
+    codes = parse_signature(signature)
+    generated = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        _generate(codes, directory, pool, report, generated)
+    return generated
+
+
+def _generate(codes, directory, pool, report, generated):
+    """
+    Description:
+    Private method that generates the tablebase of a tuple of piece codes after those its captures lead to
+    """
+    path = Tablebases(directory).path(codes)
+    if os.path.exists(path):
+        return
+    for i in range(len(codes)):
+        if abs(codes[i]) != GENERAL and (i == 0 or codes[i] != codes[i - 1]):
+            _generate(codes[:i] + codes[i + 1:], directory, pool, report, generated)
+    start = time.perf_counter()
+    count = _layout(codes).count
+    tasks = [(codes, directory, el, min(el + _TASK_SIZE, count)) for el in range(0, count, _TASK_SIZE)]
+    values = _solve(count, list(pool.map(_generate_moves, tasks)))
+    with open(path + '.tmp', 'wb') as table_file:
+        table_file.write(_HEADER.pack(TABLEBASE_MAGIC, signature_name(codes).encode(), count))
+        if sys.byteorder == 'big':
+            values.byteswap()
+        values.tofile(table_file)
+    os.replace(path + '.tmp', path)
+    seconds = time.perf_counter() - start
+    positions = sum(1 for el in values if el != _INVALID)
+    result = {'signature': signature_name(codes), 'positions': positions,
+              'wins': sum(1 for el in values if el != _INVALID and el != _DRAW and el % 2 == 0),
+              'draws': sum(1 for el in values if el == _DRAW),
+              'losses': sum(1 for el in values if el != _INVALID and el % 2 == 1),
+              'seconds': seconds, 'positions_per_second': positions / seconds if seconds > 0 else 0.0}
+    generated.append(result)
+    if report is not None:
+        report('%-10s positions %9d wins %9d draws %9d losses %9d seconds %8.2f positions/sec %.0f' % (
+            result['signature'], result['positions'], result['wins'], result['draws'], result['losses'],
+            result['seconds'], result['positions_per_second']))
+
+
+def main():
+    """
+    Description:
+    Command line entry point, generates the tablebase of a material signature
+    """
+    parser = argparse.ArgumentParser(description='Generate XiangqiGame endgame tablebases')
+    parser.add_argument('signature', help='material signature, such as KR-KAA')
+    parser.add_argument('--directory', default='.', help='directory to write tablebases to (default .)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+    generate_tablebase(args.signature, args.directory, args.workers)
+
+
+if __name__ == '__main__':
+    main()